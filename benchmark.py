@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Retrieval benchmark suite.
+
+Generates synthetic corpora of 10^2 to 10^6 chunks with labeled queries and
+measures, for every retrieval backend:
+
+- index build time, cache load time, index size on disk and process memory
+- query latency percentiles (p50 / p90 / p99)
+- recall@k against the labels, and overlap@k with the exhaustive ranking
+
+Every document carries two label terms that only a handful of documents
+share; each query is the labels of one target document plus one of its
+ordinary words, so the target is the document the query should retrieve.
+
+Results are written as JSON named after the current commit, so runs can be
+compared across commits:
+
+    python benchmark.py                          # 10^2 .. 10^5 chunks
+    python benchmark.py --sizes 1000 1000000     # choose corpus sizes
+    python benchmark.py --routing 5              # also two-stage search over 5 documents per query
+    python benchmark.py --routing 5 --clusters 0 # ... over 5 of about sqrt(N) k-means clusters
+    python benchmark.py --compare benchmark_results/<commit>.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from clusters import default_num_clusters
+from query_cache import QueryCache
+from retriever import SimpleRetriever
+
+DEFAULT_SIZES = [100, 1_000, 10_000, 100_000]
+WORDS_PER_CHUNK = 40
+# Consecutive chunks cut from the same synthetic document, the groups queries are routed to (see summaries)
+CHUNKS_PER_DOCUMENT = 20
+VOCABULARY_SIZE = 30_000
+
+
+def _word(i: int, prefix: str) -> str:
+    return f"{prefix}{np.base_repr(i, 36).lower()}"
+
+
+def synthetic_corpus(num_chunks: int, num_queries: int, seed: int = 0) -> Tuple[List[Dict[str, str]], List[Tuple[str, str]]]:
+    """
+    Build documents with Zipf-distributed words and labeled known-item queries.
+
+    Returns:
+        Tuple[List[Dict[str, str]], List[Tuple[str, str]]]: Documents, and (query, target file name) pairs
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = [_word(i, "w") for i in range(VOCABULARY_SIZE)]
+    probabilities = 1.0 / np.arange(1, VOCABULARY_SIZE + 1)
+    probabilities /= probabilities.sum()
+
+    words = rng.choice(VOCABULARY_SIZE, size=(num_chunks, WORDS_PER_CHUNK), p=probabilities)
+    # About five documents share each label term
+    labels = rng.integers(0, max(1, num_chunks // 5), size=(num_chunks, 2))
+
+    documents = []
+    for i in range(num_chunks):
+        text = " ".join([vocabulary[w] for w in words[i]] + [_word(l, "l") for l in labels[i]])
+        documents.append({
+            "file_name": f"chunk{i}.txt",
+            "file_path": f"synthetic/chunk{i}.txt",
+            "file_type": "txt",
+            "parent": f"synthetic/document{i // CHUNKS_PER_DOCUMENT}",
+            "content": text,
+            "fingerprint": f"synthetic-{seed}-{i}",
+        })
+
+    queries = []
+    for target in rng.choice(num_chunks, size=num_queries):
+        word = vocabulary[words[target][rng.integers(WORDS_PER_CHUNK)]]
+        query = f"{_word(labels[target][0], 'l')} {_word(labels[target][1], 'l')} {word}"
+        queries.append((query, documents[target]["file_name"]))
+    return documents, queries
+
+
+def rss_mb() -> float:
+    """Resident memory of this process in MB (peak resident memory where the current value is unavailable)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        return 0.0
+
+
+def directory_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / 1024 / 1024
+
+
+def backends(retriever: SimpleRetriever, k: int, routing: int = 0) -> Dict[str, Callable[[str], List[str]]]:
+    """Retrieval backends under test; each maps a query to a ranked list of file names."""
+    def names(keys):
+        return [retriever._documents_by_key[key]['file_name'] for key in keys]
+
+    selected = {
+        "index": lambda query: names(retriever.index.top_k([query], k, early_termination=False)[0]),
+        "index-maxscore": lambda query: names(retriever.index.top_k([query], k, early_termination=True)[0]),
+        "retriever": lambda query: [hit['file_name'] for hit in retriever.retrieve_relevant_chunks(query, k)],
+    }
+    if routing:
+        def routed(query):
+            retriever.routing = routing
+            try:
+                return [hit['file_name'] for hit in retriever.retrieve_relevant_chunks(query, k)]
+            finally:
+                retriever.routing = 0
+
+        selected["index-routed"] = lambda query: names(retriever.index.top_k(
+            [query], k, row_filter=retriever.summaries.route_filter(retriever.index, [query], routing))[0])
+        selected["routed"] = routed
+    if retriever.shards is not None:
+        selected["sharded"] = lambda query: names(retriever.shards.top_k([query], k, retriever.index.version)[0])
+    return selected
+
+
+def run_size(num_chunks: int, num_queries: int, k: int, shards: int, routing: int = 0,
+             clusters: Optional[int] = None) -> Dict:
+    """Benchmark every backend on one corpus size."""
+    print(f"\n📚 {num_chunks:,} chunks")
+    documents, queries = synthetic_corpus(num_chunks, num_queries)
+    result = {"num_chunks": num_chunks, "num_queries": len(queries), "backends": {}}
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        gc.collect()
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        retriever = SimpleRetriever(documents, cache_dir=cache_dir, query_cache=QueryCache(max_entries=0), num_shards=0)
+        retriever.index.wait_for_merges()
+        result["build_seconds"] = time.perf_counter() - start
+        result["build_rss_mb"] = rss_mb() - rss_before
+        result["index_disk_mb"] = directory_mb(retriever.index_path)
+        del retriever
+        gc.collect()
+
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        retriever = SimpleRetriever(documents, cache_dir=cache_dir, query_cache=QueryCache(max_entries=0),
+                                    num_shards=shards, routing=0)
+        result["load_seconds"] = time.perf_counter() - start
+        result["load_rss_mb"] = rss_mb() - rss_before
+        result["memory_usage_mb"] = {part: nbytes / 1024 / 1024 for part, nbytes in retriever.memory_usage().items()}
+        if routing and clusters is not None:
+            retriever.clusters = clusters or default_num_clusters(num_chunks)
+            start = time.perf_counter()
+            retriever.summaries
+            result["clusters"] = retriever.clusters
+            result["cluster_seconds"] = time.perf_counter() - start
+
+        try:
+            exhaustive = {query: retriever.index.top_k([query], k, early_termination=False)[0] for query, _ in queries}
+            for name, search in backends(retriever, k, routing).items():
+                search(queries[0][0])  # Warm up
+                latencies, found, overlap = [], 0, 0.0
+                for query, target in queries:
+                    start = time.perf_counter()
+                    ranked = search(query)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    found += target in ranked[:k]
+                    expected = {retriever._documents_by_key[key]['file_name'] for key in exhaustive[query]}
+                    overlap += len(expected & set(ranked[:k])) / len(expected) if expected else 1.0
+                result["backends"][name] = {
+                    "p50_ms": float(np.percentile(latencies, 50)),
+                    "p90_ms": float(np.percentile(latencies, 90)),
+                    "p99_ms": float(np.percentile(latencies, 99)),
+                    "mean_ms": float(np.mean(latencies)),
+                    f"recall_at_{k}": found / len(queries),
+                    f"overlap_at_{k}": overlap / len(queries),
+                }
+                stats = result["backends"][name]
+                print(f"   {name:<15} p50 {stats['p50_ms']:8.2f} ms   p99 {stats['p99_ms']:8.2f} ms   "
+                      f"recall@{k} {stats[f'recall_at_{k}']:.3f}")
+        finally:
+            retriever.close()
+
+    print(f"   build {result['build_seconds']:.2f} s, load {result['load_seconds']:.2f} s, "
+          f"index {result['index_disk_mb']:.1f} MB on disk")
+    print("   memory " + ", ".join(f"{part} {mb:.1f} MB" for part, mb in result["memory_usage_mb"].items()))
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: Dict, current: Dict, k: int):
+    """Print latency and recall changes of the current run against a baseline run."""
+    print(f"\n📊 Compared with {baseline.get('commit')} ({baseline.get('timestamp')})")
+    previous = {run["num_chunks"]: run for run in baseline["runs"]}
+    for run in current["runs"]:
+        old_run = previous.get(run["num_chunks"])
+        if old_run is None:
+            continue
+        for name, stats in run["backends"].items():
+            old = old_run["backends"].get(name)
+            if old is None:
+                continue
+            change = (stats["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100 if old["p50_ms"] else 0.0
+            recall_key = f"recall_at_{k}"
+            print(f"   {run['num_chunks']:>9,} {name:<15} p50 {old['p50_ms']:8.2f} → {stats['p50_ms']:8.2f} ms "
+                  f"({change:+.0f}%)   recall {old.get(recall_key, 0):.3f} → {stats[recall_key]:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark document retrieval on synthetic corpora")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Corpus sizes in chunks")
+    parser.add_argument("--queries", type=int, default=200, help="Labeled queries per corpus")
+    parser.add_argument("--k", type=int, default=10, help="Results per query")
+    parser.add_argument("--shards", type=int, default=0, help="Also benchmark sharded search with this many workers")
+    parser.add_argument("--routing", type=int, default=0,
+                        help="Also benchmark two-stage search routed to this many documents per query")
+    parser.add_argument("--clusters", type=int,
+                        help="Route over this many k-means clusters instead of the parent documents "
+                             "(0: about the square root of the corpus size)")
+    parser.add_argument("--output", help="Results file (default: benchmark_results/<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "k": args.k,
+        "runs": [run_size(size, args.queries, args.k, args.shards, args.routing, args.clusters) for size in args.sizes],
+    }
+
+    output = args.output or os.path.join("benchmark_results", f"{results['commit'] or 'unversioned'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), results, args.k)
+
+
+if __name__ == "__main__":
+    main()
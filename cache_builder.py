@@ -1,27 +1,36 @@
 #!/usr/bin/env python3
 """
 Cache Builder for OCR Results
-Pre-processes documents and caches OCR results for instant loading
+Pre-processes documents, caches OCR results and builds the search index for instant loading
 """
 
 import os
-from document_loader import load_documents_from_folder
+from document_loader import iter_documents_from_folder
+from retriever import index_documents
 
 def build_cache():
     """Pre-process all documents and build cache"""
     print("🚀 Building document cache...")
     print("=" * 50)
-    
-    # This will process all documents and save OCR results to cache
-    documents = load_documents_from_folder()
-    
+
+    # This will process all documents and save OCR results to cache; documents are
+    # streamed into the search index one at a time, so the folder may be larger than RAM
+    sizes = []
+
+    def documents():
+        for doc in iter_documents_from_folder():
+            sizes.append((doc['file_name'], len(doc['content'])))
+            yield doc
+
+    indexed = index_documents(documents())
+
     print("\n" + "=" * 50)
     print("✅ Cache building complete!")
-    print(f"📚 Cached {len(documents)} documents")
-    
-    for doc in documents:
-        print(f"   📄 {doc['file_name']}: {len(doc['content']):,} characters")
-    
+    print(f"📚 Cached {len(sizes)} documents ({indexed} newly indexed)")
+
+    for file_name, size in sizes:
+        print(f"   📄 {file_name}: {size:,} characters")
+
     print("\n🚀 Your Streamlit app will now load instantly!")
     print("💡 Run: streamlit run streamlit_app.py")
 
@@ -0,0 +1,242 @@
+"""
+Cache directory management.
+
+Keeps cache/ within a byte budget by evicting the least recently used
+entries, writes files atomically (tmp + rename) so a crash never leaves a
+half-written file behind, and provides a cross-process file lock so two
+app processes don't build the same thing at the same time.
+"""
+
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TMP_MARKER = ".tmp-"
+LOCK_SUFFIX = ".lock"
+
+
+def _tmp_path(path: str) -> str:
+    return f"{path}{TMP_MARKER}{os.getpid()}-{threading.get_ident()}"
+
+
+@contextmanager
+def atomic_file(path: str, mode: str = 'wb', **kwargs):
+    """
+    Open a file for writing that only appears at `path` once fully written.
+
+    Args:
+        path (str): Final location of the file
+        mode (str): File mode, 'wb' or 'w'
+        **kwargs: Passed on to open(), e.g. encoding
+    """
+    tmp_path = _tmp_path(path)
+    try:
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def atomic_directory(path: str):
+    """
+    Yield a temporary directory that is renamed to `path` once filled in.
+
+    Any existing directory at `path` is replaced.
+    """
+    tmp_path = _tmp_path(path)
+    os.makedirs(tmp_path)
+    try:
+        yield tmp_path
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def _entry_size(path: str) -> int:
+    if os.path.isdir(path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+    return os.path.getsize(path)
+
+
+class CacheManager:
+    """
+    Byte budget, LRU/age eviction and locking for a cache directory.
+
+    Every top-level file or directory in the cache is one entry. Its last
+    use is its modification time, which `touch` bumps whenever an entry is
+    read, so eviction order is least recently used first.
+    """
+
+    def __init__(self, cache_dir: str = "cache", max_bytes: Optional[int] = None,
+                 max_age_days: Optional[float] = None):
+        """
+        Args:
+            cache_dir (str): Directory to manage
+            max_bytes (Optional[int]): Size budget; defaults to CACHE_MAX_MB from the environment (1024 MB)
+            max_age_days (Optional[float]): Entries unused for longer are evicted; defaults to CACHE_MAX_AGE_DAYS
+        """
+        self.cache_dir = cache_dir
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('CACHE_MAX_MB', '1024')) * 1024 * 1024)
+        if max_age_days is None and os.getenv('CACHE_MAX_AGE_DAYS'):
+            max_age_days = float(os.getenv('CACHE_MAX_AGE_DAYS'))
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    def touch(self, path: str):
+        """Mark a cache entry as just used."""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def entries(self) -> List[Tuple[str, int, float]]:
+        """List (path, size in bytes, last use) of every cache entry, lock files excluded."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(LOCK_SUFFIX):
+                continue
+            path = self.path(name)
+            try:
+                entries.append((path, _entry_size(path), os.path.getmtime(path)))
+            except OSError:
+                pass  # Removed by another process while listing
+        return entries
+
+    def total_bytes(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, protect: Iterable[str] = ()) -> List[str]:
+        """
+        Remove entries until the cache fits its budget.
+
+        Leftover temporary files and entries older than `max_age_days` go
+        first, then the least recently used entries until the total size is
+        within `max_bytes`.
+
+        Args:
+            protect (Iterable[str]): Paths that must not be evicted, such as the live index
+
+        Returns:
+            List[str]: Paths that were removed
+        """
+        protected = {os.path.abspath(path) for path in protect}
+        now = time.time()
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        removed = []
+
+        for path, size, last_used in entries:
+            if os.path.abspath(path) in protected:
+                continue
+            age_days = (now - last_used) / 86400
+            stale_tmp = TMP_MARKER in os.path.basename(path) and now - last_used > 3600
+            too_old = self.max_age_days is not None and age_days > self.max_age_days
+            if not (stale_tmp or too_old or total > self.max_bytes):
+                continue
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except OSError:
+                continue  # In use, e.g. memory-mapped on Windows
+            total -= size
+            removed.append(path)
+
+        if removed:
+            print(f"🧹 Evicted {len(removed)} cache entries, cache is now {total / 1024 / 1024:.1f} MB")
+        return removed
+
+    @contextmanager
+    def lock(self, name: str, timeout: Optional[float] = None, stale_after: float = 60):
+        """
+        Hold an exclusive, cross-process lock on `name`.
+
+        The lock is a file created with O_EXCL, so it works on every platform.
+        While the lock is held a heartbeat thread touches the file every
+        `stale_after` / 4 seconds, so a lock file untouched for `stale_after`
+        seconds belongs to a process that died and is taken over, however long
+        the live holder takes. Waiters wait for as long as the holder is alive
+        unless given a `timeout`.
+
+        Raises:
+            TimeoutError: If the lock could not be taken within `timeout` seconds
+        """
+        lock_path = self.path(f"{name}{LOCK_SUFFIX}")
+        owner = f"{os.getpid()}-{threading.get_ident()}-{time.time_ns()}".encode()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, owner)
+                os.close(fd)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > stale_after:
+                        print(f"⚠️  Taking over stale cache lock {name}")
+                        os.remove(lock_path)
+                        continue
+                except OSError:
+                    continue  # Released between the two calls
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError(f"Timed out waiting for cache lock {name}")
+                time.sleep(0.1)
+
+        released = threading.Event()
+
+        def heartbeat():
+            while not released.wait(stale_after / 4):
+                try:
+                    os.utime(lock_path)
+                except OSError:
+                    pass
+
+        beating = threading.Thread(target=heartbeat, name=f"lock-{name}", daemon=True)
+        beating.start()
+        try:
+            yield
+        finally:
+            released.set()
+            beating.join()
+            try:
+                with open(lock_path, 'rb') as f:
+                    if f.read() == owner:
+                        os.remove(lock_path)
+            except OSError:
+                pass
+
+
+_managers: Dict[str, CacheManager] = {}
+
+
+def get_cache_manager(cache_dir: str = "cache") -> CacheManager:
+    """Return the shared CacheManager for a cache directory."""
+    key = os.path.abspath(cache_dir)
+    if key not in _managers:
+        _managers[key] = CacheManager(cache_dir)
+    return _managers[key]
@@ -95,7 +95,9 @@ class ChatbotCLI:
         """Reload documents from the data/ folder."""
         print("\n🔄 Refreshing documents from 'data/' folder...")
         
-        # Reload documents
+        # Reload documents; the old retriever's shard workers and merges stop before it is replaced
+        if self.retriever is not None:
+            self.retriever.close()
         old_count = len(self.documents)
         self.documents = load_documents_from_folder("data/")
         new_count = len(self.documents)
@@ -0,0 +1,201 @@
+"""
+Clustered (IVF) coarse quantizer over the document vectors.
+
+Spherical k-means groups the documents of an index by their TF-IDF
+vectors: the rows of the segments' forward matrices, weighted by the idf
+of the index at the time. The clusters take the place of
+the parent/folder groups of two-stage retrieval (see summaries): a query
+is scored against the cluster centroids and only the documents of the
+`nprobe` nearest clusters are searched, the inverted-file (IVF) scheme
+of vector search engines. More probes mean higher recall and more work.
+
+Training runs on a sample of the documents, and the centroids keep only
+their heaviest terms, so both stay cheap on corpora of millions of
+documents; every document is then assigned to its nearest centroid in
+blocks. Term ids stay the same while an index grows (see TermTable), so a
+saved quantizer stays valid as documents are added: new and changed
+documents are assigned to the existing clusters, and the others keep
+theirs (see Quantizer.groups). An index rebuilt from scratch numbers
+its terms afresh and gets a new index id, and a quantizer trained on
+another index id no longer fits (see Quantizer.fits) and is retrained.
+"""
+
+import math
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from cache_manager import atomic_file
+
+# Documents k-means is trained on; the rest are only assigned
+TRAINING_SAMPLE = 50_000
+
+ITERATIONS = 10
+
+# Heaviest terms kept per centroid
+CENTROID_TERMS = 256
+
+# Rows scored against the centroids at once
+ASSIGN_BLOCK = 8192
+
+
+def default_num_clusters(num_docs: int) -> int:
+    """About the square root of the number of documents, the usual IVF choice."""
+    return max(1, int(round(math.sqrt(num_docs))))
+
+
+def _normalize_rows(matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags((1.0 / norms).astype(np.float32)).dot(matrix).tocsr()
+
+
+def _tfidf_rows(index, rows: sparse.csr_matrix) -> sparse.csr_matrix:
+    """Weight rows of a segment's forward matrix by the idf of the index, over the full vocabulary."""
+    num_terms = len(index.vocabulary)
+    rows = rows.tocsr(copy=True)
+    rows.resize((rows.shape[0], num_terms))
+    return _normalize_rows(rows @ sparse.diags(index.idf()[:num_terms].astype(np.float32)))
+
+
+def _truncate_rows(matrix: sparse.csr_matrix, keep: int) -> sparse.csr_matrix:
+    """Keep the `keep` largest entries of every row."""
+    indptr, indices, data = [0], [], []
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        row_data = matrix.data[start:end]
+        top = np.argsort(-row_data, kind='stable')[:keep]
+        indices.append(matrix.indices[start:end][top])
+        data.append(row_data[top])
+        indptr.append(indptr[-1] + len(top))
+    return sparse.csr_matrix(
+        (np.concatenate(data) if data else np.zeros(0, dtype=np.float32),
+         np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32), indptr),
+        shape=matrix.shape,
+    )
+
+
+class Quantizer:
+    """
+    Cluster centroids over the index vocabulary, with nearest-centroid assignment.
+
+    Attributes:
+        centroids (sparse.csr_matrix): Clusters x terms, l2-normalised, truncated to CENTROID_TERMS terms
+        index_id (Optional[str]): Id of the index whose term ids the centroids use (see SegmentedIndex)
+    """
+
+    def __init__(self, centroids: sparse.csr_matrix, index_id: Optional[str] = None):
+        self.centroids = centroids.astype(np.float32).tocsr()
+        self.index_id = index_id
+        # Fingerprint and cluster of every document assigned so far, by document key
+        self._labels: Dict[str, Tuple[Optional[str], int]] = {}
+        # Terms x clusters, for scoring blocks of documents
+        self._term_clusters = self.centroids.T.tocsr()
+
+    def __len__(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def train(cls, index, num_clusters: Optional[int] = None, seed: int = 0) -> "Quantizer":
+        """
+        Run spherical k-means over a sample of the live documents of an index.
+
+        Args:
+            index (SegmentedIndex): Index to cluster
+            num_clusters (Optional[int]): Number of clusters; about the square root of the documents by default
+
+        Returns:
+            Quantizer: The trained quantizer
+        """
+        rng = np.random.default_rng(seed)
+        num_terms = len(index.vocabulary)
+        live = [(segment, np.flatnonzero(~np.asarray(segment.deleted))) for segment in index.segments]
+        total = sum(len(rows) for _, rows in live)
+        num_clusters = min(num_clusters or default_num_clusters(total), max(total, 1))
+
+        # Sample the same share of every segment's live rows
+        share = min(1.0, TRAINING_SAMPLE / max(total, 1))
+        blocks = []
+        for segment, rows in live:
+            if share < 1.0:
+                rows = np.sort(rng.choice(rows, size=int(math.ceil(len(rows) * share)), replace=False))
+            blocks.append(_tfidf_rows(index, segment.forward[rows]))
+        if not blocks:
+            return cls(sparse.csr_matrix((1, num_terms), dtype=np.float32), index.index_id)
+        sample = sparse.vstack(blocks, format='csr').astype(np.float32)
+
+        centroids = sample[rng.choice(sample.shape[0], size=num_clusters, replace=False)]
+        for _ in range(ITERATIONS):
+            labels = cls(centroids).assign(sample)
+            assignment = sparse.csr_matrix(
+                (np.ones(len(labels), dtype=np.float32), (labels, np.arange(len(labels)))),
+                shape=(num_clusters, sample.shape[0]),
+            )
+            summed = (assignment @ sample).tocsr()
+            # Clusters that lost all their documents start over from a random document
+            empty = np.flatnonzero(np.diff(summed.indptr) == 0)
+            if len(empty):
+                reseeded = sparse.lil_matrix(summed)
+                for cluster, row in zip(empty, rng.choice(sample.shape[0], size=len(empty))):
+                    reseeded[cluster] = sample[row]
+                summed = reseeded.tocsr()
+            centroids = _truncate_rows(_normalize_rows(summed), CENTROID_TERMS)
+        return cls(_normalize_rows(centroids), index.index_id)
+
+    def fits(self, index) -> bool:
+        """Whether the centroids were trained on this index, so their term ids mean the same terms."""
+        return self.index_id == index.index_id and self.centroids.shape[1] <= len(index.vocabulary)
+
+    def assign(self, matrix: sparse.csr_matrix) -> np.ndarray:
+        """Nearest centroid of every row of a documents x terms matrix; cluster 0 for rows sharing no term with any."""
+        labels = np.zeros(matrix.shape[0], dtype=np.int64)
+        num_terms = self._term_clusters.shape[0]
+        for start in range(0, matrix.shape[0], ASSIGN_BLOCK):
+            block = matrix[start:start + ASSIGN_BLOCK]
+            if block.shape[1] != num_terms:
+                block = block.tocsr(copy=True)
+                block.resize((block.shape[0], num_terms))
+            labels[start:start + block.shape[0]] = np.asarray((block @ self._term_clusters).argmax(axis=1)).ravel()
+        return labels
+
+    def groups(self, index) -> Dict[str, str]:
+        """
+        Cluster of every live document of an index, as the groups of a SummaryIndex.
+
+        Assignments are remembered by document key and fingerprint, so after the
+        index changes only the documents added or changed since are assigned;
+        the rest keep their cluster, however their rows were merged.
+        """
+        labels = {}
+        for segment in index.segments:
+            rows = np.flatnonzero(~np.asarray(segment.deleted)).tolist()
+            unassigned = []
+            for row in rows:
+                key = segment.doc_keys[row]
+                fingerprint = index.fingerprints.get(key)
+                known = self._labels.get(key)
+                if known is not None and known[0] == fingerprint:
+                    labels[key] = known
+                else:
+                    unassigned.append(row)
+            if unassigned:
+                assigned = self.assign(_tfidf_rows(index, segment.forward[unassigned])).tolist()
+                labels.update((segment.doc_keys[row], (index.fingerprints.get(segment.doc_keys[row]), label))
+                              for row, label in zip(unassigned, assigned))
+        # Deleted documents are forgotten
+        self._labels = labels
+        return {key: f"cluster{label}" for key, (_, label) in labels.items()}
+
+    def save(self, path: str):
+        with atomic_file(path) as f:
+            np.savez(f, data=self.centroids.data, indices=self.centroids.indices, indptr=self.centroids.indptr,
+                     shape=np.asarray(self.centroids.shape), index_id=np.asarray(self.index_id or ''))
+
+    @classmethod
+    def load(cls, path: str) -> "Quantizer":
+        with np.load(path) as saved:
+            index_id = str(saved['index_id']) if 'index_id' in saved.files else ''
+            return cls(sparse.csr_matrix((saved['data'], saved['indices'], saved['indptr']),
+                                         shape=tuple(saved['shape'])), index_id or None)
+
@@ -0,0 +1,114 @@
+"""
+Near-duplicate document detection with MinHash and locality-sensitive hashing.
+
+Document folders collect copies: "Report.pdf" next to "Report (1).pdf", or
+the same text saved as both DOCX and PDF. Each copy would be extracted,
+indexed and retrieved on its own, and end up in the prompt more than once.
+The loader keeps the first copy as the canonical document and records the
+others as its aliases (see document_loader.iter_documents_from_folder).
+
+Byte-identical files are caught by their hash before any text is extracted,
+so they never cost OCR time. Copies whose bytes differ but whose text
+(nearly) matches are caught after extraction: every text is reduced to a
+MinHash signature of its word shingles, whose agreement estimates the
+Jaccard similarity of the shingle sets. The signatures are cut into bands
+and every band hashed into a bucket, so only documents sharing a bucket
+are compared, no matter how many documents were seen before:
+
+    detector = DuplicateDetector()
+    detector.check("data/Report.pdf", text)          # None: first of its kind
+    detector.check("data/Report (1).pdf", text)      # "data/Report.pdf"
+"""
+
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Words per shingle
+SHINGLE_SIZE = 5
+
+# Signature length, as bands x rows per band; with 16 x 8, documents agreeing on
+# about 70% of their shingles or more are likely to share a bucket
+BANDS = 16
+ROWS_PER_BAND = 8
+
+# Estimated Jaccard similarity from which two texts count as copies
+THRESHOLD = 0.8
+
+# Shingles hashed at once
+SIGNATURE_BLOCK = 4096
+
+# Mersenne prime for the universal hash functions of the permutations
+_PRIME = (1 << 61) - 1
+
+_WORD = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """Hashes of the distinct word n-grams of a text (the whole text for texts shorter than n words)."""
+    words = _WORD.findall(text.lower())
+    grams = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+    return np.fromiter((zlib.crc32(gram.encode('utf-8')) for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+class DuplicateDetector:
+    """
+    Finds earlier documents that a new one duplicates exactly or nearly.
+
+    Attributes:
+        threshold (float): Estimated Jaccard similarity of shingles from which texts count as copies
+    """
+
+    def __init__(self, threshold: float = THRESHOLD, seed: int = 0):
+        self.threshold = threshold
+        rng = np.random.default_rng(seed)
+        num_hashes = BANDS * ROWS_PER_BAND
+        self._a = rng.integers(1, 1 << 31, size=num_hashes, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, size=num_hashes, dtype=np.uint64)
+        self._hashes: Dict[str, str] = {}
+        self._buckets: Dict[Tuple[int, bytes], List[str]] = {}
+        self._signatures: Dict[str, np.ndarray] = {}
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of a text: the minimum of every hash function over its shingles."""
+        values = shingles(text)
+        signature = np.full(BANDS * ROWS_PER_BAND, _PRIME, dtype=np.uint64)
+        # In blocks, so a book-length text doesn't need a hashes x shingles matrix at once;
+        # a * x + b stays below 2^64 for 31-bit a, b and 32-bit shingle hashes
+        for start in range(0, len(values), SIGNATURE_BLOCK):
+            block = values[None, start:start + SIGNATURE_BLOCK]
+            np.minimum(signature, ((self._a[:, None] * block + self._b[:, None]) % _PRIME).min(axis=1), out=signature)
+        return signature
+
+    def check_file(self, key: str, file_hash: str) -> Optional[str]:
+        """
+        Check a file by the hash of its bytes, before its text is extracted.
+
+        Returns:
+            Optional[str]: Key of the earlier identical file, or None (and the file is remembered)
+        """
+        original = self._hashes.get(file_hash)
+        if original is None:
+            self._hashes[file_hash] = key
+        return original
+
+    def check(self, key: str, text: str) -> Optional[str]:
+        """
+        Check a document by its text.
+
+        Returns:
+            Optional[str]: Key of the earlier document it nearly duplicates, or None (and the document is remembered)
+        """
+        signature = self.signature(text)
+        bands = [(band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes()) for band in range(BANDS)]
+        candidates = dict.fromkeys(other for bucket in bands for other in self._buckets.get(bucket, ()))
+        for other in candidates:
+            if np.mean(self._signatures[other] == signature) >= self.threshold:
+                return other
+
+        self._signatures[key] = signature
+        for bucket in bands:
+            self._buckets.setdefault(bucket, []).append(key)
+        return None
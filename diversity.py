@@ -0,0 +1,58 @@
+"""
+Maximal marginal relevance (MMR) re-ranking of retrieval results.
+
+Near-identical documents match a query equally well: the same letterhead
+on every page of an OCR scan, or two revisions of one DOCX. Ranked by
+relevance alone they fill the results with the same text, and all of it
+goes into the prompt. MMR picks results one at a time, each time the
+candidate with the best trade-off between its relevance and its similarity
+to the results already picked:
+
+    score = (1 - diversity) * relevance - diversity * max similarity to the picked results
+
+so a near copy of a picked result only makes the cut if nothing else is
+left. Similarities are cosines of the documents' TF-IDF vectors. The
+candidate set is bounded (a small multiple of the results wanted), so the
+whole candidate x candidate similarity matrix is one sparse product and
+every pick is a vectorised update.
+"""
+
+from typing import List, Sequence
+
+import numpy as np
+from scipy import sparse
+
+# Candidates per result considered for diversification
+DIVERSITY_CANDIDATES = 3
+
+
+def mmr(relevance: Sequence[float], vectors: sparse.csr_matrix, k: int, diversity: float) -> List[int]:
+    """
+    Pick up to k diverse, relevant candidates.
+
+    Args:
+        relevance (Sequence[float]): Relevance score of every candidate
+        vectors (sparse.csr_matrix): Normalised vector of every candidate, one row each
+        k (int): Number of candidates to pick
+        diversity (float): Weight of novelty against relevance, from 0 (relevance only) to 1
+
+    Returns:
+        List[int]: Positions of the picked candidates, in the order picked
+    """
+    relevance = np.asarray(relevance, dtype=np.float64)
+    if diversity <= 0 or len(relevance) <= 1:
+        return np.argsort(-relevance, kind='stable')[:k].tolist()
+
+    similarity = (vectors @ vectors.T).toarray()
+    # Highest similarity of every candidate to the picked ones
+    redundancy = np.zeros(len(relevance))
+    available = np.ones(len(relevance), dtype=bool)
+    picked = []
+    for _ in range(min(k, len(relevance))):
+        scores = (1.0 - diversity) * relevance - diversity * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return picked
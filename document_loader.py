@@ -2,9 +2,13 @@ import os
 import glob
 import json
 import hashlib
-from typing import List, Dict
+from typing import Dict, Iterator, List, Optional, Tuple
 import PyPDF2
-from docx import Document
+from docx import Document as DocxDocument
+from cache_manager import atomic_file, get_cache_manager
+from dedupe import DuplicateDetector
+from documents import Document
+from normalize import configured_steps, normalize_text, savings
 
 # OCR imports with fallback
 try:
@@ -26,6 +30,17 @@ def get_file_hash(file_path: str) -> str:
     return hash_md5.hexdigest()
 
 
+# Bump when text extraction changes, so cached indexes re-read every document
+EXTRACTION_VERSION = 2
+
+
+def get_file_fingerprint(file_path: str) -> str:
+    """Get a cheap fingerprint of a file from its size and modification time, and the text normalisation steps"""
+    stat = os.stat(file_path)
+    steps = "".join(step[0] for step in configured_steps())
+    return f"v{EXTRACTION_VERSION}{steps}-{stat.st_size}-{stat.st_mtime_ns}"
+
+
 def get_cache_path(file_path: str) -> str:
     """Get cache file path for OCR results"""
     cache_dir = "cache"
@@ -52,6 +67,7 @@ def load_from_cache(file_path: str) -> str:
         current_hash = get_file_hash(file_path)
         if cache_data.get('file_hash') == current_hash:
             print(f"📁 Loading cached OCR results for {os.path.basename(file_path)}")
+            get_cache_manager().touch(cache_path)
             return cache_data.get('content')
         else:
             print(f"🔄 File changed, cache invalid for {os.path.basename(file_path)}")
@@ -73,31 +89,60 @@ def save_to_cache(file_path: str, content: str):
             'cached_at': str(os.path.getmtime(file_path))
         }
         
-        with open(cache_path, 'w', encoding='utf-8') as f:
+        with atomic_file(cache_path, 'w', encoding='utf-8') as f:
             json.dump(cache_data, f, ensure_ascii=False, indent=2)
         
         print(f"💾 Saved OCR results to cache for {os.path.basename(file_path)}")
+        get_cache_manager().evict(protect=[cache_path, os.path.join("cache", "index")])
         
     except Exception as e:
         print(f"⚠️  Cache save error: {str(e)}")
 
 
-def load_documents_from_folder(folder_path: str = "data/") -> List[Dict[str, str]]:
+def load_documents_from_folder(folder_path: str = "data/", dedupe: bool = True) -> List[Document]:
     """
     Load all .pdf, .docx, and .txt files from the specified folder.
     
     Args:
         folder_path (str): Path to the folder containing documents
+        dedupe (bool): Whether to load copies of a document once (see iter_documents_from_folder)
         
     Returns:
-        List[Dict[str, str]]: List of dictionaries containing file content and metadata
+        List[Document]: File content and metadata of every document (see documents)
     """
-    documents = []
+    documents = list(iter_documents_from_folder(folder_path, dedupe))
+    print(f"Successfully loaded {len(documents)} documents.")
+    return documents
+
+
+def iter_documents_from_folder(folder_path: str = "data/", dedupe: bool = True) -> Iterator[Document]:
+    """
+    Load the .pdf, .docx, and .txt files of a folder one at a time.
+    
+    Only the current document is held in memory, so folders larger than RAM
+    can be streamed into the index (see retriever.index_documents).
     
+    The extracted text is normalised (see normalize), and the characters
+    and tokens that saved are reported per document.
+    
+    With `dedupe`, copies of a document are not yielded again: files with
+    the same bytes are skipped before their text is extracted, and files
+    whose text nearly matches an earlier one after (see dedupe). Shorter
+    file names are loaded first, so "Report.pdf" is kept over "Report (1).pdf".
+    Every document then has an 'aliases' list, to which the paths of its
+    copies are added when they are found, which may be after it was yielded.
+    
+    Args:
+        folder_path (str): Path to the folder containing documents
+        dedupe (bool): Whether to load copies of a document once
+        
+    Yields:
+        Document: File content and metadata of every document
+    """
     # Ensure folder exists
     if not os.path.exists(folder_path):
         print(f"Warning: Folder '{folder_path}' does not exist.")
-        return documents
+        return
     
     print(f"Loading documents from: {os.path.abspath(folder_path)}")
     
@@ -113,14 +158,25 @@ def load_documents_from_folder(folder_path: str = "data/") -> List[Dict[str, str
         files = glob.glob(pattern)
         all_files.extend(files)
     
+    all_files.sort(key=lambda f: (len(os.path.basename(f)), f))
     print(f"Found {len(all_files)} files: {[os.path.basename(f) for f in all_files]}")
     
+    detector = DuplicateDetector() if dedupe else None
+    # File name and aliases list of every yielded document, by path; not the content, so streaming stays lean
+    loaded: Dict[str, Tuple[str, List[str]]] = {}
     for file_path in all_files:
         try:
             content = ""
             file_name = os.path.basename(file_path)
             file_ext = os.path.splitext(file_name)[1].lower()
             
+            if detector is not None:
+                # A copy of a file that failed to load would fail too, so it is skipped either way
+                original = detector.check_file(file_path, get_file_hash(file_path))
+                if original is not None:
+                    _add_alias(loaded.get(original), file_path)
+                    continue
+            
             print(f"Processing: {file_name}")
             
             if file_ext == ".pdf":
@@ -131,29 +187,43 @@ def load_documents_from_folder(folder_path: str = "data/") -> List[Dict[str, str
                 content = load_txt(file_path)
             
             if content.strip():  # Only add if content is not empty
-                documents.append({
-                    "file_name": file_name,
-                    "file_path": file_path,
-                    "content": content,
-                    "file_type": file_ext
-                })
+                normalized = normalize_text(content)
+                chars, tokens = savings(content, normalized)
+                if chars:
+                    print(f"🧹 Normalised {file_name}: {chars:,} characters and {tokens:,} tokens saved "
+                          f"({chars / len(content):.0%})")
+                content = normalized
+                
+                if detector is not None:
+                    original = detector.check(file_path, content)
+                    if original is not None:
+                        _add_alias(loaded.get(original), file_path)
+                        continue
+                document = Document(content, file_name, file_path=file_path, file_type=file_ext,
+                                    fingerprint=get_file_fingerprint(file_path))
                 print(f"Loaded: {file_name} ({len(content)} characters)")
             else:
                 print(f"Warning: No content found in {file_name}")
                 # Still add the document with a note that it couldn't be processed
-                documents.append({
-                    "file_name": file_name,
-                    "file_path": file_path,
-                    "content": f"This file could not be processed. File: {file_name}\nReason: No extractable text content found.",
-                    "file_type": file_ext
-                })
+                document = Document(
+                    f"This file could not be processed. File: {file_name}\nReason: No extractable text content found.",
+                    file_name, file_path=file_path, file_type=file_ext, fingerprint=get_file_fingerprint(file_path))
                 print(f"Added with placeholder content: {file_name}")
-                
         except Exception as e:
             print(f"Error loading {file_path}: {str(e)}")
-    
-    print(f"Successfully loaded {len(documents)} documents.")
-    return documents
+            continue
+        if detector is not None:
+            document.aliases = []
+            loaded[file_path] = (file_name, document.aliases)
+        yield document
+
+
+def _add_alias(original: Optional[Tuple[str, List[str]]], file_path: str):
+    """Record a skipped copy of a loaded document."""
+    if original is not None:
+        file_name, aliases = original
+        aliases.append(file_path)
+        print(f"🪞 Skipped {os.path.basename(file_path)}: copy of {file_name}")
 
 
 def extract_text_with_ocr(pdf_path: str, max_pages: int = 215) -> str:
@@ -166,6 +236,16 @@ def extract_text_with_ocr(pdf_path: str, max_pages: int = 215) -> str:
     if cached_content:
         return cached_content
     
+    # Another process may already be running OCR on this file; wait for it and reuse its result
+    with get_cache_manager().lock(f"ocr_{os.path.basename(pdf_path)}"):
+        cached_content = load_from_cache(pdf_path)
+        if cached_content:
+            return cached_content
+        return _run_ocr(pdf_path, max_pages)
+
+
+def _run_ocr(pdf_path: str, max_pages: int) -> str:
+    """Run Tesseract over the pages of a PDF and cache the text"""
     # Set up Tesseract path
     possible_paths = [
         r"C:\Program Files\Tesseract-OCR\tesseract.exe",
@@ -238,7 +318,7 @@ Note: Full document processed and cached for faster future access."""
 
 
 def load_pdf(file_path: str) -> str:
-    """Extract text from PDF file with improved handling and OCR fallback."""
+    """Extract text from PDF file with improved handling and OCR fallback; pages end in form feeds."""
     text = ""
     file_name = os.path.basename(file_path)
     
@@ -255,7 +335,7 @@ def load_pdf(file_path: str) -> str:
                     page = pdf_reader.pages[page_num]
                     page_text = page.extract_text()
                     if page_text.strip():
-                        text += page_text + "\n"
+                        text += page_text + "\f"
                         pages_with_text += 1
                         print(f"  Page {page_num + 1}: Extracted {len(page_text)} characters")
                     else:
@@ -268,7 +348,7 @@ def load_pdf(file_path: str) -> str:
                 print(f"  ✅ Text-based PDF detected, extracting all pages...")
                 for page in pdf_reader.pages[5:]:
                     try:
-                        text += page.extract_text() + "\n"
+                        text += page.extract_text() + "\f"
                     except:
                         pass
                 print(f"  ✅ Regular extraction: {len(text)} characters")
@@ -286,7 +366,7 @@ def load_pdf(file_path: str) -> str:
 def load_docx(file_path: str) -> str:
     """Extract text from DOCX file with image extraction support."""
     try:
-        doc = Document(file_path)
+        doc = DocxDocument(file_path)
         text = ""
         images = []
         
@@ -306,7 +386,7 @@ def load_docx(file_path: str) -> str:
                     # Convert to absolute path for Streamlit compatibility
                     abs_image_path = os.path.abspath(image_path)
                     
-                    with open(image_path, 'wb') as img_file:
+                    with atomic_file(image_path) as img_file:
                         img_file.write(image_data)
                     
                     images.append({
@@ -0,0 +1,87 @@
+"""
+Compact loaded-document records.
+
+Every loaded document is a Document: a slotted record instead of a dict,
+which saves the per-document hash table and key slots of a dict. Names,
+paths, file types and parents are interned, so a file path that is
+also a document key in the retriever, the metadata index and the segments
+of the search index (see Segment.load) is one string in memory, however
+many places refer to it. The content is held once, by the record. Hits,
+the chat history and the prompt builder refer to the record instead of
+copying it (see hits).
+
+Documents behave like read-only dicts of their fields, so code written
+against the old dicts, such as doc['file_name'] or doc.get('parent'),
+keeps working, and plain dicts are still accepted wherever documents are:
+
+    doc = Document("Annual leave is twenty days.", "leave.txt", file_path="data/leave.txt", file_type=".txt")
+    doc['file_name'], doc.get('tags')      # 'leave.txt', None
+"""
+
+import sys
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Union
+
+# Fields stored in slots, in the order they are listed; other fields go into `extra`
+FIELDS = ('file_name', 'file_path', 'content', 'file_type', 'fingerprint', 'parent', 'aliases')
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Document(Mapping):
+    """
+    One loaded document.
+
+    Attributes:
+        file_name (str): Name of the file, interned
+        file_path (Optional[str]): Path of the file, interned; the document's key in the index
+        content (str): Extracted text
+        file_type (Optional[str]): Extension of the file, such as '.pdf', interned
+        fingerprint (Optional[str]): Fingerprint of the file when it was loaded (see document_loader)
+        parent (Optional[str]): Document the text was cut from, interned (see summaries)
+        aliases (Optional[List[str]]): Paths of the copies skipped at loading (see dedupe)
+        extra (Optional[Dict]): Any other fields, such as 'tags'
+    """
+
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, content: str, file_name: str = '', file_path: Optional[str] = None,
+                 file_type: Optional[str] = None, fingerprint: Optional[str] = None, parent: Optional[str] = None,
+                 aliases: Optional[List[str]] = None, **extra):
+        self.file_name = _intern(file_name)
+        self.file_path = _intern(file_path)
+        self.content = content
+        self.file_type = _intern(file_type)
+        self.fingerprint = fingerprint
+        self.parent = _intern(parent)
+        self.aliases = aliases
+        self.extra: Optional[Dict] = extra or None
+
+    @classmethod
+    def of(cls, document: Union["Document", Mapping]) -> "Document":
+        """The document itself if it is a Document, else a Document with the fields of a dict."""
+        if isinstance(document, cls):
+            return document
+        return cls(**{'content': '', **document})
+
+    def __getitem__(self, key: str):
+        if key in FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        elif self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from (field for field in FIELDS if getattr(self, field) is not None)
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(getattr(self, field) is not None for field in FIELDS) + len(self.extra or ())
+
+    def __repr__(self) -> str:
+        return f"Document({self.file_path or self.file_name!r}, {len(self.content):,} characters)"
@@ -0,0 +1,222 @@
+"""
+Entity extraction and entity postings.
+
+Dates, numbers, reference IDs (invoice and order numbers and the like),
+file names and plan names are extracted from every document once, when it
+is indexed, and normalised so that different spellings of the same entity
+meet: "March 2024", "03/2024" and "15 March 2024" all contain the entity
+date:2024-03. Each segment keeps the postings of the entities of its
+documents (see Segment in segment_index), so a query mentioning an entity
+looks up the documents that contain it instead of scanning their text.
+
+Entity keys are "<kind>:<value>" strings, kept in their own term table next
+to the index vocabulary.
+"""
+
+import os
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+MONTHS = ['january', 'february', 'march', 'april', 'may', 'june', 'july', 'august', 'september', 'october',
+          'november', 'december']
+_MONTH = r'(?P<month_name>jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|' \
+         r'sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?'
+
+# Date spellings in lowercase text, most specific first; each sets year, month and optionally day
+NUMERIC_DATE_PATTERNS = [
+    re.compile(r'\b(?P<year>\d{4})[/-](?P<month>\d{1,2})[/-](?P<day>\d{1,2})\b'),
+    re.compile(r'\b(?P<day>\d{1,2})[/.-](?P<month>\d{1,2})[/.-](?P<year>\d{4})\b'),
+]
+NAMED_DATE_PATTERNS = [
+    re.compile(r'\b(?P<day>\d{1,2})(?:st|nd|rd|th)?\s+' + _MONTH + r',?\s+(?P<year>\d{4})\b'),
+    re.compile(r'\b' + _MONTH + r'\s+(?P<day>\d{1,2})(?:st|nd|rd|th)?,?\s+(?P<year>\d{4})\b'),
+    re.compile(r'\b' + _MONTH + r',?\s+(?P<year>\d{4})\b'),
+]
+MONTH_YEAR_PATTERNS = [
+    re.compile(r'\b(?P<month>\d{1,2})[/-](?P<year>\d{4})\b'),
+    re.compile(r'\b(?P<year>\d{4})[/-](?P<month>\d{1,2})\b'),
+]
+DATE_PATTERNS = NUMERIC_DATE_PATTERNS + NAMED_DATE_PATTERNS + MONTH_YEAR_PATTERNS
+
+# Cheap tests that rule out whole groups of patterns for a text, as most texts mention few entities
+_NUMBER_SEPARATOR = re.compile(r'\d[/.-]\d')
+FILE_EXTENSIONS = ('.pdf', '.doc', '.xls', '.ppt', '.txt', '.csv')
+
+# Codes in lowercase text: parts joined by - or / with both letters and digits (INV-2023-001,
+# checked after matching), or a prefix and a serial number (PO12345)
+ID_PATTERN = re.compile(r'\b[a-z0-9]+(?:[/-][a-z0-9]+)+\b|\b[a-z]{2,}\d{3,}[a-z]?\b')
+
+FILE_PATTERN = re.compile(r'\b[\w-]+\.(?:pdf|docx?|xlsx?|pptx?|txt|csv)\b')
+
+# Capitalised names ending in "Plan" (Gold Plan), or "Plan" followed by a name (Plan B), in the original text
+PLAN_PATTERN = re.compile(r'\b(?:[A-Z][\w&]*\s+){1,3}Plan\b|\bPlan\s+[A-Z0-9]\w*\b')
+
+# Plain numbers, and numbers grouped with commas in international (1,250,000) or Indian (12,50,000) style
+NUMBER_PATTERN = re.compile(r'\b\d{1,3}(?:,\d{2,3})+(?:\.\d+)?\b|\b\d+(?:\.\d+)?\b')
+
+# Numbers with fewer digits are too common to be worth indexing
+NUMBER_MIN_DIGITS = 3
+
+
+def _month_number(match: re.Match) -> Optional[int]:
+    if match.groupdict().get('month_name'):
+        return next(i for i, name in enumerate(MONTHS, 1) if name.startswith(match.group('month_name')[:3]))
+    month = int(match.group('month'))
+    return month if 1 <= month <= 12 else None
+
+
+def extract_entities(text: str) -> List[Tuple[str, int, int]]:
+    """
+    Find the entities mentioned in a text.
+
+    A full date yields both its day (date:2024-03-15) and its month
+    (date:2024-03), so it is found for either.
+
+    Args:
+        text (str): Document or query text, in its original case
+
+    Returns:
+        List[Tuple[str, int, int]]: Entity key and character span of every mention, in no particular order
+    """
+    # Offsets in the lowercased text line up with the original text, as in segment_index.tokenize
+    lowered = text.lower()
+    entities = []
+    # One byte per character, set where an entity was already taken, so checking a span costs its length
+    taken = bytearray(len(text))
+
+    def free(start: int, end: int) -> bool:
+        return taken.find(1, start, end) == -1
+
+    def take(start: int, end: int):
+        taken[start:end] = b'\x01' * (end - start)
+
+    has_separator = _NUMBER_SEPARATOR.search(lowered) is not None
+    has_month = any(month[:3] in lowered for month in MONTHS)
+    patterns = ((NUMERIC_DATE_PATTERNS if has_separator else []) + (NAMED_DATE_PATTERNS if has_month else [])
+                + (MONTH_YEAR_PATTERNS if has_separator else []))
+    for pattern in patterns:
+        for match in pattern.finditer(lowered):
+            month = _month_number(match)
+            if month is None or not free(*match.span()):
+                continue
+            year = match.group('year')
+            entities.append((f"date:{year}-{month:02d}", *match.span()))
+            day = match.groupdict().get('day')
+            if day and 1 <= int(day) <= 31:
+                entities.append((f"date:{year}-{month:02d}-{int(day):02d}", *match.span()))
+            take(*match.span())
+
+    kinds = [('file', FILE_PATTERN)] if any(extension in lowered for extension in FILE_EXTENSIONS) else []
+    for kind, pattern in kinds + [('id', ID_PATTERN)]:
+        for match in pattern.finditer(lowered):
+            value = match.group()
+            if kind == 'id' and not (any(c.isdigit() for c in value) and any(c.isalpha() for c in value)):
+                continue
+            if free(*match.span()):
+                entities.append((f"{kind}:{value}", *match.span()))
+                take(*match.span())
+
+    for match in PLAN_PATTERN.finditer(text) if 'Plan' in text else ():
+        entities.append((f"plan:{' '.join(match.group().lower().split())}", *match.span()))
+
+    for match in NUMBER_PATTERN.finditer(lowered):
+        value = match.group().replace(',', '')
+        if sum(c.isdigit() for c in value) >= NUMBER_MIN_DIGITS and free(*match.span()):
+            entities.append((f"number:{value}", *match.span()))
+    return entities
+
+
+def query_entities(query: str) -> List[Tuple[str, str]]:
+    """
+    Find the entities a query mentions.
+
+    Queries are often typed in lowercase, so besides the capitalised plan
+    names every run of up to three words before "plan" is tried as a plan
+    name; looking up one that isn't indexed costs nothing.
+
+    Returns:
+        List[Tuple[str, str]]: Entity key and the text that mentions it, without repeats
+    """
+    found = {key: query[start:end] for key, start, end in extract_entities(query)}
+    words = re.findall(r'[\w&]+', query.lower())
+    for i, word in enumerate(words):
+        if word == 'plan':
+            for length in range(1, 4):
+                if i - length >= 0:
+                    name = ' '.join(words[i - length:i + 1])
+                    found.setdefault(f"plan:{name}", name)
+            if i + 1 < len(words):
+                found.setdefault(f"plan:plan {words[i + 1]}", f"plan {words[i + 1]}")
+    return list(found.items())
+
+
+class EntityPostings:
+    """
+    The entities of the documents of a segment.
+
+    One entry per (entity, row) pair with the span of the entity's first
+    mention in that row, sorted by entity id and then row.
+    """
+
+    def __init__(self, entities: np.ndarray, rows: np.ndarray, starts: np.ndarray, ends: np.ndarray):
+        self.entities = entities
+        self.rows = rows
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def from_rows(cls, mentions: List[List[Tuple[int, int, int]]]) -> "EntityPostings":
+        """Build the postings from (entity id, start, end) mentions per row."""
+        entries = {}
+        for row, row_mentions in enumerate(mentions):
+            for entity_id, start, end in row_mentions:
+                if (entity_id, row) not in entries or start < entries[entity_id, row][0]:
+                    entries[entity_id, row] = (start, end)
+        return cls._sorted(np.fromiter((entity for entity, _ in entries), dtype=np.int32, count=len(entries)),
+                           np.fromiter((row for _, row in entries), dtype=np.int32, count=len(entries)),
+                           np.fromiter((span[0] for span in entries.values()), dtype=np.int32, count=len(entries)),
+                           np.fromiter((span[1] for span in entries.values()), dtype=np.int32, count=len(entries)))
+
+    @classmethod
+    def _sorted(cls, entities: np.ndarray, rows: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> "EntityPostings":
+        order = np.lexsort((rows, entities))
+        return cls(entities[order], rows[order], starts[order], ends[order])
+
+    def find(self, entity_id: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the rows containing an entity, with the span of its first mention in each."""
+        first = int(np.searchsorted(self.entities, entity_id, side='left'))
+        last = int(np.searchsorted(self.entities, entity_id, side='right'))
+        return self.rows[first:last], self.starts[first:last], self.ends[first:last]
+
+    def take(self, rows: np.ndarray) -> "EntityPostings":
+        """Return the postings of the given rows only, renumbered by their place in `rows`."""
+        rows = np.asarray(rows, dtype=np.int64)
+        new_rows = np.full(int(max(np.max(rows, initial=-1), np.max(self.rows, initial=-1))) + 1, -1, dtype=np.int64)
+        new_rows[rows] = np.arange(len(rows))
+        mapped = new_rows[np.asarray(self.rows, dtype=np.int64)]
+        keep = mapped >= 0
+        return EntityPostings._sorted(np.asarray(self.entities)[keep], mapped[keep].astype(np.int32),
+                                      np.asarray(self.starts)[keep], np.asarray(self.ends)[keep])
+
+    @staticmethod
+    def concatenate(postings: List["EntityPostings"], num_rows: List[int]) -> "EntityPostings":
+        """Stack the postings of several segments whose row counts are `num_rows`."""
+        offsets = np.cumsum([0] + num_rows[:-1])
+        return EntityPostings._sorted(
+            np.concatenate([p.entities for p in postings]),
+            np.concatenate([p.rows + offset for p, offset in zip(postings, offsets)]).astype(np.int32),
+            np.concatenate([p.starts for p in postings]),
+            np.concatenate([p.ends for p in postings]),
+        )
+
+    def save(self, directory: str):
+        for name in ('entities', 'rows', 'starts', 'ends'):
+            np.save(os.path.join(directory, f"entity_{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory: str) -> "EntityPostings":
+        """Open saved postings memory-mapped."""
+        return cls(*(np.load(os.path.join(directory, f"entity_{name}.npy"), mmap_mode='r')
+                     for name in ('entities', 'rows', 'starts', 'ends')))
@@ -0,0 +1,182 @@
+"""
+Typo- and OCR-noise-tolerant query term expansion.
+
+Much of the corpus is OCR output, where "modern" may be indexed as
+"rnodern" and "management" as "manage" + "ment" because of a broken
+hyphenation. Neither TF-IDF nor the exact-match scan finds those, so query
+terms can be expanded to their near variants in the index vocabulary.
+
+Variants are found with a character trigram index over the vocabulary.
+Terms are first folded to a canonical form in which common OCR confusions
+("rn" for "m", "0" for "o", ...) are the same, so those cost nothing. The
+terms sharing enough trigrams with a query term are candidates, and those
+within a small edit distance of it are its variants. A term that is the
+concatenation of two vocabulary terms also gets the pair as a variant.
+
+The trigram index is extended as the vocabulary grows, so keeping it up to
+date costs only the new terms.
+"""
+
+from itertools import chain
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Character sequences OCR tends to confuse, folded to one form before matching
+OCR_CONFUSIONS = [('rn', 'm'), ('cl', 'd'), ('vv', 'w'), ('0', 'o'), ('1', 'l'), ('5', 's')]
+
+# Terms shorter than this are never expanded; there are too many near neighbours
+MIN_TERM_LENGTH = 4
+
+# Most variants kept per query term
+MAX_VARIANTS = 5
+
+# Most candidates checked by edit distance per query term, those sharing the most trigrams
+MAX_CANDIDATES = 200
+
+
+def canonical(term: str) -> str:
+    """Fold the OCR confusions of a term to one form."""
+    for noisy, clean in OCR_CONFUSIONS:
+        term = term.replace(noisy, clean)
+    return term
+
+
+def max_edits(term: str) -> int:
+    """Edits allowed between a term and its variants: none for short terms, then 1, then 2 from 8 characters."""
+    if len(term) < MIN_TERM_LENGTH:
+        return 0
+    return 1 if len(term) < 8 else 2
+
+
+def trigrams(term: str) -> List[str]:
+    """Distinct character trigrams of a term padded with '$' on both sides."""
+    padded = f"${term}$"
+    return list(dict.fromkeys(padded[i:i + 3] for i in range(len(padded) - 2)))
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Optimal string alignment distance (edits plus adjacent transpositions) between two strings.
+
+    Returns:
+        int: The distance, or limit + 1 if it is larger than `limit`
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if limit == 1:
+        return _one_edit_distance(a, b)
+    previous2: Optional[List[int]] = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+def _one_edit_distance(a: str, b: str) -> int:
+    """edit_distance with limit 1, in linear time: 0, 1, or 2 for anything further apart."""
+    if a == b:
+        return 0
+    prefix = 0
+    while prefix < min(len(a), len(b)) and a[prefix] == b[prefix]:
+        prefix += 1
+    if len(a) == len(b):
+        if a[prefix + 1:] == b[prefix + 1:]:
+            return 1
+        swapped = a[prefix + 1:prefix + 2] + a[prefix:prefix + 1]
+        return 1 if swapped == b[prefix:prefix + 2] and a[prefix + 2:] == b[prefix + 2:] else 2
+    if len(a) < len(b):
+        a, b = b, a
+    return 1 if a[prefix + 1:] == b[prefix:] else 2
+
+
+class TrigramIndex:
+    """
+    Trigram index over the canonical forms of a growing vocabulary.
+
+    Attributes:
+        size (int): Number of vocabulary terms indexed; term ids are 0 .. size - 1
+    """
+
+    def __init__(self):
+        self.size = 0
+        self._postings: Dict[str, List[int]] = {}
+        self._canonical: List[str] = []
+        self._gram_counts = np.zeros(0, dtype=np.int64)
+
+    def update(self, vocabulary) -> int:
+        """
+        Index the terms added to a vocabulary (anything with len() and term(id)) since the last update.
+
+        Returns:
+            int: Number of terms indexed
+        """
+        added = len(vocabulary) - self.size
+        counts = []
+        for term_id in range(self.size, len(vocabulary)):
+            folded = canonical(vocabulary.term(term_id))
+            grams = trigrams(folded)
+            self._canonical.append(folded)
+            counts.append(len(grams))
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(term_id)
+        if counts:
+            self._gram_counts = np.concatenate([self._gram_counts, counts])
+        self.size = len(vocabulary)
+        return max(added, 0)
+
+    def candidates(self, term: str, edits: int) -> np.ndarray:
+        """Ids of the terms sharing enough trigrams with a canonical term to be within `edits` of it."""
+        grams = trigrams(term)
+        lists = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not lists:
+            return np.zeros(0, dtype=np.int64)
+        ids, shared = np.unique(np.fromiter(chain.from_iterable(lists), dtype=np.int64), return_counts=True)
+        # Every edit changes at most three trigrams of either term
+        keep = shared >= np.maximum(1, np.maximum(len(grams), self._gram_counts[ids]) - 3 * edits)
+        ids, shared = ids[keep], shared[keep]
+        return ids[np.argsort(-shared, kind='stable')[:MAX_CANDIDATES]]
+
+    def variants(self, term: str, vocabulary, df: np.ndarray) -> List[str]:
+        """
+        Find the near variants of a query term among the live terms of a vocabulary.
+
+        Args:
+            term (str): Analysed query term
+            vocabulary: The vocabulary this index was updated from
+            df (np.ndarray): Document frequency of every term; terms with none are skipped
+
+        Returns:
+            List[str]: Up to MAX_VARIANTS variants, closest and most frequent first; a split of
+                the term into two vocabulary terms is returned as "first second"
+        """
+        edits = max_edits(term)
+        if not edits or term.isdigit():
+            return []
+        folded = canonical(term)
+        term_id = vocabulary.get(term)
+
+        scored = []
+        for candidate in self.candidates(folded, edits).tolist():
+            if candidate == term_id or candidate >= len(df) or not df[candidate]:
+                continue
+            distance = edit_distance(folded, self._canonical[candidate], edits)
+            if distance <= edits:
+                scored.append((distance, -int(df[candidate]), vocabulary.term(candidate)))
+
+        # Broken hyphenation: the term indexed as two halves
+        for split in range(3, len(term) - 2):
+            first, second = vocabulary.get(term[:split]), vocabulary.get(term[split:])
+            if first is not None and second is not None and first < len(df) and second < len(df) \
+                    and df[first] and df[second]:
+                scored.append((1, -int(min(df[first], df[second])), f"{term[:split]} {term[split:]}"))
+
+        return [variant for _, _, variant in sorted(scored)[:MAX_VARIANTS] if not variant.isdigit()]
@@ -116,10 +116,14 @@ Answer the question clearly and descriptively:"""
         if documents and len(documents) > 0:
             # Combine all document content as context
             context = ""
+            per_document = 12000 // len(documents)
             
             for i, doc in enumerate(documents):
                 doc_name = doc.get('file_name', f'Document {i+1}')
                 content = doc.get('content', '')
+                # A long document is represented by the passages that matched the question
+                if len(content) > per_document and getattr(doc, 'passages', None):
+                    content = doc.snippet(per_document)
                 if content.strip():
                     context += f"Document: {doc_name}\n{content}\n\n"
             
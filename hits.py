@@ -0,0 +1,89 @@
+"""
+Compact retrieval results.
+
+A Hit records which document matched, how and how well, and refers to the
+loaded document instead of copying it, so a result list (and every chat
+history entry that keeps one) costs a few small objects rather than copies
+of whole document texts.
+
+Hits behave like read-only dicts of the document plus 'similarity_score'
+and 'match_type', so code written against the old dict results, such as
+doc['file_name'] or doc.get('content'), keeps working.
+"""
+
+from collections.abc import Mapping
+from typing import Iterator, List, Optional, Tuple
+
+from snippets import Passage
+
+
+class Hit(Mapping):
+    """
+    One retrieved document.
+
+    Attributes:
+        document (Mapping[str, str]): The loaded document (see documents), shared, never copied
+        doc_id (str): Key of the document in the index
+        chunk_id (int): Chunk of the document that matched; 0 is the whole document
+        score (float): Similarity score
+        match_type (str): 'exact', 'tfidf', 'hybrid' or 'pinned'
+        span (Optional[Tuple[int, int]]): Character offsets of the exact match, if any
+        passages (List[Passage]): Best matching passages of the text, best first (see snippets)
+    """
+
+    __slots__ = ('document', 'doc_id', 'chunk_id', 'score', 'match_type', 'span', 'passages')
+
+    def __init__(self, document: Mapping, doc_id: str, score: float, match_type: str,
+                 chunk_id: int = 0, span: Optional[Tuple[int, int]] = None):
+        self.document = document
+        self.doc_id = doc_id
+        self.chunk_id = chunk_id
+        self.score = score
+        self.match_type = match_type
+        self.span = span
+        self.passages: List[Passage] = []
+
+    @property
+    def file_name(self) -> str:
+        return self.document.get('file_name', self.doc_id)
+
+    @property
+    def text(self) -> str:
+        """Text of the matched chunk, read from the document on access."""
+        return self.document.get('content', '')
+
+    def snippet(self, max_chars: int = 1000, separator: str = "\n[...]\n") -> str:
+        """The best passages joined up to about max_chars, or the start of the text if there are none."""
+        if not self.passages:
+            return self.text[:max_chars]
+        chosen = [self.passages[0].text]
+        for passage in self.passages[1:]:
+            if sum(map(len, chosen)) + len(passage.text) > max_chars:
+                break
+            chosen.append(passage.text)
+        return separator.join(chosen)
+
+    @property
+    def matched_text(self) -> str:
+        """The exact-match span of the text, or '' for TF-IDF matches."""
+        if self.span is None:
+            return ''
+        return self.text[self.span[0]:self.span[1]]
+
+    def __getitem__(self, key: str):
+        if key == 'similarity_score':
+            return self.score
+        if key == 'match_type':
+            return self.match_type
+        return self.document[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from (key for key in self.document if key not in ('similarity_score', 'match_type'))
+        yield 'similarity_score'
+        yield 'match_type'
+
+    def __len__(self) -> int:
+        return len(self.document) + 2 - sum(key in self.document for key in ('similarity_score', 'match_type'))
+
+    def __repr__(self) -> str:
+        return f"Hit({self.doc_id!r}, score={self.score:.3f}, match_type={self.match_type!r}, span={self.span})"
@@ -0,0 +1,173 @@
+"""
+Live rebuilds of the retriever.
+
+A SimpleRetriever built over a set of documents is never changed by the
+app, so it can serve as an immutable snapshot of them. LiveRetriever keeps
+the current snapshot behind one reference. Every query reads the reference
+once and runs against that snapshot to the end. `refresh` loads the
+documents again and builds a new retriever on a background thread, then
+swaps the reference:
+
+    live = LiveRetriever(lambda: load_documents_from_folder("data/"))
+    live.refresh()            # returns at once
+    live.retrieve_relevant_chunks("leave policy")   # the old snapshot, until the new one is ready
+
+Queries never wait for indexing. The ones in flight during a swap finish
+against the old snapshot, and the old snapshot is closed (stopping its
+shard workers) once the last of them is done. A failed rebuild leaves the
+old snapshot in place.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from hits import Hit
+from metadata import Filters
+from retriever import SimpleRetriever
+
+
+class _Snapshot:
+    """A retriever and the number of queries running against it."""
+
+    __slots__ = ('retriever', 'active', 'retired', 'lock')
+
+    def __init__(self, retriever: SimpleRetriever):
+        self.retriever = retriever
+        self.active = 0
+        self.retired = False
+        self.lock = threading.Lock()
+
+
+class LiveRetriever:
+    """
+    Serves queries from the current retriever snapshot while a new one is built in the background.
+
+    Exposes the same `retrieve_relevant_chunks` and `retrieve_many` methods
+    as SimpleRetriever, so it can be used in its place, also behind a
+    MicroBatcher.
+
+    Attributes:
+        refreshed_at (Optional[float]): When the last refresh was swapped in, as a timestamp
+        error (Optional[str]): Why the last refresh failed, if it did
+    """
+
+    def __init__(self, load_documents: Callable[[], List[Dict[str, str]]], **options):
+        """
+        Build the first snapshot.
+
+        Args:
+            load_documents (Callable[[], List[Dict[str, str]]]): Loads the current documents; called for every refresh
+            **options: Keyword arguments of SimpleRetriever, used for every snapshot
+        """
+        self._load_documents = load_documents
+        self._options = options
+        self._snapshot = _Snapshot(SimpleRetriever(load_documents(), **options))
+        self._refresh_lock = threading.Lock()
+        self._builder: Optional[threading.Thread] = None
+        self._closed = False
+        self.refreshed_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def retriever(self) -> SimpleRetriever:
+        """The retriever of the current snapshot."""
+        return self._snapshot.retriever
+
+    @property
+    def documents(self) -> List[Dict[str, str]]:
+        """Documents of the current snapshot."""
+        return self._snapshot.retriever.documents
+
+    @property
+    def refreshing(self) -> bool:
+        """Whether a new snapshot is being built."""
+        builder = self._builder
+        return builder is not None and builder.is_alive()
+
+    def retrieve_relevant_chunks(self, query: str, top_k: int = 3, fuzzy: Optional[bool] = None,
+                                 filters: Optional[Filters] = None) -> List[Hit]:
+        """Retrieve documents for a query from the current snapshot (see SimpleRetriever.retrieve_relevant_chunks)."""
+        return self.retrieve_many([query], top_k, fuzzy, filters)[0]
+
+    def retrieve_many(self, queries: List[str], top_k: int = 3, fuzzy: Optional[bool] = None,
+                      filters: Optional[Filters] = None) -> List[List[Hit]]:
+        """Retrieve documents for a batch of queries from the current snapshot (see SimpleRetriever.retrieve_many)."""
+        snapshot = self._acquire()
+        try:
+            return snapshot.retriever.retrieve_many(queries, top_k, fuzzy, filters)
+        finally:
+            self._release(snapshot)
+
+    def refresh(self, wait: bool = False) -> bool:
+        """
+        Reload the documents and build a new snapshot in the background.
+
+        Args:
+            wait (bool): Whether to block until the new snapshot is swapped in
+
+        Returns:
+            bool: True if a refresh was started, False if one was already running
+        """
+        with self._refresh_lock:
+            if self.refreshing:
+                return False
+            builder = threading.Thread(target=self._rebuild, name="retriever-refresh", daemon=True)
+            self._builder = builder
+            builder.start()
+        if wait:
+            builder.join()
+        return True
+
+    def close(self):
+        """Wait for a running refresh, then close the current snapshot once its queries are done."""
+        self._closed = True
+        builder = self._builder
+        if builder is not None:
+            builder.join()
+        self._retire(self._snapshot)
+
+    def _rebuild(self):
+        started = time.time()
+        try:
+            retriever = SimpleRetriever(self._load_documents(), **self._options)
+        except Exception as e:
+            self.error = str(e)
+            print(f"❌ Index refresh failed, still serving the previous documents: {e}")
+            return
+
+        previous = self._snapshot
+        self._snapshot = _Snapshot(retriever)
+        self.refreshed_at = time.time()
+        self.error = None
+        self._retire(previous)
+        print(f"🔁 Swapped in refreshed index for {len(retriever.documents)} documents "
+              f"(built in {self.refreshed_at - started:.1f}s)")
+
+    def _acquire(self) -> _Snapshot:
+        # A snapshot retired between reading the reference and registering the query is never used;
+        # the reference has been swapped by then, so reading it again gives the new snapshot
+        while True:
+            snapshot = self._snapshot
+            with snapshot.lock:
+                if not snapshot.retired:
+                    snapshot.active += 1
+                    return snapshot
+            if self._closed:
+                raise RuntimeError("LiveRetriever is closed")
+
+    def _release(self, snapshot: _Snapshot):
+        with snapshot.lock:
+            snapshot.active -= 1
+            done = snapshot.retired and snapshot.active == 0
+        if done:
+            snapshot.retriever.close()
+
+    def _retire(self, snapshot: _Snapshot):
+        with snapshot.lock:
+            if snapshot.retired:
+                return
+            snapshot.retired = True
+            done = snapshot.active == 0
+        if done:
+            snapshot.retriever.close()
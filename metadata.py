@@ -0,0 +1,176 @@
+"""
+Metadata filters over the loaded documents.
+
+Every document gets a position, and every metadata value (a file type, a
+folder, a tag, a file name) the sorted positions of the documents that
+have it. A filter such as
+
+    {'file_type': ['pdf', 'docx'], 'folder': 'data/hr'}
+
+is turned into a bitmap of the documents that pass: the values of one field
+are OR'ed, the fields AND'ed. File names may be glob patterns ('*svb*');
+the documents a pattern selects are resolved once and remembered. The
+retriever hands the bitmap to the index as a mask of each segment's rows,
+so filtered-out documents are skipped during top-k selection instead of
+being removed from the results afterwards.
+
+Folders match their subfolders too, and values are case-insensitive.
+"""
+
+import fnmatch
+import os
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+FIELDS = ('file_name', 'file_type', 'folder', 'tag')
+
+Filters = Dict[str, Union[str, Iterable[str]]]
+
+
+def freeze_filters(filters: Optional[Filters]) -> Hashable:
+    """Turn filters into a hashable value, for cache keys; None for no filters."""
+    if not filters:
+        return None
+    return tuple(sorted((field, tuple(sorted(_values(value)))) for field, value in filters.items()))
+
+
+def _values(value: Union[str, Iterable[str]]) -> List[str]:
+    return [value.lower()] if isinstance(value, str) else [v.lower() for v in value]
+
+
+def document_metadata(doc: Dict[str, str]) -> Dict[str, List[str]]:
+    """
+    Metadata values of a document, per field.
+
+    The folder field holds every ancestor folder of the file, so a filter on
+    a folder includes its subfolders. Tags come from a 'tags' list or
+    comma-separated string on the document, if it has one. The copies of a
+    document skipped at loading (its 'aliases', see dedupe) add their file
+    names and types, so filtering on a copy finds the document kept.
+    """
+    path = (doc.get('file_path') or '').replace('\\', '/')
+    folders = []
+    folder = os.path.dirname(path)
+    while folder and folder not in folders:
+        folders.append(folder.lower())
+        folder = os.path.dirname(folder)
+    tags = doc.get('tags') or []
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    file_type = doc.get('file_type') or os.path.splitext(doc.get('file_name', ''))[1]
+    file_names = [doc.get('file_name', '').lower()]
+    file_types = [file_type.lower().lstrip('.')] if file_type else []
+    for alias in doc.get('aliases') or []:
+        alias_name = os.path.basename(alias.replace('\\', '/')).lower()
+        alias_type = os.path.splitext(alias_name)[1].lstrip('.')
+        file_names.append(alias_name)
+        if alias_type and alias_type not in file_types:
+            file_types.append(alias_type)
+    return {
+        'file_name': file_names,
+        'file_type': file_types,
+        'folder': folders,
+        'tag': [tag.strip().lower() for tag in tags if tag.strip()],
+    }
+
+
+class MetadataIndex:
+    """
+    Inverted index of document metadata, with bitmap filters.
+
+    Attributes:
+        keys (List[str]): Document key at every position
+    """
+
+    def __init__(self, documents: Dict[str, Dict[str, str]]):
+        """
+        Args:
+            documents (Dict[str, Dict[str, str]]): Loaded documents by key
+        """
+        self.keys = list(documents)
+        self.positions = {key: position for position, key in enumerate(self.keys)}
+        postings: Dict[Tuple[str, str], List[int]] = {}
+        for position, doc in enumerate(documents.values()):
+            for field, values in document_metadata(doc).items():
+                for value in values:
+                    postings.setdefault((field, value), []).append(position)
+        self._postings = {entry: np.asarray(found, dtype=np.int64) for entry, found in postings.items()}
+        self._patterns: Dict[str, np.ndarray] = {}
+        self._selected: Dict[Hashable, List[str]] = {}
+        self._segment_positions: Dict[int, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def values(self, field: str) -> List[str]:
+        """Distinct values of a field, sorted."""
+        return sorted(value for entry_field, value in self._postings if entry_field == field)
+
+    def _positions(self, field: str, value: str) -> np.ndarray:
+        if field == 'file_name' and any(c in value for c in '*?['):
+            found = self._patterns.get(value)
+            if found is None:
+                names = [name for entry_field, name in self._postings if entry_field == 'file_name']
+                matching = [self._postings['file_name', name] for name in fnmatch.filter(names, value)]
+                found = np.unique(np.concatenate(matching)) if matching else np.zeros(0, dtype=np.int64)
+                self._patterns[value] = found
+            return found
+        return self._postings.get((field, value), np.zeros(0, dtype=np.int64))
+
+    def bitmap(self, filters: Optional[Filters]) -> np.ndarray:
+        """
+        Bitmap over document positions of the documents passing the filters.
+
+        Args:
+            filters (Optional[Filters]): Allowed values per field (see FIELDS); a document passes if it has
+                one of the values of every field. No filters allow every document
+
+        Returns:
+            np.ndarray: One bool per position
+        """
+        allowed = np.ones(len(self.keys), dtype=bool)
+        for field, value in (filters or {}).items():
+            if field not in FIELDS:
+                raise ValueError(f"Unknown metadata field {field!r}; expected one of {', '.join(FIELDS)}")
+            in_field = np.zeros(len(self.keys), dtype=bool)
+            for single in _values(value):
+                in_field[self._positions(field, single)] = True
+            allowed &= in_field
+        return allowed
+
+    def select(self, filters: Optional[Filters]) -> List[str]:
+        """Keys of the documents passing the filters, in document order; remembered per filter."""
+        frozen = freeze_filters(filters)
+        selected = self._selected.get(frozen)
+        if selected is None:
+            selected = [self.keys[position] for position in np.flatnonzero(self.bitmap(filters)).tolist()]
+            self._selected[frozen] = selected
+        return selected
+
+    def row_filter(self, filters: Optional[Filters]) -> Optional[Callable]:
+        """
+        Turn filters into a row filter for index searches (see SegmentedIndex.top_k).
+
+        Returns:
+            Optional[Callable[[Segment], np.ndarray]]: Gives the mask of a segment's rows that pass the
+                filters, or None if there are no filters
+        """
+        if not filters:
+            return None
+        bitmap = self.bitmap(filters)
+        return lambda segment: self.row_mask(bitmap, segment)
+
+    def row_mask(self, bitmap: np.ndarray, segment) -> np.ndarray:
+        """
+        Translate a bitmap over document positions into a mask of the rows of a segment.
+
+        The position of every row of a segment is looked up once and
+        remembered, so this is one gather per segment.
+        """
+        positions = self._segment_positions.get(segment.segment_id)
+        if positions is None:
+            positions = np.fromiter((self.positions.get(key, -1) for key in segment.doc_keys),
+                                    dtype=np.int64, count=len(segment.doc_keys))
+            self._segment_positions[segment.segment_id] = positions
+        return (positions >= 0) & bitmap[np.maximum(positions, 0)]
@@ -0,0 +1,111 @@
+"""
+Micro-batching of retrieval queries.
+
+Concurrent Streamlit sessions share one retriever. Instead of each session
+scoring its question on its own, the batcher collects the queries that arrive
+within a few milliseconds of each other and runs them through
+`SimpleRetriever.retrieve_many` as one batch.
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from hits import Hit
+from metadata import Filters, freeze_filters
+
+
+class MicroBatcher:
+    """
+    Groups queries arriving close together into batched retrieval calls.
+
+    Exposes the same `retrieve_relevant_chunks` method as SimpleRetriever, so
+    it can be used in its place.
+    """
+
+    def __init__(self, retriever, window_ms: float = 5.0, max_batch: int = 32):
+        """
+        Args:
+            retriever (SimpleRetriever): Retriever that runs the batches
+            window_ms (float): How long to wait for more queries after the first one arrives
+            max_batch (int): Largest number of queries run in one batch
+        """
+        self.retriever = retriever
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._pending: List[Tuple[str, int, Optional[bool], Optional[Filters], Future]] = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self.batches_run = 0
+        self.queries_run = 0
+        self._worker = threading.Thread(target=self._run, name="retrieval-batcher", daemon=True)
+        self._worker.start()
+
+    def retrieve_relevant_chunks(self, query: str, top_k: int = 3, fuzzy: Optional[bool] = None,
+                                 filters: Optional[Filters] = None) -> List[Hit]:
+        """
+        Retrieve documents for a query as part of the next batch.
+
+        Blocks until the batch containing the query has been scored.
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._pending.append((query, top_k, fuzzy, filters, future))
+            self._condition.notify()
+        return future.result()
+
+    def close(self):
+        """Stop the worker thread once the pending queries are done."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join()
+
+    def _take_batch(self) -> List[Tuple[str, int, Optional[bool], Optional[Filters], Future]]:
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return []
+
+            # Give other sessions a short window to join the batch
+            deadline = time.monotonic() + self.window
+            while len(self._pending) < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(timeout=remaining)
+
+            batch = self._pending[:self.max_batch]
+            self._pending = self._pending[self.max_batch:]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+
+            # retrieve_many takes one top_k, fuzzy setting and filter, so queries are grouped by them
+            groups: Dict[tuple, List[Tuple[str, Future]]] = {}
+            options = {}
+            for query, top_k, fuzzy, filters, future in batch:
+                group = (top_k, fuzzy, freeze_filters(filters))
+                options[group] = (top_k, fuzzy, filters)
+                groups.setdefault(group, []).append((query, future))
+
+            for group, items in groups.items():
+                try:
+                    results = self.retriever.retrieve_many([query for query, _ in items], *options[group])
+                except Exception as e:
+                    for _, future in items:
+                        future.set_exception(e)
+                    continue
+                for (_, future), result in zip(items, results):
+                    future.set_result(result)
+
+            self.batches_run += 1
+            self.queries_run += len(batch)
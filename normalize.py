@@ -0,0 +1,124 @@
+"""
+Text normalisation at ingest.
+
+Text extracted by PyPDF2 and Tesseract keeps the layout of the page: lines
+wrapped at the page width, words hyphenated across line breaks, the same
+header and footer on every page, and runs of spaces and blank lines. All
+of it would be indexed and pasted into prompts as is. The loader runs the
+extracted text through these steps once, before it is indexed:
+
+- 'headers': lines that open or close most pages (a letterhead, "Page 3 of
+  12") are removed. The first and last few lines of every page are compared
+  with digits masked, and those found on at least HEADER_SHARE of the pages
+  are dropped from all of them.
+- 'dehyphenate': "infor-\\nmation" becomes "information", when a
+  lowercase letter follows the hyphen.
+- 'unwrap': a line break inside a sentence, before a lowercase word,
+  becomes a space.
+- 'whitespace': runs of spaces and tabs become one space, and runs of
+  blank lines one blank line.
+
+Pages are separated by form feeds, or by the "=== Page N ===" markers of the
+OCR output. The steps to run are set with TEXT_NORMALIZATION, a comma-separated
+list ("none" for no normalisation); all of them by default.
+"""
+
+import os
+import re
+from typing import List, Optional, Sequence, Tuple
+
+STEPS = ('headers', 'dehyphenate', 'unwrap', 'whitespace')
+
+# Lines at the top and bottom of a page checked for repeated headers and footers
+HEADER_LINES = 3
+
+# Share of the pages a line must open or close to count as a header or footer
+HEADER_SHARE = 0.5
+
+# Pages needed before lines are compared across them
+MIN_PAGES = 3
+
+_PAGE_BREAK = re.compile(r"(\f|\n=== Page \d+ ===\n)")
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"\s+")
+_HYPHENATED = re.compile(r"(\w)-[ \t]*\n[ \t]*([a-z])")
+_WRAPPED = re.compile(r"([^\s.!?:;])[ \t]*\n[ \t]*(?=[a-z])")
+_HORIZONTAL = re.compile(r"[ \t\u00a0]+")
+_TRAILING = re.compile(r"[ \t]+\n")
+_BLANK_LINES = re.compile(r"\n{3,}")
+_WORDS = re.compile(r"\S+")
+
+
+def configured_steps() -> Tuple[str, ...]:
+    """Normalisation steps named by TEXT_NORMALIZATION, in pipeline order; all steps if unset."""
+    setting = os.getenv('TEXT_NORMALIZATION')
+    if setting is None:
+        return STEPS
+    names = {name.strip().lower() for name in setting.split(',')}
+    return tuple(step for step in STEPS if step in names)
+
+
+def _line_key(line: str) -> str:
+    """Compare header lines with digits masked and whitespace collapsed, so page numbers don't tell them apart."""
+    return _SPACES.sub(' ', _DIGITS.sub('#', line)).strip().lower()
+
+
+def _edge_lines(lines: List[str]) -> List[int]:
+    """Positions of the first and last HEADER_LINES non-blank lines of a page."""
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    return sorted(set(filled[:HEADER_LINES] + filled[-HEADER_LINES:]))
+
+
+def remove_headers(pages: List[str]) -> List[str]:
+    """Drop the lines that open or close at least HEADER_SHARE of the pages from every page."""
+    if len(pages) < MIN_PAGES:
+        return pages
+    split = [page.split('\n') for page in pages]
+    counts = {}
+    for lines in split:
+        for key in {_line_key(lines[i]) for i in _edge_lines(lines)}:
+            counts[key] = counts.get(key, 0) + 1
+    repeated = {key for key, count in counts.items() if count >= HEADER_SHARE * len(pages)}
+    if not repeated:
+        return pages
+    cleaned = []
+    for lines in split:
+        edges = set(_edge_lines(lines))
+        cleaned.append('\n'.join(line for i, line in enumerate(lines)
+                                 if i not in edges or _line_key(line) not in repeated))
+    return cleaned
+
+
+def normalize_text(text: str, steps: Optional[Sequence[str]] = None) -> str:
+    """
+    Normalise extracted text.
+
+    Args:
+        text (str): Text as extracted, pages separated by form feeds or OCR page markers
+        steps (Optional[Sequence[str]]): Steps to run (see STEPS); the configured ones by default
+
+    Returns:
+        str: The normalised text, page markers kept
+    """
+    steps = configured_steps() if steps is None else steps
+    # Odd positions hold the page separators, which are kept as they are
+    parts = _PAGE_BREAK.split(text)
+    pages = parts[0::2]
+    if 'headers' in steps:
+        pages = remove_headers(pages)
+    for i, page in enumerate(pages):
+        if 'dehyphenate' in steps:
+            page = _HYPHENATED.sub(r"\1\2", page)
+        if 'unwrap' in steps:
+            page = _WRAPPED.sub(r"\1 ", page)
+        if 'whitespace' in steps:
+            page = _BLANK_LINES.sub("\n\n", _TRAILING.sub("\n", _HORIZONTAL.sub(" ", page)))
+        pages[i] = page
+    parts[0::2] = pages
+    normalized = ''.join(parts)
+    return normalized.strip() if 'whitespace' in steps else normalized
+
+
+def savings(original: str, normalized: str) -> Tuple[int, int]:
+    """Characters and whitespace-separated tokens that normalisation removed."""
+    return len(original) - len(normalized), len(_WORDS.findall(original)) - len(_WORDS.findall(normalized))
@@ -0,0 +1,117 @@
+"""
+Phrase and proximity scoring over positional postings.
+
+Every segment stores, for each (term, document) posting, the positions of
+the term's tokens in the document (see Segment.term_positions). Positions
+count index terms only, so stop words don't separate words: "state of the
+art" is the phrase "state art".
+
+From the position lists of the query terms in a document this module finds
+the shortest window that holds the terms in query order, and the shortest
+window that holds them in any order. An exact phrase is an ordered window
+exactly as long as the phrase; a sloppy phrase may be up to `slop` tokens
+longer. The proximity score rewards short windows, so a paraphrase that keeps
+the query words close together scores well even if it isn't an exact match.
+
+Every step is a handful of binary searches per query term, vectorised over
+all occurrences, so this is cheap enough to run on the candidates of every
+query.
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# An unordered window counts for this fraction of an ordered one of the same length
+UNORDERED_WEIGHT = 0.5
+
+
+def ordered_window(positions: List[np.ndarray]) -> Optional[Tuple[int, int]]:
+    """
+    Find the shortest window holding one occurrence of every term, in the given order.
+
+    Args:
+        positions (List[np.ndarray]): Sorted positions of each term, in query order
+
+    Returns:
+        Optional[Tuple[int, int]]: First and last position of the window, or None if there is none
+    """
+    starts = np.asarray(positions[0])
+    ends = starts
+    for following in positions[1:]:
+        # For every window, the nearest occurrence of the next term after its current end
+        following = np.asarray(following)
+        index = np.searchsorted(following, ends, side='right')
+        valid = index < len(following)
+        starts, index = starts[valid], index[valid]
+        if not len(starts):
+            return None
+        ends = following[index]
+    if not len(starts):
+        return None
+    best = int(np.argmin(ends - starts))
+    return int(starts[best]), int(ends[best])
+
+
+def unordered_window(positions: List[np.ndarray]) -> Optional[Tuple[int, int]]:
+    """
+    Find the shortest window holding one occurrence of every term, in any order.
+
+    Returns:
+        Optional[Tuple[int, int]]: First and last position of the window, or None if a term is missing
+    """
+    if any(not len(term_positions) for term_positions in positions):
+        return None
+    # The shortest window starts at some occurrence and ends at the furthest "next occurrence" of a term
+    starts = np.unique(np.concatenate(positions))
+    ends = np.zeros(len(starts), dtype=np.int64)
+    valid = np.ones(len(starts), dtype=bool)
+    for term_positions in positions:
+        term_positions = np.asarray(term_positions)
+        index = np.searchsorted(term_positions, starts)
+        valid &= index < len(term_positions)
+        ends = np.maximum(ends, term_positions[np.minimum(index, len(term_positions) - 1)])
+    if not valid.any():
+        return None
+    lengths = np.where(valid, ends - starts, np.iinfo(np.int64).max)
+    best = int(np.argmin(lengths))
+    return int(starts[best]), int(ends[best])
+
+
+def phrase_window(positions: List[np.ndarray], slop: int = 0) -> Optional[Tuple[int, int]]:
+    """
+    Find the phrase formed by the terms, allowing `slop` extra tokens inside it.
+
+    Returns:
+        Optional[Tuple[int, int]]: First and last position of the tightest occurrence, or None
+    """
+    window = ordered_window(positions)
+    if window is None or window[1] - window[0] + 1 > len(positions) + slop:
+        return None
+    return window
+
+
+def proximity_score(positions: List[np.ndarray]) -> float:
+    """
+    Score how close together the query terms occur in a document, from 0 to 1.
+
+    1.0 means the document contains the whole query as an exact phrase. A
+    window of n terms spread over w tokens scores n / w in query order, and
+    UNORDERED_WEIGHT of that in any order. Documents that contain only some
+    of the terms score on those, scaled by the fraction of terms present.
+
+    Args:
+        positions (List[np.ndarray]): Sorted positions of each distinct query term, in query order
+    """
+    present = [np.asarray(term_positions) for term_positions in positions if len(term_positions)]
+    if len(present) < 2:
+        return 0.0
+
+    score = 0.0
+    window = ordered_window(present)
+    if window is not None:
+        score = len(present) / (window[1] - window[0] + 1)
+    window = unordered_window(present)
+    if window is not None:
+        score = max(score, UNORDERED_WEIGHT * len(present) / (window[1] - window[0] + 1))
+    return score * len(present) / len(positions)
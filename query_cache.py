@@ -0,0 +1,84 @@
+"""
+Cache of retrieval results.
+
+Users keep asking the same questions. The retriever remembers the results
+of recent queries, keyed by the normalised query, top_k and the version of
+the index, so a repeated question skips retrieval entirely, and any change
+to the index makes the old entries unreachable. Entries are evicted least
+recently used first and expire after a time-to-live.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+
+class QueryCache:
+    """
+    Thread-safe LRU cache with a time-to-live, shared by every session using the retriever.
+
+    Attributes:
+        hits (int): Lookups answered from the cache
+        misses (int): Lookups that were not in the cache or had expired
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        """
+        Args:
+            max_entries (Optional[int]): Number of results kept; defaults to QUERY_CACHE_SIZE (256), 0 disables the cache
+            ttl_seconds (Optional[float]): Lifetime of an entry; defaults to QUERY_CACHE_TTL (600 seconds)
+        """
+        if max_entries is None:
+            max_entries = int(os.getenv('QUERY_CACHE_SIZE', '256'))
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv('QUERY_CACHE_TTL', '600'))
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable):
+        """Return the cached value for a key, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value):
+        """Store a value, evicting the least recently used entries beyond the size limit."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry; the counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Entries held, hits, misses and hit rate."""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,151 @@
+"""
+Query planning for the retriever.
+
+A query is analysed once: normalised, reduced to its key terms, and scanned
+for entities such as dates and reference IDs (see entities), which are
+looked up in the index's entity postings rather than searched for in the
+text. The result is a QueryPlan listing every search strategy
+the retriever may need (the original query, its key terms, then each
+significant word). The retriever scores all strategies of all queries in a
+single pass over the index and picks the first strategy that found
+something, so a query that misses costs the same as a query that hits.
+
+Quoted parts of a query are phrases, matched against the positional index;
+a phrase may allow extra words inside it with a Lucene-style slop suffix,
+e.g. "flow chart"~2.
+
+With fuzzy matching on, every strategy also searches for the near variants
+of its words found in the index vocabulary (see fuzzy).
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+from entities import query_entities
+
+QUESTION_WORDS = {'what', 'is', 'are', 'how', 'when', 'where', 'why', 'who', 'which', 'the', 'a', 'an'}
+
+PHRASE_PATTERN = re.compile(r'"([^"]+)"(?:~(\d+))?')
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase a query and collapse runs of whitespace."""
+    return ' '.join(query.lower().split())
+
+
+def extract_key_terms(query_text: str) -> str:
+    """Extract meaningful terms from questions, removing stop words and question words."""
+    # Clean the query
+    cleaned = re.sub(r'[^\w\s]', ' ', query_text.lower())
+    words = cleaned.split()
+
+    # Remove question words and short words
+    key_terms = [word for word in words if word not in QUESTION_WORDS and len(word) > 2]
+
+    return ' '.join(key_terms)
+
+
+def extract_dates(text: str) -> List[str]:
+    """Find the dates mentioned in a text, as written."""
+    return [mention for key, mention in query_entities(text) if key.startswith('date:')]
+
+
+def extract_phrases(query: str) -> List[Tuple[str, int]]:
+    """Find the quoted phrases of a query, with their slop (0 unless given as "..."~N)."""
+    return [(phrase.strip(), int(slop or 0)) for phrase, slop in PHRASE_PATTERN.findall(query) if phrase.strip()]
+
+
+class SearchStrategy:
+    """One way of searching for a query: TF-IDF text, the strings to match exactly and the entities to look up."""
+
+    __slots__ = ('text', 'exact_terms', 'entities', 'variants')
+
+    def __init__(self, text: str, entities: Optional[List[Tuple[str, str]]] = None):
+        """
+        Args:
+            text (str): Text of the strategy
+            entities (Optional[List[Tuple[str, str]]]): (entity key, mention) pairs; those of `text` by default
+        """
+        self.text = text
+        # The whole strategy text is matched verbatim; a blank text has nothing to match
+        exact_term = normalize_query(PHRASE_PATTERN.sub(r' \1 ', text))
+        self.exact_terms = [exact_term] if exact_term else []
+        self.entities = entities if entities is not None else query_entities(text)
+        self.variants: List[str] = []
+
+    @property
+    def search_text(self) -> str:
+        """The text searched with TF-IDF: the strategy text followed by its variants."""
+        return ' '.join([self.text] + self.variants)
+
+    def expand(self, variants: Dict[str, List[str]]):
+        """
+        Add the near variants of the strategy's words.
+
+        A one-word strategy also matches its single-word variants exactly,
+        so e.g. OCR'd "rnanagement" is found for "management".
+
+        Args:
+            variants (Dict[str, List[str]]): Variants per term, as found by the index
+        """
+        words = re.findall(r'\w+', self.exact_terms[0]) if self.exact_terms else []
+        self.variants = [variant for word in dict.fromkeys(words) for variant in variants.get(word, [])]
+        if len(words) == 1:
+            self.exact_terms += [variant for variant in self.variants if ' ' not in variant]
+
+
+class QueryPlan:
+    """
+    The analysed form of a query.
+
+    Attributes:
+        query (str): The query as asked
+        normalized (str): Lowercased, whitespace-collapsed query
+        key_terms (str): The query without question words and short words
+        entities (List[Tuple[str, str]]): Entities mentioned in the query, as (entity key, mention) pairs
+        dates (List[str]): Dates mentioned in the query
+        phrases (List[Tuple[str, int]]): Quoted phrases and the slop allowed in each
+        variants (Dict[str, List[str]]): Near variants of the query terms, when fuzzy matching is on
+        strategies (List[SearchStrategy]): Strategies in priority order; the first one with results wins
+    """
+
+    def __init__(self, query: str):
+        self.query = query
+        self.normalized = normalize_query(query)
+        self.key_terms = extract_key_terms(query)
+        self.entities = query_entities(self.normalized)
+        self.dates = [mention for key, mention in self.entities if key.startswith('date:')]
+        self.phrases = extract_phrases(query)
+        self.variants: Dict[str, List[str]] = {}
+
+        # Strategy 1: Original query
+        self.strategies = [SearchStrategy(query, self.entities)]
+
+        # Strategy 2: Key terms only, if that is a different query; key term extraction
+        # breaks up IDs and dates, so this keeps the entities of the query
+        if self.key_terms and self.key_terms != self.normalized:
+            self.strategies.append(SearchStrategy(self.key_terms, self.entities))
+
+        # Strategy 3: Individual significant words
+        for word in self.key_terms.split():
+            if len(word) > 4 and word != self.key_terms:
+                self.strategies.append(SearchStrategy(word))
+
+    @property
+    def search_text(self) -> str:
+        """The query followed by the variants of its terms."""
+        return ' '.join([self.query] + [variant for found in self.variants.values() for variant in found])
+
+    def expand(self, variants: Dict[str, List[str]]):
+        """Search every strategy for the near variants of its words too."""
+        self.variants = variants
+        for strategy in self.strategies:
+            strategy.expand(variants)
+
+    def __repr__(self) -> str:
+        return f"QueryPlan({self.query!r}, strategies={[s.text for s in self.strategies]})"
+
+
+def plan_query(query: str) -> QueryPlan:
+    """Analyse a query into a QueryPlan."""
+    return QueryPlan(query)
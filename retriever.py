@@ -1,113 +1,369 @@
-import numpy as np
 import os
-import pickle
 import hashlib
-from typing import List, Dict, Tuple
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import sys
+from bisect import bisect_right
+from typing import List, Dict, Iterable, Optional, Tuple
+from cache_manager import get_cache_manager
+from clusters import Quantizer
+from diversity import DIVERSITY_CANDIDATES, mmr
+from documents import Document
+from hits import Hit
+from metadata import Filters, MetadataIndex, freeze_filters
+from query_cache import QueryCache
+from query_planner import QueryPlan, SearchStrategy, normalize_query, plan_query
+from rules import Rule, RuleSet, result_count
+from segment_index import SegmentedIndex
+from sharded_search import ShardedSearcher
+from snippets import best_passages
+from summaries import SummaryIndex, document_group
+
+# Share of the gap to a perfect score that a perfect proximity score closes (see proximity)
+PROXIMITY_BOOST = 0.5
+
+# TF-IDF candidates per result considered for proximity reranking
+PROXIMITY_CANDIDATES = 3
+
+
+def document_key(doc: Dict[str, str]) -> str:
+    """Stable identity of a document inside the index."""
+    return doc.get('file_path') or doc.get('file_name', '')
+
+
+def document_fingerprint(doc: Dict[str, str]) -> str:
+    """
+    Fingerprint of a document, used to detect changed documents.
+    
+    Uses the fingerprint the document loader recorded for the file; only
+    documents without one (e.g. built in code) fall back to hashing content.
+    """
+    fingerprint = doc.get('fingerprint')
+    if fingerprint:
+        return fingerprint
+    return hashlib.md5(doc.get('content', '').encode('utf-8')).hexdigest()
+
+
+def index_documents(documents: Iterable[Dict[str, str]], cache_dir: str = "cache") -> int:
+    """
+    Index documents into the cached index without holding them all in memory.
+
+    Documents are read one at a time from `documents`, typically a generator
+    such as document_loader.iter_documents_from_folder, and written to the
+    index in bounded batches (see SegmentedIndex.add_stream). A retriever
+    opened on the same cache directory afterwards loads the index and only
+    indexes what changed. An interrupted build resumes where it stopped.
+
+    Args:
+        documents (Iterable[Dict[str, str]]): Documents to index
+        cache_dir (str): Directory holding the cached index
+
+    Returns:
+        int: Number of documents indexed
+    """
+    cache = get_cache_manager(cache_dir)
+    index_path = os.path.join(cache_dir, "index")
+    with cache.lock("index"):
+        index = SegmentedIndex.load(index_path) or SegmentedIndex()
+        indexed = index.add_stream(
+            ((document_key(doc), doc.get('content', ''), document_fingerprint(doc)) for doc in documents),
+            directory=index_path,
+        )
+        cache.touch(index_path)
+    return indexed
+
+
+def _both(first, second):
+    """Row filter allowing the rows both filters allow."""
+    return lambda segment: first(segment) & second(segment)
+
+
+def _describe_keys(keys: List[str], limit: int = 10) -> str:
+    """Short, readable list of document names for log messages."""
+    names = [os.path.basename(key) or key for key in keys[:limit]]
+    if len(keys) > limit:
+        names.append(f"... and {len(keys) - limit} more")
+    return ", ".join(names)
 
 
 class SimpleRetriever:
     """
     A document retrieval system using TF-IDF and cosine similarity with caching.
+    
+    The TF-IDF index is segment-based: when documents are added, changed or
+    removed only the difference is indexed, instead of refitting the whole corpus.
+    Results of recent queries are kept in a QueryCache until the index changes.
+    Candidates whose query terms occur close together are boosted, and quoted
+    phrases in a query are matched exactly using the positional postings.
+    With `num_shards` above 1, searches fan out over worker processes that
+    each own a shard of the cached index (see sharded_search). With fuzzy
+    matching on, query terms are expanded to their near variants in the
+    corpus, to find typos and OCR errors (see fuzzy). Searches can be
+    restricted by file name, type, folder or tag (see metadata), and
+    declarative rules pin or boost documents for matching questions (see rules).
+    With `routing`, every query is first routed to the document groups whose
+    summaries match it best, and only their documents are scored (see summaries).
+    With `clusters` as well, the groups are k-means clusters of the documents,
+    and `routing` is the number of clusters probed (see clusters). With
+    `diversity`, near-duplicate results give way to other relevant documents
+    (see diversity). With `memory_budget`, a retriever whose documents and
+    index would not fit in that many megabytes refuses to load (see
+    memory_usage).
     """
     
-    def __init__(self, documents: List[Dict[str, str]], use_cache: bool = True):
+    def __init__(self, documents: List[Dict[str, str]], use_cache: bool = True, cache_dir: str = "cache",
+                 query_cache: Optional[QueryCache] = None, num_shards: Optional[int] = None,
+                 fuzzy: Optional[bool] = None, rules: Optional[RuleSet] = None, routing: Optional[int] = None,
+                 clusters: Optional[int] = None, diversity: Optional[float] = None,
+                 memory_budget: Optional[float] = None):
         """
         Initialize the retriever with documents.
         
         Args:
             documents (List[Dict[str, str]]): List of document dictionaries
             use_cache (bool): Whether to use caching for TF-IDF vectors
+            cache_dir (str): Directory holding the cached index
+            query_cache (Optional[QueryCache]): Cache of query results; a new one configured from the environment by default
+            num_shards (Optional[int]): Number of search worker processes; defaults to RETRIEVAL_SHARDS,
+                0 or 1 searches in-process. Needs use_cache, as workers open the saved index
+            fuzzy (Optional[bool]): Whether queries match near variants of their terms by default;
+                defaults to FUZZY_MATCHING=1
+            rules (Optional[RuleSet]): Pinning and boosting rules; from RETRIEVAL_RULES or the defaults by default
+            routing (Optional[int]): Number of document groups searched per query, 0 to search every document;
+                defaults to ROUTING_GROUPS
+            clusters (Optional[int]): Number of k-means clusters to use as the document groups, 0 to group
+                documents by parent or folder; defaults to ROUTING_CLUSTERS
+            diversity (Optional[float]): Weight of novelty against relevance when ranking results, from 0
+                (relevance only) to 1; defaults to RETRIEVAL_DIVERSITY
+            memory_budget (Optional[float]): Megabytes the documents and index may use, 0 for no limit;
+                defaults to MEMORY_BUDGET_MB
+            
+        Raises:
+            MemoryError: If the documents, or the documents and the index, exceed the memory budget
         """
-        self.documents = documents
+        # Dicts are turned into compact records once, here; Documents are kept as they are
+        self.documents = [Document.of(doc) for doc in documents]
         self.use_cache = use_cache
-        self.cache_dir = "cache"
-        if not os.path.exists(self.cache_dir):
-            os.makedirs(self.cache_dir)
-        self.vectorizer = TfidfVectorizer(stop_words='english', max_features=1000)
-        self.doc_vectors = None
+        self.cache_dir = cache_dir
+        self.cache = get_cache_manager(cache_dir)
+        self.index = SegmentedIndex()
+        self.query_cache = query_cache if query_cache is not None else QueryCache()
+        self._documents_by_key = {}
+        self._saved_version: Optional[int] = None
+        self.shards: Optional[ShardedSearcher] = None
+        self.fuzzy = fuzzy if fuzzy is not None else os.getenv('FUZZY_MATCHING', '0') == '1'
+        self.rules = rules if rules is not None else RuleSet()
+        self._metadata: Optional[MetadataIndex] = None
+        self.routing = routing if routing is not None else int(os.getenv('ROUTING_GROUPS', '0'))
+        self._summaries: Optional[SummaryIndex] = None
+        self.clusters = clusters if clusters is not None else int(os.getenv('ROUTING_CLUSTERS', '0'))
+        self._quantizer: Optional[Quantizer] = None
+        self.diversity = diversity if diversity is not None else float(os.getenv('RETRIEVAL_DIVERSITY', '0'))
+        self.memory_budget = (memory_budget if memory_budget is not None
+                              else float(os.getenv('MEMORY_BUDGET_MB', '0')))
+        # The text is checked before indexing starts; the cached index is opened memory-mapped,
+        # so checking it after opening still refuses it before its pages are read
+        self._check_memory_budget(self._document_usage())
         self.build_index()
+        self._check_memory_budget(self.memory_usage())
+        if self.routing and self.clusters and self.index.num_docs:
+            # Cluster the documents now rather than on the first query
+            self.summaries
+        
+        if num_shards is None:
+            num_shards = int(os.getenv('RETRIEVAL_SHARDS', '0'))
+        if num_shards > 1 and use_cache:
+            self.shards = ShardedSearcher(self.index_path, num_shards)
     
-    def get_cache_key(self, documents: List[Dict[str, str]]) -> str:
-        """Generate a cache key based on document content."""
-        content_hash = hashlib.md5()
-        for doc in documents:
-            content_hash.update(doc.get('content', '').encode('utf-8'))
-        return content_hash.hexdigest()[:12]
+    def _document_usage(self) -> Dict[str, int]:
+        """Bytes of the document texts, and of the records and strings that describe them."""
+        text = 0
+        records = sys.getsizeof(self.documents)
+        for doc in self.documents:
+            text += sys.getsizeof(doc.content)
+            records += sys.getsizeof(doc) + sys.getsizeof(doc.file_name) + sys.getsizeof(doc.fingerprint or '')
+        return {'text': text, 'documents': records}
+    
+    def memory_usage(self) -> Dict[str, int]:
+        """
+        Report the bytes the retriever uses, by part.
+        
+        Returns:
+            Dict[str, int]: Bytes of the document 'text' and 'documents' records, and of the parts of
+                the index (see SegmentedIndex.memory_usage)
+        """
+        usage = self._document_usage()
+        usage.update(self.index.memory_usage())
+        return usage
     
-    def load_from_cache(self, cache_key: str) -> Tuple[bool, any, any]:
-        """Load cached vectorizer and vectors."""
+    def _check_memory_budget(self, usage: Dict[str, int]):
+        """Raise MemoryError if the usage exceeds the memory budget."""
+        total = sum(usage.values())
+        if self.memory_budget and total > self.memory_budget * 1024 * 1024:
+            parts = ", ".join(f"{name} {nbytes / 1024 / 1024:.1f} MB" for name, nbytes in usage.items() if nbytes)
+            raise MemoryError(f"{len(self.documents)} documents need {total / 1024 / 1024:.1f} MB ({parts}), "
+                              f"over the memory budget of {self.memory_budget:g} MB")
+    
+    @property
+    def metadata(self) -> MetadataIndex:
+        """Metadata index of the loaded documents, rebuilt after they change."""
+        metadata = self._metadata
+        if metadata is None:
+            metadata = self._metadata = MetadataIndex(self._documents_by_key)
+        return metadata
+    
+    @property
+    def summaries(self) -> SummaryIndex:
+        """Summaries of the document groups, recomputed after the index changes."""
+        summaries = self._summaries
+        if summaries is None or summaries.version != self.index.version:
+            if self.clusters:
+                groups = self.quantizer.groups(self.index)
+            else:
+                groups = {key: document_group(doc) for key, doc in self._documents_by_key.items()}
+            summaries = self._summaries = SummaryIndex(self.index, groups)
+        return summaries
+    
+    @property
+    def quantizer(self) -> Quantizer:
+        """K-means clusters of the documents, trained once and kept with the cached index."""
+        quantizer = self._quantizer
+        wanted = min(self.clusters, max(self.index.num_docs, 1))
+        if quantizer is None or len(quantizer) != wanted or not quantizer.fits(self.index):
+            path = os.path.join(self.cache_dir, "ivf_quantizer.npz")
+            if self.use_cache and os.path.exists(path):
+                quantizer = Quantizer.load(path)
+                self.cache.touch(path)
+            if quantizer is None or len(quantizer) != wanted or not quantizer.fits(self.index):
+                print(f"🧮 Clustering {self.index.num_docs} documents into {self.clusters} clusters...")
+                quantizer = Quantizer.train(self.index, self.clusters)
+                if self.use_cache:
+                    quantizer.save(path)
+            self._quantizer = quantizer
+        return quantizer
+    
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.cache_dir, "index")
+    
+    def load_from_cache(self) -> bool:
+        """Open the cached segment index; its arrays are memory-mapped rather than read into RAM."""
         try:
-            vectorizer_path = os.path.join(self.cache_dir, f"vectorizer_{cache_key}.pkl")
-            vectors_path = os.path.join(self.cache_dir, f"vectors_{cache_key}.pkl")
-            documents_path = os.path.join(self.cache_dir, f"documents_{cache_key}.pkl")
-            
-            if all(os.path.exists(p) for p in [vectorizer_path, vectors_path, documents_path]):
-                with open(vectorizer_path, 'rb') as f:
-                    vectorizer = pickle.load(f)
-                with open(vectors_path, 'rb') as f:
-                    vectors = pickle.load(f)
-                with open(documents_path, 'rb') as f:
-                    cached_docs = pickle.load(f)
-                
-                return True, vectorizer, vectors
+            index = SegmentedIndex.load(self.index_path)
+            if index is not None:
+                self.index = index
+                self._saved_version = index.version
+                self.cache.touch(self.index_path)
+                return True
         except Exception as e:
             print(f"Cache load error: {e}")
-        return False, None, None
+        return False
     
-    def save_to_cache(self, cache_key: str, vectorizer, vectors):
-        """Save vectorizer and vectors to cache."""
+    def save_to_cache(self):
+        """Save new segments and tombstones of the index to cache."""
         try:
-            vectorizer_path = os.path.join(self.cache_dir, f"vectorizer_{cache_key}.pkl")
-            vectors_path = os.path.join(self.cache_dir, f"vectors_{cache_key}.pkl")
-            documents_path = os.path.join(self.cache_dir, f"documents_{cache_key}.pkl")
-            
-            with open(vectorizer_path, 'wb') as f:
-                pickle.dump(vectorizer, f)
-            with open(vectors_path, 'wb') as f:
-                pickle.dump(vectors, f)
-            with open(documents_path, 'wb') as f:
-                pickle.dump(self.documents, f)
-            
-            print(f"💾 Cached TF-IDF data with hash: {cache_key}...")
+            self.index.save(self.index_path)
+            self._saved_version = self.index.version
+            self.cache.touch(self.index_path)
+            print(f"💾 Cached TF-IDF index (version {self.index.version}, {len(self.index.segments)} segments)")
+            self.cache.evict(protect=[self.index_path])
         except Exception as e:
             print(f"Cache save error: {e}")
 
     def build_index(self):
-        """Build TF-IDF index for documents with caching support."""
+        """Build TF-IDF index for documents, indexing only what changed since the cached index."""
+        self._documents_by_key = {document_key(doc): doc for doc in self.documents}
+        self._metadata = None
+        self._summaries = None
+        
         if not self.documents:
             print("No documents to index.")
             return
         
-        # Try to load from cache first
-        if self.use_cache:
-            cache_key = self.get_cache_key(self.documents)
-            loaded, vectorizer, vectors = self.load_from_cache(cache_key)
-            if loaded:
-                self.vectorizer = vectorizer
-                self.doc_vectors = vectors
-                print(f"📥 Loaded cached TF-IDF data: {cache_key}...")
-                print(f"📥 Loaded cached index for {len(self.documents)} documents")
-                return
+        if not self.use_cache:
+            self._update_index()
+            return
+        
+        # Only one process builds the index at a time; the others wait and then load its result
+        with self.cache.lock("index"):
+            self._update_index()
+    
+    def _update_index(self):
+        """Index the difference between the documents and the cached index."""
+        # Start from the cached index if there is one
+        if self.use_cache and self.load_from_cache():
+            print(f"📥 Loaded cached index for {self.index.num_docs} documents (corpus version {self.index.version})")
+        
+        manifest = {key: document_fingerprint(doc) for key, doc in self._documents_by_key.items()}
+        added, changed, removed = self.index.diff(manifest)
         
-        # Build index if not cached
-        print(f"🔍 Building search index for {len(self.documents)} documents...")
+        if not (added or changed or removed):
+            print(f"📥 Index is up to date for {len(self.documents)} documents")
+            return
         
-        # Extract content from documents
-        doc_contents = [doc.get('content', '') for doc in self.documents]
+        for label, keys in (("new", added), ("changed", changed), ("removed", removed)):
+            if keys:
+                print(f"🔄 {len(keys)} {label}: {_describe_keys(keys)}")
         
-        # Create TF-IDF vectors
-        self.doc_vectors = self.vectorizer.fit_transform(doc_contents)
+        if removed:
+            self.index.delete_documents(removed)
+        if added or changed:
+            # Streamed in bounded batches, so building never holds every document's tokens at once
+            self.index.add_stream(
+                ((key, self._documents_by_key[key].get('content', ''), manifest[key]) for key in added + changed),
+                directory=self.index_path if self.use_cache else None,
+            )
         
-        # Save to cache
         if self.use_cache:
-            cache_key = self.get_cache_key(self.documents)
-            self.save_to_cache(cache_key, self.vectorizer, self.doc_vectors)
+            self.save_to_cache()
         
         print(f"Built search index for {len(self.documents)} documents.")
     
-    def retrieve_relevant_chunks(self, query: str, top_k: int = 3) -> List[Dict[str, str]]:
+    def add_documents(self, documents: List[Dict[str, str]]):
+        """
+        Add or replace documents without rebuilding the index.
+        
+        Args:
+            documents (List[Dict[str, str]]): Documents to add; existing ones with the same key are replaced
+        """
+        documents = [Document.of(doc) for doc in documents]
+        for doc in documents:
+            key = document_key(doc)
+            if key not in self._documents_by_key:
+                self.documents.append(doc)
+            else:
+                self.documents[self.documents.index(self._documents_by_key[key])] = doc
+            self._documents_by_key[key] = doc
+        self._metadata = None
+        self._summaries = None
+        entries = [(document_key(doc), doc.get('content', ''), document_fingerprint(doc)) for doc in documents]
+        if not self.use_cache:
+            self.index.add_documents(entries)
+            return
+        with self.cache.lock("index"):
+            self.index.add_documents(entries)
+            self.save_to_cache()
+    
+    def remove_documents(self, keys: Iterable[str]):
+        """
+        Remove documents from the index by key (file path, or file name when there is no path).
+        
+        Args:
+            keys (Iterable[str]): Keys of the documents to remove
+        """
+        keys = set(keys)
+        self.documents = [doc for doc in self.documents if document_key(doc) not in keys]
+        for key in keys:
+            self._documents_by_key.pop(key, None)
+        self._metadata = None
+        self._summaries = None
+        if not self.use_cache:
+            self.index.delete_documents(keys)
+            return
+        with self.cache.lock("index"):
+            if self.index.delete_documents(keys):
+                self.save_to_cache()
+    
+    def retrieve_relevant_chunks(self, query: str, top_k: int = 3, fuzzy: Optional[bool] = None,
+                                 filters: Optional[Filters] = None) -> List[Hit]:
         """
         Retrieve the most relevant document chunks for a given query.
         Uses both TF-IDF similarity and exact keyword matching for better results.
@@ -116,242 +372,347 @@ class SimpleRetriever:
         Args:
             query (str): The search query
             top_k (int): Number of top documents to retrieve
+            fuzzy (Optional[bool]): Whether to match near variants of the query terms; the retriever default if None
+            filters (Optional[Filters]): Only search documents with these metadata values (see metadata)
             
         Returns:
-            List[Dict[str, str]]: Most relevant documents
+            List[Hit]: Most relevant documents, as compact hits that refer to the loaded documents
         """
-        if self.doc_vectors is None or not self.documents:
-            return []
+        return self.retrieve_many([query], top_k, fuzzy, filters)[0]
+    
+    def retrieve_many(self, queries: List[str], top_k: int = 3, fuzzy: Optional[bool] = None,
+                      filters: Optional[Filters] = None) -> List[List[Hit]]:
+        """
+        Retrieve the most relevant documents for a batch of queries.
+        
+        Queries answered recently are served from the query cache. The rest
+        are planned once each (see query_planner). The top-k documents of
+        every search strategy of every query are then selected from the index
+        in one call, and the documents are scanned once for all exact-match
+        terms, so queries that need the fallback strategies cost no extra passes.
+        With routing, the queries routed to the same groups share such a call,
+        so every query only sees the documents of its own groups; likewise a
+        query widened by a rule only shares its call with equally wide ones.
+        The TF-IDF candidates are reranked by how close together the query
+        terms occur in them. Metadata filters are applied before scoring, and
+        the rules matching a query may pin documents, boost them, or ask
+        for more results than `top_k`.
+        
+        Args:
+            queries (List[str]): The search queries
+            top_k (int): Number of top documents to retrieve per query
+            fuzzy (Optional[bool]): Whether to match near variants of the query terms; the retriever default if None
+            filters (Optional[Filters]): Only search documents with these metadata values (see metadata)
+            
+        Returns:
+            List[List[Hit]]: Most relevant documents, one list per query
+        """
+        if not self.index.num_docs or not self.documents:
+            return [[] for _ in queries]
 
-        try:
-            # Extract key terms from questions for better search
-            def extract_key_terms(query_text):
-                """Extract meaningful terms from questions, removing stop words and question words."""
-                import re
-                # Remove common question words and patterns
-                question_words = ['what', 'is', 'are', 'how', 'when', 'where', 'why', 'who', 'which', 'the', 'a', 'an']
-                
-                # Clean the query
-                cleaned = re.sub(r'[^\w\s]', ' ', query_text.lower())
-                words = cleaned.split()
+        # The index version is part of the key, so any change to the index invalidates old results
+        version = self.index.version
+        fuzzy = self.fuzzy if fuzzy is None else fuzzy
+        keys = [(normalize_query(query), top_k, version, fuzzy, freeze_filters(filters)) for query in queries]
+        results = [self.query_cache.get(key) for key in keys]
+        missing = list({key: query for key, query, result in zip(keys, queries, results) if result is None}.items())
+
+        if missing:
+            try:
+                plans = [plan_query(query) for _, query in missing]
+                if fuzzy:
+                    for plan in plans:
+                        plan.expand(self.index.term_variants(plan.query))
+                rules = [self.rules.matching(plan.normalized) for plan in plans]
+                counts = [result_count(matched, top_k) for matched in rules]
                 
-                # Remove question words and short words
-                key_terms = [word for word in words if word not in question_words and len(word) > 2]
+                allowed = self.metadata.select(filters) if filters else None
+                passing = None if allowed is None else set(allowed)
+                # Queries are searched together with the queries routed to the same groups and asking for
+                # as many results, and only with them, so a query's results never depend on the rest of the batch
+                searches: Dict[Tuple[Optional[Tuple[int, ...]], int], List[int]] = {}
+                summaries = self.summaries if self.routing else None
+                routes = (summaries.route_each(self.index, [[s.search_text for s in plan.strategies] for plan in plans],
+                                               self.routing)
+                          if summaries is not None else [None] * len(plans))
+                for i, (groups, count) in enumerate(zip(routes, counts)):
+                    searches.setdefault((None if groups is None else tuple(groups.tolist()), count), []).append(i)
                 
-                return ' '.join(key_terms)
+                found = {}
+                for (route, count), members in searches.items():
+                    strategies = list({s.text: s for i in members for s in plans[i].strategies}.values())
+                    row_filter = self.metadata.row_filter(filters)
+                    scanned = allowed
+                    if route is not None:
+                        # Two-stage search: only the documents of the best matching groups are scored and scanned
+                        routed = summaries.row_filter(route)
+                        row_filter = routed if row_filter is None else _both(row_filter, routed)
+                        scanned = summaries.members(route)
+                        if passing is not None:
+                            scanned = [key for key in scanned if key in passing]
+                    candidates = self._select_top_k([s.search_text for s in strategies], count * PROXIMITY_CANDIDATES,
+                                                    row_filter)
+                    similarities = {s.text: self._boost_proximity(s.text, scores)
+                                    for s, scores in zip(strategies, candidates)}
+                    exact_scores = dict(zip([s.text for s in strategies], self._exact_matches(strategies, scanned)))
+                    
+                    for i in members:
+                        key = missing[i][0]
+                        found[key] = self._execute_plan(plans[i], count, similarities, exact_scores, rules[i], passing)
+                        self.query_cache.put(key, found[key])
+            except Exception as e:
+                print(f"Error in retrieval: {e}")
+                found = {key: [] for key, _ in missing}
+            results = [found[key] if result is None else result for key, result in zip(keys, results)]
 
-            # Try multiple search strategies
-            all_results = []
-            
-            # Strategy 1: Original query
-            results1 = self._search_with_query(query, top_k)
-            all_results.extend(results1)
-            
-            # Strategy 2: If no results from original query, try key terms only
-            if not results1:
-                key_terms = extract_key_terms(query)
-                if key_terms and key_terms != query.lower():
-                    results2 = self._search_with_query(key_terms, top_k)
-                    all_results.extend(results2)
-            
-            # Strategy 3: If still no results, try individual significant words
-            if not all_results:
-                key_terms = extract_key_terms(query)
-                words = key_terms.split()
-                for word in words:
-                    if len(word) > 4:  # Only try longer, more significant words
-                        word_results = self._search_with_query(word, top_k)
-                        all_results.extend(word_results)
-                        if word_results:  # If we find something, stop searching
-                            break
-            
-            # Remove duplicates and sort by similarity
-            seen = set()
-            unique_results = []
-            for doc in all_results:
-                doc_id = (doc['file_name'], doc.get('content', '')[:100])  # Use filename + content snippet as ID
-                if doc_id not in seen:
-                    seen.add(doc_id)
-                    unique_results.append(doc)
+        # Callers may modify their list, so the cached one is never handed out
+        return [list(result) for result in results]
+    
+    def _select_top_k(self, queries: List[str], top_k: int, row_filter=None) -> List[Dict[str, float]]:
+        """TF-IDF top-k of each query, from the shard workers when they can see the current index."""
+        # The workers don't have the metadata index, so filtered searches run in-process
+        if self.shards is not None and self._saved_version == self.index.version and row_filter is None:
+            try:
+                return self.shards.top_k(queries, top_k, self.index.version)
+            except Exception as e:
+                print(f"⚠️  Sharded search failed, searching in-process: {e}")
+        return self.index.top_k(queries, top_k, row_filter=row_filter)
+    
+    def _boost_proximity(self, query: str, similarities: Dict[str, float]) -> Dict[str, float]:
+        """Raise the TF-IDF score of candidates where the query terms occur close together."""
+        proximity = self.index.proximity_scores(query, similarities)
+        return {key: score + (1.0 - score) * PROXIMITY_BOOST * proximity.get(key, 0.0)
+                for key, score in similarities.items()}
+    
+    def close(self):
+        """Stop the shard workers, if any, and wait for a background merge of the index to finish."""
+        if self.shards is not None:
+            self.shards.close()
+            self.shards = None
+        self.index.wait_for_merges()
+    
+    def _execute_plan(self, plan: QueryPlan, top_k: int, similarities: Dict[str, Dict[str, float]],
+                      exact_scores: Dict[str, Dict[str, Tuple[float, Tuple[int, int]]]],
+                      rules: Iterable[Rule] = (), allowed: Optional[set] = None) -> List[Hit]:
+        """
+        Return the results of the first strategy of a plan that found anything, with the rules applied.
+        
+        Args:
+            plan (QueryPlan): The analysed query
+            top_k (int): Number of results
+            similarities (Dict[str, Dict[str, float]]): TF-IDF candidates per strategy text
+            exact_scores (Dict[str, Dict[str, Tuple[float, Tuple[int, int]]]]): Exact matches per strategy text
+            rules (Iterable[Rule]): Rules matching the query
+            allowed (Optional[set]): Keys of the documents passing the metadata filters; all if None
+        """
+        boosts: Dict[str, float] = {}
+        for rule in rules:
+            if rule.boost:
+                for key in self.metadata.select(rule.boost):
+                    boosts[key] = boosts.get(key, 1.0) * rule.factor
+        
+        phrase_scores = self._phrase_matches(plan.phrases)
+        if allowed is not None:
+            phrase_scores = {key: match for key, match in phrase_scores.items() if key in allowed}
+        results = []
+        for strategy in plan.strategies:
+            strategy_scores = exact_scores[strategy.text]
+            strategy_similarities = similarities[strategy.text]
+            if phrase_scores:
+                strategy_scores = dict(strategy_scores)
+                for key, (score, span) in phrase_scores.items():
+                    if score > strategy_scores.get(key, (0, None))[0]:
+                        strategy_scores[key] = (score, span)
+            if boosts:
+                strategy_scores = {key: (score * boosts.get(key, 1.0), span)
+                                   for key, (score, span) in strategy_scores.items()}
+                strategy_similarities = {key: score * boosts.get(key, 1.0) for key, score in strategy_similarities.items()}
+            # With diversity, a bounded set of extra candidates can stand in for near-duplicates
+            count = top_k * DIVERSITY_CANDIDATES if self.diversity else top_k
+            results = self._search_with_query(strategy.text, count, strategy_similarities, strategy_scores)
+            if results:
+                break
+        if self.diversity and len(results) > 1:
+            vectors = self.index.document_vectors([hit.doc_id for hit in results])
+            results = [results[i] for i in mmr([hit.score for hit in results], vectors, top_k, self.diversity)]
+        
+        for rule in rules:
+            if rule.pin:
+                pinned = [key for key in self.metadata.select(rule.pin) if allowed is None or key in allowed]
+                included = {hit.doc_id for hit in results}
+                for key in reversed(pinned[:rule.limit]):
+                    if key not in included:
+                        results.insert(0, Hit(self._documents_by_key[key], key, 1.0, 'pinned'))
+                        print(f"🎯 Rule {rule.name} pinned {self._documents_by_key[key].get('file_name', key)}")
+        
+        if results:
+            self._attach_passages(results, plan.search_text)
+        return results
+    
+    def _attach_passages(self, hits: List[Hit], query: str):
+        """Find the best passages of every hit for the query from the token positions in the index."""
+        vector = self.index.query_vector(query)
+        if not vector.nnz:
+            return
+        for hit in hits:
+            tokens = self.index.document_tokens(hit.doc_id)
+            if tokens is not None:
+                hit.passages = best_passages(hit.text, *tokens, vector.indices, vector.data)
+
+    def _phrase_matches(self, phrases: List[Tuple[str, int]]) -> Dict[str, Tuple[float, Tuple[int, int]]]:
+        """
+        Find documents containing every quoted phrase of a query.
+        
+        Args:
+            phrases (List[Tuple[str, int]]): Phrases and the slop allowed in each
             
-            # Sort by similarity score and return top results
-            unique_results.sort(key=lambda x: x.get('similarity_score', 0), reverse=True)
-            return unique_results[:top_k]
+        Returns:
+            Dict[str, Tuple[float, Tuple[int, int]]]: Exact match score and character span of the
+                longest phrase per document key
+        """
+        matches = None
+        for phrase, slop in sorted(phrases, key=lambda item: len(item[0]), reverse=True):
+            found = self.index.phrase_search(phrase, slop)
+            if matches is None:
+                # Score based on phrase length, like exact terms
+                score = min(1.0, len(phrase) / 20.0 + 0.5)
+                matches = {key: (score, span) for key, span in found.items() if key in self._documents_by_key}
+            else:
+                matches = {key: match for key, match in matches.items() if key in found}
+        return matches or {}
+
+    def _exact_matches(self, strategies: List[SearchStrategy],
+                       keys: Optional[List[str]] = None) -> List[Dict[str, Tuple[float, Tuple[int, int]]]]:
+        """
+        Find documents containing the exact-match terms or the entities of each strategy.
+        
+        The lowercased documents are joined into one string and each distinct
+        term is searched for with str.find, jumping to the next document after
+        every hit, so the scan runs at C speed and only matching documents cost
+        Python work. Entities such as dates were extracted when the documents
+        were indexed, so they are looked up in the index instead.
+        
+        Args:
+            strategies (List[SearchStrategy]): Strategies to match
+            keys (Optional[List[str]]): Keys of the documents to search; all documents by default
             
-        except Exception as e:
-            print(f"Error in retrieval: {e}")
-            return []
+        Returns:
+            List[Dict[str, Tuple[float, Tuple[int, int]]]]: Per strategy, exact match score and
+                character span of the best matching term or entity per document key
+        """
+        if keys is None:
+            keys = list(self._documents_by_key)
+        lowered = [self._documents_by_key[key].get('content', '').lower() for key in keys]
+        corpus = "\x00".join(lowered)
+        starts = []
+        position = 0
+        for text in lowered:
+            starts.append(position)
+            position += len(text) + 1
+        
+        # A term can only occur where every shorter term inside it occurs (a query contains
+        # its significant words), so those terms are only checked in the candidate documents
+        # Per term, the offset of its first occurrence in each matching document
+        matches: Dict[str, Dict[int, int]] = {}
+        for term in sorted({term for strategy in strategies for term in strategy.exact_terms}, key=len):
+            inner = [matches[other] for other in matches if other in term]
+            if inner:
+                candidates = set(inner[0]).intersection(*inner[1:])
+                offsets = {doc_index: lowered[doc_index].find(term) for doc_index in sorted(candidates)}
+                matches[term] = {doc_index: offset for doc_index, offset in offsets.items() if offset != -1}
+                continue
+            
+            found = {}
+            position = corpus.find(term) if term else -1
+            while position != -1:
+                doc_index = bisect_right(starts, position) - 1
+                found[doc_index] = position - starts[doc_index]
+                next_start = starts[doc_index] + len(lowered[doc_index]) + 1
+                position = corpus.find(term, next_start)
+            matches[term] = found
+        
+        entity_matches = {entity: self.index.entity_search(entity)
+                          for entity in {entity for strategy in strategies for entity, _ in strategy.entities}}
+        positions = {key: doc_index for doc_index, key in enumerate(keys)}
+        
+        exact_scores = []
+        for strategy in strategies:
+            scores = {}
+            for term in strategy.exact_terms:
+                # Score based on term length and specificity
+                score = min(1.0, len(term) / 20.0 + 0.5)
+                for doc_index, offset in matches[term].items():
+                    if score > scores.get(doc_index, (0, None))[0]:
+                        scores[doc_index] = (score, (offset, offset + len(term)))
+            for entity, mention in strategy.entities:
+                # Scored like an exact term of the same length
+                score = min(1.0, len(mention) / 20.0 + 0.5)
+                for key, span in entity_matches[entity].items():
+                    doc_index = positions.get(key)
+                    if doc_index is not None and score > scores.get(doc_index, (0, None))[0]:
+                        scores[doc_index] = (score, span)
+            exact_scores.append({keys[doc_index]: scores[doc_index] for doc_index in sorted(scores)})
+        
+        return exact_scores
 
-    def _search_with_query(self, query: str, top_k: int = 3) -> List[Dict[str, str]]:
+    def _search_with_query(self, query: str, top_k: int = 3, similarities: Optional[Dict[str, float]] = None,
+                           exact_scores: Optional[Dict[str, Tuple[float, Tuple[int, int]]]] = None) -> List[Hit]:
         """
         Internal method to perform search with a specific query string.
         
         Args:
             query (str): The search query
             top_k (int): Number of top documents to retrieve
+            similarities (Optional[Dict[str, float]]): Precomputed top-k TF-IDF scores of the query
+            exact_scores (Optional[Dict[str, Tuple[float, Tuple[int, int]]]]): Precomputed exact match scores of the query
             
         Returns:
-            List[Dict[str, str]]: Most relevant documents
+            List[Hit]: Most relevant documents
         """
         try:
             # First, try exact keyword matching for better recall on specific terms
+            if exact_scores is None:
+                exact_scores = self._exact_matches([SearchStrategy(query)])[0]
             exact_matches = []
-            query_lower = query.lower()
-            
-            # Extract potential date/keyword patterns from query
-            import re
-            date_patterns = re.findall(r'\b(?:january|february|march|april|may|june|july|august|september|october|november|december)\s+\d{4}\b', query_lower)
-            date_patterns.extend(re.findall(r'\b\d{1,2}[/-]\d{4}\b', query_lower))
-            date_patterns.extend(re.findall(r'\b\d{4}[/-]\d{1,2}\b', query_lower))
-            
-            # Add the full query for exact matching
-            search_terms = [query_lower] + date_patterns
+            for key, (score, span) in exact_scores.items():
+                exact_matches.append(Hit(self._documents_by_key[key], key, score, 'exact', span=span))
             
-            for i, doc in enumerate(self.documents):
-                content_lower = doc.get('content', '').lower()
-                max_score = 0
-                match_found = False
-                
-                for term in search_terms:
-                    if term in content_lower:
-                        match_found = True
-                        # Score based on term length and specificity
-                        score = min(1.0, len(term) / 20.0 + 0.5)
-                        max_score = max(max_score, score)
-                
-                if match_found:
-                    doc_copy = dict(doc)
-                    doc_copy['similarity_score'] = max_score
-                    doc_copy['match_type'] = 'exact'
-                    exact_matches.append(doc_copy)
-            
-            # Vectorize the query for TF-IDF search
-            query_vector = self.vectorizer.transform([query])
+            # Score the query against the TF-IDF index
+            if similarities is None:
+                similarities = self._select_top_k([query], top_k)[0]
             
-            # Calculate similarity scores
-            similarities = cosine_similarity(query_vector, self.doc_vectors).flatten()
-            
-            # Get top-k most similar documents (limit to available documents)
-            num_docs = len(self.documents)
-            actual_k = min(top_k, num_docs)
-            top_indices = np.argsort(similarities)[::-1][:actual_k]
+            # Get top-k most similar documents
+            top_keys = sorted(similarities, key=similarities.get, reverse=True)[:top_k]
             
             # Get TF-IDF matches
             tfidf_matches = []
-            for i in range(len(top_indices)):
-                idx = int(top_indices[i])  # Convert to Python int
-                similarity_score = float(similarities[idx])  # Convert to Python float
+            for key in top_keys:
+                similarity_score = similarities[key]
                 
                 # Apply minimum similarity threshold (lowered for better recall)
-                if similarity_score > 0.05:
-                    doc = dict(self.documents[idx])  # Create a new dict
-                    doc['similarity_score'] = similarity_score
-                    doc['match_type'] = 'tfidf'
-                    tfidf_matches.append(doc)
+                if similarity_score > 0.05 and key in self._documents_by_key:
+                    tfidf_matches.append(Hit(self._documents_by_key[key], key, similarity_score, 'tfidf'))
             
             # Combine and deduplicate results
             all_matches = {}
             
             # Add exact matches first (higher priority)
-            for doc in exact_matches:
-                file_name = doc['file_name']
-                all_matches[file_name] = doc
+            for hit in exact_matches:
+                all_matches[hit.file_name] = hit
             
             # Add TF-IDF matches if not already included
-            for doc in tfidf_matches:
-                file_name = doc['file_name']
+            for hit in tfidf_matches:
+                file_name = hit.file_name
                 if file_name not in all_matches:
-                    all_matches[file_name] = doc
-                elif all_matches[file_name]['similarity_score'] < doc['similarity_score']:
+                    all_matches[file_name] = hit
+                elif all_matches[file_name].score < hit.score:
                     # Keep the higher score but mark as hybrid
-                    all_matches[file_name]['similarity_score'] = max(
-                        all_matches[file_name]['similarity_score'], 
-                        doc['similarity_score']
-                    )
-                    all_matches[file_name]['match_type'] = 'hybrid'
+                    all_matches[file_name].score = hit.score
+                    all_matches[file_name].match_type = 'hybrid'
             
             # Sort by similarity score and return top results
             relevant_docs = list(all_matches.values())
-            relevant_docs.sort(key=lambda x: x['similarity_score'], reverse=True)
-            
-            return relevant_docs[:top_k]
-            
-        except Exception as e:
-            print(f"Error during retrieval: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return []
-            date_patterns.extend(re.findall(r'\b\d{4}[/-]\d{1,2}\b', query_lower))
-            
-            # Add the full query for exact matching
-            search_terms = [query_lower] + date_patterns
-            
-            for i, doc in enumerate(self.documents):
-                content_lower = doc.get('content', '').lower()
-                max_score = 0
-                match_found = False
-                
-                for term in search_terms:
-                    if term in content_lower:
-                        match_found = True
-                        # Score based on term length and specificity
-                        score = min(1.0, len(term) / 20.0 + 0.5)
-                        max_score = max(max_score, score)
-                
-                if match_found:
-                    doc_copy = dict(doc)
-                    doc_copy['similarity_score'] = max_score
-                    doc_copy['match_type'] = 'exact'
-                    exact_matches.append(doc_copy)
-            
-            # Vectorize the query for TF-IDF search
-            query_vector = self.vectorizer.transform([query])
-            
-            # Calculate similarity scores
-            similarities = cosine_similarity(query_vector, self.doc_vectors).flatten()
-            
-            # Get top-k most similar documents (limit to available documents)
-            num_docs = len(self.documents)
-            actual_k = min(top_k, num_docs)
-            top_indices = np.argsort(similarities)[::-1][:actual_k]
-            
-            # Get TF-IDF matches
-            tfidf_matches = []
-            for i in range(len(top_indices)):
-                idx = int(top_indices[i])  # Convert to Python int
-                similarity_score = float(similarities[idx])  # Convert to Python float
-                
-                # Apply minimum similarity threshold (lowered for better recall)
-                if similarity_score > 0.05:
-                    doc = dict(self.documents[idx])  # Create a new dict
-                    doc['similarity_score'] = similarity_score
-                    doc['match_type'] = 'tfidf'
-                    tfidf_matches.append(doc)
-            
-            # Combine and deduplicate results
-            all_matches = {}
-            
-            # Add exact matches first (higher priority)
-            for doc in exact_matches:
-                file_name = doc['file_name']
-                all_matches[file_name] = doc
-            
-            # Add TF-IDF matches if not already included
-            for doc in tfidf_matches:
-                file_name = doc['file_name']
-                if file_name not in all_matches:
-                    all_matches[file_name] = doc
-                elif all_matches[file_name]['similarity_score'] < doc['similarity_score']:
-                    # Keep the higher score but mark as hybrid
-                    all_matches[file_name]['similarity_score'] = max(
-                        all_matches[file_name]['similarity_score'], 
-                        doc['similarity_score']
-                    )
-                    all_matches[file_name]['match_type'] = 'hybrid'
-            
-            # Sort by similarity score and return top results
-            relevant_docs = list(all_matches.values())
-            relevant_docs.sort(key=lambda x: x['similarity_score'], reverse=True)
+            relevant_docs.sort(key=lambda hit: hit.score, reverse=True)
             
             return relevant_docs[:top_k]
             
@@ -381,15 +742,11 @@ class SimpleRetriever:
         for i, doc in enumerate(relevant_docs):
             score = doc.get('similarity_score', 0.0)
             file_name = doc.get('file_name', 'Unknown')
-            content = doc.get('content', '')
             
             context += f"Relevant Document {i+1} - {file_name} (Score: {score:.3f}):\n"
             
-            # Limit content length
-            if len(content) > 1000:
-                context += content[:1000] + "...\n\n"
-            else:
-                context += content + "\n\n"
+            # The passages that matched the query, rather than the start of the document
+            context += doc.snippet(1000) + "\n\n"
         
         return context
 
@@ -402,7 +759,8 @@ if __name__ == "__main__":
         {"file_name": "doc3.txt", "content": "Web development involves creating websites and web applications."}
     ]
     
-    retriever = SimpleRetriever(sample_docs)
+    # Not cached: the cache directory holds one index, the app's, which these documents would replace
+    retriever = SimpleRetriever(sample_docs, use_cache=False)
     
     query = "What is Python used for?"
     relevant = retriever.retrieve_relevant_chunks(query)
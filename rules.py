@@ -0,0 +1,121 @@
+"""
+Declarative retrieval rules.
+
+Some questions need more than relevance ranking: a question about the SVB
+process should always see the SVB flow chart, and broad questions about
+competencies or services need more documents than usual. Rules say so as
+data instead of code:
+
+    {
+        "name": "svb-process",
+        "when": "svb|process flow chart",   # regex searched in the lowercased query
+        "pin": {"file_name": "*svb*"},      # metadata filter of documents put first
+        "limit": 1                          # how many of them
+    }
+
+A rule can also `boost` the documents matching a filter by `factor`, and
+raise the number of results with `extra_results`, up to `max_results`.
+
+Rules are compiled once, when the retriever starts, and the documents a
+rule selects are looked up in the metadata index (see metadata), so
+applying them costs a regex search per rule and no scan of the documents.
+They are read from the JSON file named by RETRIEVAL_RULES, or DEFAULT_RULES.
+"""
+
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+from metadata import Filters
+
+DEFAULT_RULES = [
+    {
+        "name": "svb-process",
+        "when": r"svb|process flow chart",
+        "pin": {"file_name": "*svb*"},
+        "limit": 1,
+    },
+    {
+        # Competency and capability questions need the complete picture
+        "name": "broad-questions",
+        "when": r"\b(competenc\w*|skills?|services?|capabilit\w*|core|all)\b",
+        "extra_results": 2,
+        "max_results": 10,
+    },
+]
+
+RULE_FIELDS = {'name', 'when', 'pin', 'limit', 'boost', 'factor', 'extra_results', 'max_results'}
+
+
+class Rule:
+    """
+    One compiled rule.
+
+    Attributes:
+        name (str): Name used in log messages
+        pattern (re.Pattern): Searched in the lowercased query
+        pin (Optional[Filters]): Documents to put first, as a metadata filter
+        limit (int): Largest number of documents pinned
+        boost (Optional[Filters]): Documents whose scores are multiplied by `factor`
+        factor (float): Boost factor
+        extra_results (int): Results added to the requested number
+        max_results (int): Cap on the number of results after `extra_results`
+    """
+
+    __slots__ = ('name', 'pattern', 'pin', 'limit', 'boost', 'factor', 'extra_results', 'max_results')
+
+    def __init__(self, spec: Dict):
+        unknown = set(spec) - RULE_FIELDS
+        if unknown or 'when' not in spec:
+            raise ValueError(f"Invalid retrieval rule {spec.get('name', spec)!r}: "
+                             f"needs 'when', unknown fields {sorted(unknown)}")
+        self.name = spec.get('name', spec['when'])
+        self.pattern = re.compile(spec['when'])
+        self.pin: Optional[Filters] = spec.get('pin')
+        self.limit = int(spec.get('limit', 1))
+        self.boost: Optional[Filters] = spec.get('boost')
+        self.factor = float(spec.get('factor', 1.5))
+        self.extra_results = int(spec.get('extra_results', 0))
+        self.max_results = int(spec.get('max_results', 0))
+
+    def __repr__(self) -> str:
+        return f"Rule({self.name!r})"
+
+
+class RuleSet:
+    """The compiled rules of a retriever."""
+
+    def __init__(self, specs: Optional[List[Dict]] = None):
+        """
+        Args:
+            specs (Optional[List[Dict]]): Rule definitions; from RETRIEVAL_RULES or DEFAULT_RULES by default
+        """
+        if specs is None:
+            specs = load_rules()
+        self.rules = [Rule(spec) for spec in specs]
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def matching(self, query: str) -> List[Rule]:
+        """Rules whose pattern occurs in the lowercased query."""
+        return [rule for rule in self.rules if rule.pattern.search(query.lower())]
+
+
+def result_count(rules: List[Rule], top_k: int) -> int:
+    """Number of results to return for a query matching `rules` when `top_k` were asked for."""
+    count = top_k
+    for rule in rules:
+        if rule.extra_results:
+            count = max(count, min(top_k + rule.extra_results, rule.max_results or top_k + rule.extra_results))
+    return count
+
+
+def load_rules(path: Optional[str] = None) -> List[Dict]:
+    """Read rule definitions from a JSON file (RETRIEVAL_RULES by default), or return DEFAULT_RULES."""
+    path = path or os.getenv('RETRIEVAL_RULES')
+    if not path:
+        return DEFAULT_RULES
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,1171 @@
+"""
+Segment-based incremental search index.
+
+Documents are indexed into small immutable segments, Lucene-style. Adding or
+changing documents writes a new segment, removing documents records tombstones
+against the segment that holds them, and a background merge compacts segments
+once too many have accumulated. Nothing is ever refit over the whole corpus.
+
+Scoring is TF-IDF cosine similarity. Document rows hold l2-normalised term
+frequencies, which never change once written, and the inverse document
+frequencies are applied on the query side from the live document counts.
+Retrieval selects the best k documents without scoring the whole corpus
+(see topk), and positional postings support phrase and proximity scoring
+(see proximity).
+
+On disk an index is a directory of plain .npy arrays that are opened with
+mmap, so loading is near-instant and worker processes share the same pages:
+
+    manifest.json             format version, index id, corpus version, live
+                              segments and the fingerprint of every live document
+    df.npy                    document frequency of every term
+    vocab_<n>/                compact term table (see TermTable)
+    entities_<n>/             term table of entity keys (see entities)
+    seg_<id>/                 float32 CSR arrays of one segment, the largest weight
+                              of each term, the token stream of every document
+                              (term ids and character offsets, for snippets),
+                              positional postings (for phrases and proximity),
+                              entity postings, its doc keys and tombstones
+
+Document text is never stored; the caller keeps the documents. Every file
+and directory is written atomically, and manifest.json is written last.
+
+Corpora larger than memory are indexed with `add_stream`, which reads
+documents from an iterator in batches of bounded size and spills every
+batch's segment to disk before reading the next. Merges never produce a
+segment larger than `max_segment_bytes`, so the memory a build needs
+depends on the batch and segment sizes, not on the size of the corpus.
+"""
+
+import hashlib
+import json
+import os
+import re
+import itertools
+import shutil
+import sys
+import threading
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from cache_manager import atomic_directory, atomic_file
+from entities import EntityPostings, extract_entities
+from fuzzy import TrigramIndex
+from proximity import phrase_window, proximity_score
+from topk import DEFAULT_BLOCK_SIZE, select_top_k, term_upper_bounds
+
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+INDEX_FORMAT_VERSION = 7
+
+# Document text read per segment by add_stream; tokenizing a batch needs several times its size
+STREAM_BATCH_BYTES = 16 * 1024 * 1024
+
+# Segments written by add_stream between two saves of the manifest, from which an interrupted build resumes
+STREAM_CHECKPOINT_BATCHES = 32
+
+# Largest segment a merge produces; merging needs about three times this in memory
+MAX_SEGMENT_BYTES = 256 * 1024 * 1024
+
+
+def analyze(text: str) -> List[str]:
+    """Split text into lowercase index terms, dropping English stop words."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in ENGLISH_STOP_WORDS]
+
+
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """
+    Like `analyze`, but with the start and end character offset of every term.
+
+    Offsets refer to the lowercased text, which lines up with the original
+    text except for the few characters whose lowercase form is longer.
+    """
+    return [(match.group(), match.start(), match.end()) for match in TOKEN_PATTERN.finditer(text.lower())
+            if match.group() not in ENGLISH_STOP_WORDS]
+
+
+def term_hash(term: str) -> int:
+    """Stable 64-bit hash of a term, used to look terms up in the on-disk table."""
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _compact_offsets(offsets: np.ndarray) -> np.ndarray:
+    """Offsets (ascending, as in CSR indptr arrays) as int32 where they fit, half the size of int64."""
+    offsets = np.asarray(offsets)
+    if not len(offsets) or offsets[-1] <= np.iinfo(np.int32).max:
+        return offsets.astype(np.int32, copy=False)
+    return offsets.astype(np.int64, copy=False)
+
+
+def _save_npy(path: str, array: np.ndarray):
+    with atomic_file(path) as f:
+        np.save(f, array)
+
+
+def _save_csr(directory: str, name: str, matrix: sparse.csr_matrix):
+    np.save(os.path.join(directory, f"{name}_data.npy"), matrix.data)
+    np.save(os.path.join(directory, f"{name}_indices.npy"), matrix.indices)
+    np.save(os.path.join(directory, f"{name}_indptr.npy"), matrix.indptr)
+
+
+def _load_csr(directory: str, name: str, shape: Tuple[int, int]) -> sparse.csr_matrix:
+    arrays = [np.load(os.path.join(directory, f"{name}_{part}.npy"), mmap_mode='r')
+              for part in ('data', 'indices', 'indptr')]
+    return sparse.csr_matrix(tuple(arrays), shape=shape)
+
+
+class TermTable:
+    """
+    Mapping of term to term id, backed by a compact memory-mapped table.
+
+    Terms saved to disk live in one UTF-8 blob with an offsets array, plus a
+    sorted array of term hashes for lookups. Terms added since the last save
+    are kept in a small in-memory overlay.
+    """
+
+    def __init__(self):
+        self._blob = np.zeros(0, dtype=np.uint8)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._hash_ids = np.zeros(0, dtype=np.int64)
+        self._added: Dict[str, int] = {}
+        self._added_terms: List[str] = []
+
+    @property
+    def base_size(self) -> int:
+        """Number of terms held in the saved table."""
+        return len(self._offsets) - 1
+
+    def __len__(self) -> int:
+        return self.base_size + len(self._added_terms)
+
+    def __contains__(self, term: str) -> bool:
+        return self.get(term) is not None
+
+    def __getitem__(self, term: str) -> int:
+        term_id = self.get(term)
+        if term_id is None:
+            raise KeyError(term)
+        return term_id
+
+    def get(self, term: str, default: Optional[int] = None) -> Optional[int]:
+        """Return the id of a term, or `default` if it is not in the table."""
+        term_id = self._added.get(term)
+        if term_id is not None:
+            return term_id
+        if self.base_size:
+            hashed = np.uint64(term_hash(term))
+            position = int(np.searchsorted(self._hashes, hashed))
+            while position < len(self._hashes) and self._hashes[position] == hashed:
+                candidate = int(self._hash_ids[position])
+                if self.term(candidate) == term:
+                    return candidate
+                position += 1
+        return default
+
+    def add(self, term: str) -> int:
+        """Return the id of a term, assigning a new one if needed."""
+        term_id = self.get(term)
+        if term_id is None:
+            term_id = len(self)
+            self._added[term] = term_id
+            self._added_terms.append(term)
+        return term_id
+
+    def term(self, term_id: int) -> str:
+        """Return the term with the given id."""
+        if term_id >= self.base_size:
+            return self._added_terms[term_id - self.base_size]
+        start, end = self._offsets[term_id], self._offsets[term_id + 1]
+        return bytes(self._blob[start:end]).decode('utf-8')
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the saved table's arrays, plus the strings and slots of the terms added since."""
+        overlay = sum(sys.getsizeof(term) for term in self._added_terms)
+        return (self._blob.nbytes + self._offsets.nbytes + self._hashes.nbytes + self._hash_ids.nbytes
+                + overlay + sys.getsizeof(self._added) + sys.getsizeof(self._added_terms))
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._added_terms)
+
+    def save(self, directory: str):
+        """Write the full table, saved and added terms, to a new directory."""
+        encoded = [term.encode('utf-8') for term in self._added_terms]
+        blob = np.concatenate([np.asarray(self._blob), np.frombuffer(b''.join(encoded), dtype=np.uint8)])
+        lengths = np.fromiter((len(term) for term in encoded), dtype=np.int64, count=len(encoded))
+        offsets = np.concatenate([np.asarray(self._offsets), self._offsets[-1] + np.cumsum(lengths)])
+        hashes = np.concatenate([
+            np.asarray(self._hashes)[np.argsort(self._hash_ids)],
+            np.fromiter((term_hash(term) for term in self._added_terms), dtype=np.uint64, count=len(encoded)),
+        ])
+        order = np.argsort(hashes, kind='stable')
+
+        with atomic_directory(directory) as tmp_dir:
+            np.save(os.path.join(tmp_dir, "terms.npy"), blob)
+            np.save(os.path.join(tmp_dir, "offsets.npy"), offsets)
+            np.save(os.path.join(tmp_dir, "hashes.npy"), hashes[order])
+            np.save(os.path.join(tmp_dir, "hash_ids.npy"), order.astype(np.int64))
+
+    @classmethod
+    def load(cls, directory: str) -> "TermTable":
+        """Open a saved table with its arrays memory-mapped."""
+        table = cls()
+        table._blob = np.load(os.path.join(directory, "terms.npy"), mmap_mode='r')
+        table._offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode='r')
+        table._hashes = np.load(os.path.join(directory, "hashes.npy"), mmap_mode='r')
+        table._hash_ids = np.load(os.path.join(directory, "hash_ids.npy"), mmap_mode='r')
+        return table
+
+
+class TokenStreams:
+    """
+    The tokens of every document of a segment, in document order.
+
+    Each token is its term id and its character offsets in the document.
+    Rows are stored CSR-style: the tokens of row r are indptr[r]:indptr[r + 1]
+    of the `terms`, `starts` and `ends` arrays.
+    """
+
+    def __init__(self, indptr: np.ndarray, terms: np.ndarray, starts: np.ndarray, ends: np.ndarray):
+        self.indptr = indptr
+        self.terms = terms
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def from_documents(cls, documents: List[Tuple[np.ndarray, np.ndarray, np.ndarray]]) -> "TokenStreams":
+        """Build the streams from (term ids, starts, ends) per document."""
+        lengths = np.fromiter((len(terms) for terms, _, _ in documents), dtype=np.int64, count=len(documents))
+        indptr = _compact_offsets(np.concatenate([[0], np.cumsum(lengths)]))
+        if not documents:
+            empty = np.zeros(0, dtype=np.int32)
+            return cls(indptr, empty, empty, empty)
+        return cls(indptr, *(np.concatenate([document[part] for document in documents]).astype(np.int32)
+                             for part in range(3)))
+
+    def document(self, row: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the (term ids, starts, ends) of one row."""
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return self.terms[start:end], self.starts[start:end], self.ends[start:end]
+
+    def positional_postings(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Invert the streams into the positions of every (term, row) pair.
+
+        The pairs come out ordered by term and then row, which is the order of
+        the entries of the segment's postings matrix, so posting i has the
+        token positions positions[indptr[i]:indptr[i + 1]].
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: indptr and positions
+        """
+        lengths = np.diff(self.indptr)
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        positions = np.arange(len(self.terms)) - np.repeat(self.indptr[:-1], lengths)
+        order = np.lexsort((positions, rows, self.terms))
+        terms, rows = np.asarray(self.terms)[order], rows[order]
+        boundaries = np.flatnonzero((np.diff(terms) != 0) | (np.diff(rows) != 0)) + 1
+        indptr = np.concatenate([[0], boundaries, [len(order)]]) if len(order) else np.zeros(1)
+        return _compact_offsets(indptr), positions[order].astype(np.int32)
+
+    def take(self, rows: np.ndarray) -> "TokenStreams":
+        """Return the streams of the given rows only, in that order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = (self.indptr[rows + 1] - self.indptr[rows]).astype(np.int64)
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        positions = np.repeat(self.indptr[rows] - indptr[:-1], lengths) + np.arange(indptr[-1])
+        return TokenStreams(_compact_offsets(indptr), self.terms[positions], self.starts[positions],
+                            self.ends[positions])
+
+    @staticmethod
+    def concatenate(streams: List["TokenStreams"]) -> "TokenStreams":
+        """Stack the rows of several streams."""
+        offsets = np.cumsum([0] + [int(stream.indptr[-1]) for stream in streams[:-1]])
+        indptr = np.concatenate([[0]] + [stream.indptr[1:].astype(np.int64) + offset
+                                         for stream, offset in zip(streams, offsets)])
+        return TokenStreams(_compact_offsets(indptr),
+                            np.concatenate([stream.terms for stream in streams]),
+                            np.concatenate([stream.starts for stream in streams]),
+                            np.concatenate([stream.ends for stream in streams]))
+
+    def save(self, directory: str):
+        for name in ('indptr', 'terms', 'starts', 'ends'):
+            np.save(os.path.join(directory, f"tokens_{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory: str) -> "TokenStreams":
+        """Open saved streams memory-mapped."""
+        return cls(*(np.load(os.path.join(directory, f"tokens_{name}.npy"), mmap_mode='r')
+                     for name in ('indptr', 'terms', 'starts', 'ends')))
+
+
+class Segment:
+    """
+    An immutable batch of indexed documents.
+
+    The only thing that changes after a segment is written is its tombstone
+    mask, and that is handled copy-on-write through `with_deletions`.
+    """
+
+    def __init__(self, segment_id: int, doc_keys: List[str], forward: sparse.csr_matrix,
+                 deleted: Optional[np.ndarray] = None, postings: Optional[sparse.csr_matrix] = None,
+                 max_weights: Optional[np.ndarray] = None, tokens: Optional[TokenStreams] = None,
+                 positions: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                 entities: Optional[EntityPostings] = None):
+        """
+        Args:
+            segment_id (int): Unique, increasing identifier of the segment
+            doc_keys (List[str]): Document key of every row
+            forward (sparse.csr_matrix): Documents x terms matrix of normalised term frequencies
+            deleted (Optional[np.ndarray]): Tombstone mask, one flag per row
+            postings (Optional[sparse.csr_matrix]): Terms x documents transpose of `forward`
+            max_weights (Optional[np.ndarray]): Largest weight of every term, the MaxScore bounds
+            tokens (Optional[TokenStreams]): Token positions of every row, used for snippets
+            positions (Optional[Tuple[np.ndarray, np.ndarray]]): Positional postings (indptr, positions),
+                built from `tokens` if not given
+            entities (Optional[EntityPostings]): Entities mentioned in every row
+        """
+        self.segment_id = segment_id
+        self.doc_keys = doc_keys
+        self.forward = forward
+        self.postings = postings if postings is not None else forward.T.tocsr()
+        self.max_weights = max_weights if max_weights is not None else term_upper_bounds(self.postings)
+        self.tokens = tokens
+        if positions is None and tokens is not None:
+            positions = tokens.positional_postings()
+        self.position_indptr, self.positions = positions if positions is not None else (None, None)
+        self.entities = entities
+        self.deleted = deleted if deleted is not None else np.zeros(len(doc_keys), dtype=bool)
+        self.path: Optional[str] = None
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_keys)
+
+    @property
+    def num_terms(self) -> int:
+        return self.forward.shape[1]
+
+    @property
+    def live_count(self) -> int:
+        return int(self.num_docs - self.deleted.sum())
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the segment's arrays, in memory or on disk."""
+        return sum(self.memory_usage().values())
+
+    def memory_usage(self) -> Dict[str, int]:
+        """
+        Size of the segment's arrays by use.
+
+        Returns:
+            Dict[str, int]: Bytes of the document 'vectors', the 'postings' (with max weights and
+                positions), the 'tokens' streams and the 'entities' postings
+        """
+        groups = {
+            'vectors': [self.forward.data, self.forward.indices, self.forward.indptr],
+            'postings': [self.postings.data, self.postings.indices, self.postings.indptr, self.max_weights],
+            'tokens': [],
+            'entities': [],
+        }
+        if self.tokens is not None:
+            groups['tokens'] += [self.tokens.indptr, self.tokens.terms, self.tokens.starts, self.tokens.ends]
+            groups['postings'] += [self.position_indptr, self.positions]
+        if self.entities is not None:
+            groups['entities'] += [self.entities.entities, self.entities.rows, self.entities.starts,
+                                   self.entities.ends]
+        return {name: sum(array.nbytes for array in arrays) for name, arrays in groups.items()}
+
+    def term_positions(self, term_id: int, row: int) -> np.ndarray:
+        """Token positions of a term in one row, empty if the row doesn't contain it."""
+        if self.positions is None or term_id >= self.num_terms:
+            return np.zeros(0, dtype=np.int32)
+        start, end = self.postings.indptr[term_id], self.postings.indptr[term_id + 1]
+        posting = start + int(np.searchsorted(self.postings.indices[start:end], row))
+        if posting == end or self.postings.indices[posting] != row:
+            return np.zeros(0, dtype=np.int32)
+        return self.positions[self.position_indptr[posting]:self.position_indptr[posting + 1]]
+
+    def with_deletions(self, rows: Iterable[int]) -> "Segment":
+        """Return a copy of this segment with the given rows tombstoned."""
+        deleted = self.deleted.copy()
+        deleted[list(rows)] = True
+        segment = Segment(self.segment_id, self.doc_keys, self.forward, deleted, self.postings, self.max_weights,
+                          self.tokens, (self.position_indptr, self.positions) if self.positions is not None else None,
+                          self.entities)
+        segment.path = self.path
+        return segment
+
+    def save(self, directory: str):
+        """Write the segment's arrays, doc keys and tombstones to a directory."""
+        if self.path == directory and os.path.isdir(directory):
+            _save_npy(os.path.join(directory, "deleted.npy"), self.deleted)
+            return
+        with atomic_directory(directory) as tmp_dir:
+            _save_csr(tmp_dir, "forward", self.forward)
+            _save_csr(tmp_dir, "postings", self.postings)
+            np.save(os.path.join(tmp_dir, "max_weights.npy"), self.max_weights)
+            if self.tokens is not None:
+                self.tokens.save(tmp_dir)
+                np.save(os.path.join(tmp_dir, "positions_indptr.npy"), self.position_indptr)
+                np.save(os.path.join(tmp_dir, "positions.npy"), self.positions)
+            if self.entities is not None:
+                self.entities.save(tmp_dir)
+            with open(os.path.join(tmp_dir, "doc_keys.json"), 'w', encoding='utf-8') as f:
+                json.dump(self.doc_keys, f, ensure_ascii=False)
+            np.save(os.path.join(tmp_dir, "deleted.npy"), self.deleted)
+
+    @classmethod
+    def load(cls, directory: str, segment_id: int, num_terms: int) -> "Segment":
+        """Open a saved segment with its matrices memory-mapped."""
+        with open(os.path.join(directory, "doc_keys.json"), 'r', encoding='utf-8') as f:
+            # Interned, so the keys are the same strings as the paths of the loaded documents (see documents)
+            doc_keys = [sys.intern(key) for key in json.load(f)]
+        deleted = np.load(os.path.join(directory, "deleted.npy"))
+        forward = _load_csr(directory, "forward", (len(doc_keys), num_terms))
+        postings = _load_csr(directory, "postings", (num_terms, len(doc_keys)))
+        max_weights = np.load(os.path.join(directory, "max_weights.npy"), mmap_mode='r')
+        tokens, positions = None, None
+        if os.path.exists(os.path.join(directory, "tokens_indptr.npy")):
+            tokens = TokenStreams.load(directory)
+            positions = (np.load(os.path.join(directory, "positions_indptr.npy"), mmap_mode='r'),
+                         np.load(os.path.join(directory, "positions.npy"), mmap_mode='r'))
+        entities = None
+        if os.path.exists(os.path.join(directory, "entity_entities.npy")):
+            entities = EntityPostings.load(directory)
+        segment = cls(segment_id, doc_keys, forward, deleted, postings, max_weights, tokens, positions, entities)
+        segment.path = directory
+        return segment
+
+
+class SegmentedIndex:
+    """
+    An incremental TF-IDF index made of immutable segments.
+
+    Readers take the current segment tuple without locking; writers build new
+    segments and swap the tuple in under a lock.
+    """
+
+    def __init__(self, merge_factor: int = 8, background_merge: bool = True,
+                 max_segment_bytes: int = MAX_SEGMENT_BYTES):
+        """
+        Args:
+            merge_factor (int): Number of segments that triggers a merge
+            background_merge (bool): Whether merges run on a background thread
+            max_segment_bytes (int): Largest segment a merge may produce
+        """
+        self.merge_factor = merge_factor
+        self.background_merge = background_merge
+        self.max_segment_bytes = max_segment_bytes
+        self.vocabulary = TermTable()
+        self.entities = TermTable()
+        self.fingerprints: Dict[str, str] = {}
+        # Term ids are only comparable between indexes with the same id (see clusters)
+        self.index_id = uuid.uuid4().hex
+        self.version = 0
+        self._segments: Tuple[Segment, ...] = ()
+        self._locations: Dict[str, Tuple[int, int]] = {}
+        self._df = np.zeros(0, dtype=np.int64)
+        self._next_segment_id = 0
+        self._vocabulary_dir: Optional[str] = None
+        self._entities_dir: Optional[str] = None
+        self._lock = threading.RLock()
+        self._merge_thread: Optional[threading.Thread] = None
+        self._trigrams: Optional[TrigramIndex] = None
+
+    @property
+    def segments(self) -> Tuple[Segment, ...]:
+        return self._segments
+
+    @property
+    def num_docs(self) -> int:
+        """Number of live documents in the index."""
+        return len(self._locations)
+
+    def __contains__(self, doc_key: str) -> bool:
+        return doc_key in self._locations
+
+    def doc_keys(self) -> List[str]:
+        """Keys of all live documents."""
+        return list(self._locations)
+
+    def add_documents(self, documents: List[Tuple[str, str, str]]) -> Optional[Segment]:
+        """
+        Index documents into a new segment.
+
+        Documents whose key is already indexed are replaced: the old row is
+        tombstoned and the new content goes into the new segment.
+
+        Args:
+            documents (List[Tuple[str, str, str]]): (key, content, fingerprint) triples
+
+        Returns:
+            Optional[Segment]: The new segment, or None if there was nothing to add
+        """
+        if not documents:
+            return None
+
+        with self._lock:
+            # Token stream of every document: term ids and character offsets in document order. Each
+            # document's tokens are packed into arrays as soon as it is tokenized, to keep batches small
+            term_ids: Dict[str, int] = {}
+            packed = []
+            for _, content, _ in documents:
+                tokens = tokenize(content)
+                packed.append((
+                    np.fromiter((term_ids[term] if term in term_ids else term_ids.setdefault(term, self.vocabulary.add(term))
+                                 for term, _, _ in tokens), dtype=np.int32, count=len(tokens)),
+                    np.fromiter((start for _, start, _ in tokens), dtype=np.int32, count=len(tokens)),
+                    np.fromiter((end for _, _, end in tokens), dtype=np.int32, count=len(tokens)),
+                ))
+            streams = TokenStreams.from_documents(packed)
+            del packed
+
+            indptr = [0]
+            indices = []
+            counts = []
+            for row in range(len(documents)):
+                ids, freqs = np.unique(streams.document(row)[0], return_counts=True)
+                indices.append(ids)
+                counts.append(freqs)
+                indptr.append(indptr[-1] + len(ids))
+
+            forward = sparse.csr_matrix(
+                (np.concatenate(counts).astype(np.float64), np.concatenate(indices), np.asarray(indptr)),
+                shape=(len(documents), len(self.vocabulary)),
+            )
+            norms = np.sqrt(np.asarray(forward.multiply(forward).sum(axis=1)).ravel())
+            norms[norms == 0] = 1.0
+            forward = sparse.diags(1.0 / norms).dot(forward).tocsr().astype(np.float32)
+
+            entities = EntityPostings.from_rows([
+                [(self.entities.add(key), start, end) for key, start, end in extract_entities(content)]
+                for _, content, _ in documents
+            ])
+
+            doc_keys = [key for key, _, _ in documents]
+            self._delete_locked(doc_keys)
+
+            segment = Segment(self._next_segment_id, doc_keys, forward, tokens=streams, entities=entities)
+            self._next_segment_id += 1
+            self._segments = self._segments + (segment,)
+            for row, (key, _, fingerprint) in enumerate(documents):
+                self._locations[key] = (segment.segment_id, row)
+                self.fingerprints[key] = fingerprint
+            self._grow_df()
+            self._df[:segment.num_terms] += np.bincount(forward.indices, minlength=segment.num_terms)
+            self.version += 1
+
+        self._maybe_merge()
+        return segment
+
+    def delete_documents(self, doc_keys: Iterable[str]) -> int:
+        """
+        Tombstone documents by key.
+
+        Returns:
+            int: Number of documents that were removed
+        """
+        with self._lock:
+            removed = self._delete_locked(doc_keys)
+            if removed:
+                self.version += 1
+        return removed
+
+    def _delete_locked(self, doc_keys: Iterable[str]) -> int:
+        rows_by_segment: Dict[int, List[int]] = {}
+        for key in doc_keys:
+            location = self._locations.pop(key, None)
+            if location is None:
+                continue
+            self.fingerprints.pop(key, None)
+            rows_by_segment.setdefault(location[0], []).append(location[1])
+
+        if not rows_by_segment:
+            return 0
+
+        segments = []
+        for segment in self._segments:
+            rows = rows_by_segment.get(segment.segment_id)
+            if rows:
+                removed = segment.forward[rows]
+                self._df[:segment.num_terms] -= np.bincount(removed.indices, minlength=segment.num_terms)
+                segment = segment.with_deletions(rows)
+            if segment.live_count:
+                segments.append(segment)
+        self._segments = tuple(segments)
+        return sum(len(rows) for rows in rows_by_segment.values())
+
+    def _grow_df(self):
+        if len(self._df) < len(self.vocabulary):
+            grown = np.zeros(len(self.vocabulary), dtype=np.int64)
+            grown[:len(self._df)] = self._df
+            self._df = grown
+
+    def diff(self, manifest: Dict[str, str]) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Compare the index against a manifest of document fingerprints.
+
+        Only fingerprints are compared, so this is cheap no matter how large
+        the documents are.
+
+        Args:
+            manifest (Dict[str, str]): Mapping of document key to fingerprint
+
+        Returns:
+            Tuple[List[str], List[str], List[str]]: Added, changed and removed keys
+        """
+        added, changed = [], []
+        for key, fingerprint in manifest.items():
+            indexed = self.fingerprints.get(key)
+            if indexed is None:
+                added.append(key)
+            elif indexed != fingerprint:
+                changed.append(key)
+        removed = [key for key in self.fingerprints if key not in manifest]
+        return added, changed, removed
+
+    def sync(self, documents: Dict[str, Tuple[str, str]]) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Bring the index in line with a full set of documents.
+
+        Only documents that are new or whose fingerprint changed are indexed;
+        documents that disappeared are tombstoned.
+
+        Args:
+            documents (Dict[str, Tuple[str, str]]): Mapping of key to (content, fingerprint)
+
+        Returns:
+            Tuple[List[str], List[str], List[str]]: Added, changed and removed keys
+        """
+        added, changed, removed = self.diff({key: fingerprint for key, (_, fingerprint) in documents.items()})
+
+        if removed:
+            self.delete_documents(removed)
+        if added or changed:
+            self.add_documents([(key, documents[key][0], documents[key][1]) for key in added + changed])
+        return added, changed, removed
+
+    def add_stream(self, documents: Iterable[Tuple[str, str, str]], directory: Optional[str] = None,
+                   batch_bytes: int = STREAM_BATCH_BYTES) -> int:
+        """
+        Index documents read from an iterator, for corpora that don't fit in memory.
+
+        Documents are indexed in batches of about `batch_bytes` of text, each
+        into its own segment. With a `directory`, every segment is written
+        there and reopened memory-mapped before the next batch is read, and
+        the index is saved every few batches; documents the index already
+        holds with the same fingerprint are skipped, so an interrupted build
+        picks up where its last save left off.
+
+        Args:
+            documents (Iterable[Tuple[str, str, str]]): (key, content, fingerprint) triples, e.g. from a generator
+            directory (Optional[str]): Where to save the index; without one, segments stay in memory
+            batch_bytes (int): Characters of text per segment
+
+        Returns:
+            int: Number of documents indexed
+        """
+        batch, batch_size, num_batches, indexed = [], 0, 0, 0
+        for document in itertools.chain(documents, [None]):
+            if document is not None:
+                key, content, fingerprint = document
+                if self.fingerprints.get(key) == fingerprint:
+                    continue
+                batch.append(document)
+                batch_size += len(content)
+                if batch_size < batch_bytes:
+                    continue
+            if not batch:
+                continue
+            self.add_documents(batch)
+            indexed += len(batch)
+            num_batches += 1
+            batch, batch_size = [], 0
+            if directory is not None:
+                if num_batches % STREAM_CHECKPOINT_BATCHES == 0:
+                    self.save(directory)
+                else:
+                    self._spill(directory)
+
+        if directory is not None and indexed:
+            self.wait_for_merges()
+            self.save(directory)
+        return indexed
+
+    def idf(self) -> np.ndarray:
+        """Smoothed inverse document frequency of every term over live documents."""
+        n = self.num_docs
+        return np.log((1.0 + n) / (1.0 + self._df)) + 1.0
+
+    def memory_usage(self) -> Dict[str, int]:
+        """
+        Bytes the index uses, by part.
+
+        Arrays of saved segments are memory-mapped: they are counted in full,
+        though the OS only keeps the pages in use resident. Python objects
+        (keys, fingerprints, the terms added since the last save) are counted
+        with sys.getsizeof, so their share is an estimate.
+
+        Returns:
+            Dict[str, int]: Bytes of the 'vocabulary' (terms, entity keys and document frequencies),
+                the 'postings', the document 'vectors', the 'tokens' streams, the 'entities' postings
+                and the document 'keys'
+        """
+        segments = self._segments
+        usage = {'vocabulary': self.vocabulary.nbytes + self.entities.nbytes + self._df.nbytes,
+                 'postings': 0, 'vectors': 0, 'tokens': 0, 'entities': 0}
+        for segment in segments:
+            for name, nbytes in segment.memory_usage().items():
+                usage[name] += nbytes
+        # Keys are shared between the segments, the locations and the fingerprints, so they are counted once
+        keys = sum(sys.getsizeof(key) for key in self._locations)
+        containers = (sys.getsizeof(self._locations) + sys.getsizeof(self.fingerprints)
+                      + sum(sys.getsizeof(segment.doc_keys) for segment in segments))
+        fingerprints = sum(sys.getsizeof(fingerprint) for fingerprint in self.fingerprints.values())
+        usage['keys'] = keys + containers + fingerprints + len(self._locations) * sys.getsizeof((0, 0))
+        return usage
+
+    def query_vectors(self, queries: List[str]) -> sparse.csr_matrix:
+        """Build the normalised TF-IDF vectors of queries over the current vocabulary, one row per query."""
+        num_docs = self.num_docs
+        indptr, indices, weights = [0], [], []
+        for query in queries:
+            term_ids = [term_id for term_id in map(self.vocabulary.get, analyze(query)) if term_id is not None]
+            if term_ids:
+                ids, freqs = np.unique(term_ids, return_counts=True)
+                row = freqs * (np.log((1.0 + num_docs) / (1.0 + self._df[ids])) + 1.0)
+                indices.append(ids)
+                weights.append((row / np.linalg.norm(row)).astype(np.float32))
+            indptr.append(indptr[-1] + (len(indices[-1]) if term_ids else 0))
+        if not indices:
+            return sparse.csr_matrix((len(queries), len(self.vocabulary)), dtype=np.float32)
+        return sparse.csr_matrix(
+            (np.concatenate(weights), np.concatenate(indices), np.asarray(indptr)),
+            shape=(len(queries), len(self.vocabulary)),
+        )
+
+    def query_vector(self, query: str) -> sparse.csr_matrix:
+        """Build the normalised TF-IDF vector of a query over the current vocabulary."""
+        return self.query_vectors([query])
+
+    def term_variants(self, text: str) -> Dict[str, List[str]]:
+        """
+        Find near variants of the terms of a text in the vocabulary, for typo and OCR tolerance (see fuzzy).
+
+        The trigram index over the vocabulary is built on first use and
+        extended with the terms added since on every later call.
+
+        Returns:
+            Dict[str, List[str]]: Variants of every analysed term of the text that has any
+        """
+        with self._lock:
+            if self._trigrams is None:
+                self._trigrams = TrigramIndex()
+            self._trigrams.update(self.vocabulary)
+            trigrams, df = self._trigrams, self._df
+        variants = {}
+        for term in dict.fromkeys(analyze(text)):
+            found = trigrams.variants(term, self.vocabulary, df)
+            if found:
+                variants[term] = found
+        return variants
+
+    def _find(self, doc_key: str) -> Optional[Tuple[Segment, int]]:
+        """Return the segment and row of a live document."""
+        location = self._locations.get(doc_key)
+        if location is None:
+            return None
+        for segment in self._segments:
+            if segment.segment_id == location[0]:
+                return segment, location[1]
+        return None
+
+    def query_terms(self, text: str) -> List[int]:
+        """Ids of the distinct indexed terms of a text, in order of first occurrence."""
+        term_ids = (self.vocabulary.get(term) for term in analyze(text))
+        return list(dict.fromkeys(term_id for term_id in term_ids if term_id is not None))
+
+    def document_tokens(self, doc_key: str) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Return the token stream of a live document.
+
+        Returns:
+            Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]: Term ids, start and end offsets of its
+                tokens in order, or None if the document is not indexed
+        """
+        found = self._find(doc_key)
+        if found is None or found[0].tokens is None:
+            return None
+        return found[0].tokens.document(found[1])
+
+    def document_vectors(self, doc_keys: List[str]) -> sparse.csr_matrix:
+        """Build the normalised TF-IDF vectors of documents, one row per key; empty rows for keys not indexed."""
+        num_terms = len(self.vocabulary)
+        indptr, indices, weights = [0], [], []
+        idf = self.idf()
+        for doc_key in doc_keys:
+            found = self._find(doc_key)
+            if found is not None:
+                segment, row = found
+                start, end = segment.forward.indptr[row], segment.forward.indptr[row + 1]
+                ids = segment.forward.indices[start:end]
+                row_weights = segment.forward.data[start:end] * idf[ids]
+                indices.append(ids)
+                weights.append((row_weights / max(np.linalg.norm(row_weights), 1e-12)).astype(np.float32))
+            indptr.append(indptr[-1] + (len(indices[-1]) if found is not None else 0))
+        if not indices:
+            return sparse.csr_matrix((len(doc_keys), num_terms), dtype=np.float32)
+        return sparse.csr_matrix(
+            (np.concatenate(weights), np.concatenate(indices), np.asarray(indptr)),
+            shape=(len(doc_keys), num_terms),
+        )
+
+    def proximity_scores(self, query: str, doc_keys: Iterable[str]) -> Dict[str, float]:
+        """
+        Score how close together the query terms occur in each document (see proximity).
+
+        Returns:
+            Dict[str, float]: Proximity score from 0 to 1 per document key; empty for one-term queries
+        """
+        term_ids = self.query_terms(query)
+        if len(term_ids) < 2:
+            return {}
+        scores = {}
+        for key in doc_keys:
+            found = self._find(key)
+            if found is not None:
+                segment, row = found
+                scores[key] = proximity_score([segment.term_positions(term_id, row) for term_id in term_ids])
+        return scores
+
+    def phrase_search(self, phrase: str, slop: int = 0) -> Dict[str, Tuple[int, int]]:
+        """
+        Find the live documents containing a phrase.
+
+        Candidates are the documents whose postings hold every term of the
+        phrase, rarest term first; only those are checked positionally.
+
+        Args:
+            phrase (str): The phrase; stop words in it are ignored, as in the index
+            slop (int): Extra tokens allowed inside the phrase
+
+        Returns:
+            Dict[str, Tuple[int, int]]: Character span of the tightest occurrence per document key
+        """
+        term_ids = [self.vocabulary.get(term) for term in analyze(phrase)]
+        if not term_ids or None in term_ids:
+            return {}
+
+        matches = {}
+        for segment in self._segments:
+            if segment.positions is None or max(term_ids) >= segment.num_terms:
+                continue
+            indptr, indices = segment.postings.indptr, segment.postings.indices
+            rows = None
+            for term_id in sorted(set(term_ids), key=lambda term_id: indptr[term_id + 1] - indptr[term_id]):
+                term_rows = np.asarray(indices[indptr[term_id]:indptr[term_id + 1]])
+                rows = term_rows if rows is None else np.intersect1d(rows, term_rows, assume_unique=True)
+                if not len(rows):
+                    break
+            rows = rows[~segment.deleted[rows]]
+
+            for row in rows.tolist():
+                window = phrase_window([segment.term_positions(term_id, row) for term_id in term_ids], slop)
+                if window is not None:
+                    _, starts, ends = segment.tokens.document(row)
+                    matches[segment.doc_keys[row]] = (int(starts[window[0]]), int(ends[window[1]]))
+        return matches
+
+    def entity_search(self, entity_key: str) -> Dict[str, Tuple[int, int]]:
+        """
+        Find the live documents mentioning an entity (see entities).
+
+        Args:
+            entity_key (str): Normalised entity, e.g. 'date:2024-03' or 'id:inv-2023-001'
+
+        Returns:
+            Dict[str, Tuple[int, int]]: Character span of the first mention per document key
+        """
+        entity_id = self.entities.get(entity_key)
+        if entity_id is None:
+            return {}
+        matches = {}
+        for segment in self._segments:
+            if segment.entities is None:
+                continue
+            rows, starts, ends = segment.entities.find(entity_id)
+            for row, start, end in zip(rows.tolist(), starts.tolist(), ends.tolist()):
+                if not segment.deleted[row]:
+                    matches[segment.doc_keys[row]] = (start, end)
+        return matches
+
+    def score(self, query: str) -> Dict[str, float]:
+        """
+        Score every live document against a query.
+
+        Returns:
+            Dict[str, float]: Cosine similarity per document key, only for non-zero scores
+        """
+        return self.score_many([query])[0]
+
+    def score_many(self, queries: List[str]) -> List[Dict[str, float]]:
+        """
+        Score every live document against a batch of queries.
+
+        All queries are scored together with one sparse matrix product per
+        segment, so the postings of a segment are walked once per batch.
+
+        Returns:
+            List[Dict[str, float]]: Per query, cosine similarity per document key for non-zero scores
+        """
+        segments = self._segments
+        query_vectors = self.query_vectors(queries)
+        scores: List[Dict[str, float]] = [{} for _ in queries]
+        if query_vectors.nnz == 0:
+            return scores
+
+        for segment in segments:
+            similarities = (query_vectors[:, :segment.num_terms] @ segment.postings).tocsr()
+            for query_row in range(len(queries)):
+                start, end = similarities.indptr[query_row], similarities.indptr[query_row + 1]
+                rows = similarities.indices[start:end]
+                values = similarities.data[start:end]
+                keep = (values > 0) & ~segment.deleted[rows]
+                scores[query_row].update(zip(
+                    [segment.doc_keys[row] for row in rows[keep].tolist()], values[keep].tolist()
+                ))
+        return scores
+
+    def top_k(self, queries: List[str], k: int, early_termination: bool = True,
+              block_size: int = DEFAULT_BLOCK_SIZE, shard: Tuple[int, int] = (0, 1),
+              row_filter: Optional[Callable[[Segment], np.ndarray]] = None) -> List[Dict[str, float]]:
+        """
+        Find the k most similar live documents for each of a batch of queries.
+
+        Unlike `score_many`, only the best k documents are ever held, scoring
+        runs in float32 blocks, and with `early_termination` documents that
+        cannot make the top k are pruned with MaxScore bounds (see topk).
+        With `shard` set to (i, n), only shard i of n of every segment's rows is searched.
+        With `row_filter`, only the rows of each segment it allows are (see metadata).
+
+        Returns:
+            List[Dict[str, float]]: Per query, up to k document keys with their cosine similarity, best first
+        """
+        return [{key: score for score, _, _, key in hits}
+                for hits in self.top_k_hits(queries, k, early_termination, block_size, shard, row_filter)]
+
+    def top_k_hits(self, queries: List[str], k: int, early_termination: bool = True,
+                   block_size: int = DEFAULT_BLOCK_SIZE, shard: Tuple[int, int] = (0, 1),
+                   row_filter: Optional[Callable[[Segment], np.ndarray]] = None
+                   ) -> List[List[Tuple[float, int, int, str]]]:
+        """
+        Like `top_k`, but every hit also carries where it is in the index.
+
+        Returns:
+            List[List[Tuple[float, int, int, str]]]: Per query, (score, segment position, row, key), best first
+        """
+        segments = self._segments
+        query_vectors = self.query_vectors(queries)
+        if row_filter is not None:
+            # The masks are the same for every query of the batch
+            masks = {segment.segment_id: row_filter(segment) for segment in segments}
+            row_filter = lambda segment: masks[segment.segment_id]
+        results = []
+        for query_row in range(len(queries)):
+            start, end = query_vectors.indptr[query_row], query_vectors.indptr[query_row + 1]
+            scores, positions, rows = select_top_k(
+                segments, query_vectors.indices[start:end], query_vectors.data[start:end], k,
+                early_termination, block_size, shard, row_filter,
+            )
+            results.append([
+                (score, position, row, segments[position].doc_keys[row])
+                for score, position, row in zip(scores.tolist(), positions.tolist(), rows.tolist())
+            ])
+        return results
+
+    def _maybe_merge(self):
+        if len(self._segments) <= self.merge_factor:
+            return
+        if not self.background_merge:
+            self.merge(self.merge_factor)
+            return
+        with self._lock:
+            if self._merge_thread is not None and self._merge_thread.is_alive():
+                return
+            self._merge_thread = threading.Thread(
+                target=self.merge, args=(self.merge_factor,), name="segment-merge", daemon=True
+            )
+            self._merge_thread.start()
+
+    def wait_for_merges(self):
+        """Block until any running background merge has finished."""
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+
+    def merge(self, max_segments: Optional[int] = None):
+        """
+        Merge the smallest segments into one, dropping tombstoned rows.
+
+        Only as many segments are merged as fit in `max_segment_bytes`.
+
+        Args:
+            max_segments (Optional[int]): How many segments to merge; all of them by default
+        """
+        limit = max_segments or len(self._segments)
+        sources, merged_bytes = [], 0
+        for segment in sorted(self._segments, key=lambda segment: segment.live_count):
+            live_bytes = segment.nbytes * segment.live_count // max(segment.num_docs, 1)
+            if len(sources) == limit or merged_bytes + live_bytes > self.max_segment_bytes:
+                break
+            sources.append(segment)
+            merged_bytes += live_bytes
+        if len(sources) < 2:
+            return
+
+        num_terms = max(segment.num_terms for segment in sources)
+        blocks, streams, entities, doc_keys, row_maps = [], [], [], [], []
+        for segment in sources:
+            live = np.flatnonzero(~segment.deleted)
+            block = segment.forward[live]
+            block.resize((len(live), num_terms))
+            blocks.append(block)
+            if segment.tokens is not None:
+                streams.append(segment.tokens.take(live))
+            if segment.entities is not None:
+                entities.append(segment.entities.take(live))
+            row_maps.append(dict(zip(live.tolist(), range(len(doc_keys), len(doc_keys) + len(live)))))
+            doc_keys.extend(segment.doc_keys[row] for row in live)
+        forward = sparse.vstack(blocks, format='csr')
+        tokens = TokenStreams.concatenate(streams) if len(streams) == len(sources) else None
+        if len(entities) == len(sources):
+            entities = EntityPostings.concatenate(entities, [block.shape[0] for block in blocks])
+        else:
+            entities = None
+
+        with self._lock:
+            current = {segment.segment_id: segment for segment in self._segments}
+            if any(segment.segment_id not in current for segment in sources):
+                return  # A concurrent writer dropped one of the sources; try again later
+
+            merged = Segment(self._next_segment_id, doc_keys, forward, tokens=tokens, entities=entities)
+            self._next_segment_id += 1
+
+            # Carry over deletions that happened while the merge was running
+            late_deletions = []
+            for segment, row_map in zip(sources, row_maps):
+                now_deleted = current[segment.segment_id].deleted & ~segment.deleted
+                late_deletions.extend(row_map[row] for row in np.flatnonzero(now_deleted).tolist())
+            if late_deletions:
+                merged = merged.with_deletions(late_deletions)
+
+            source_ids = {segment.segment_id for segment in sources}
+            self._segments = tuple(s for s in self._segments if s.segment_id not in source_ids) + (merged,)
+            for row, key in enumerate(doc_keys):
+                if not merged.deleted[row]:
+                    self._locations[key] = (merged.segment_id, row)
+            print(f"🧩 Merged {len(sources)} index segments into one ({merged.live_count} documents)")
+
+    def save(self, directory: str):
+        """
+        Persist the index to a directory.
+
+        Only segments that are not on disk yet are written; existing segments
+        just get their tombstones refreshed. The manifest is written last, so a
+        reader never sees a half-written index.
+        """
+        with self._lock:
+            os.makedirs(directory, exist_ok=True)
+
+            if self.vocabulary.dirty or self._vocabulary_dir is None:
+                vocabulary_dir = f"vocab_{self.version}"
+                self.vocabulary.save(os.path.join(directory, vocabulary_dir))
+                self.vocabulary = TermTable.load(os.path.join(directory, vocabulary_dir))
+                self._vocabulary_dir = vocabulary_dir
+
+            if self.entities.dirty or self._entities_dir is None:
+                entities_dir = f"entities_{self.version}"
+                self.entities.save(os.path.join(directory, entities_dir))
+                self.entities = TermTable.load(os.path.join(directory, entities_dir))
+                self._entities_dir = entities_dir
+
+            self._spill(directory)
+            _save_npy(os.path.join(directory, "df.npy"), self._df)
+
+            manifest = {
+                'format_version': INDEX_FORMAT_VERSION,
+                'index_id': self.index_id,
+                'corpus_version': self.version,
+                'num_docs': self.num_docs,
+                'next_segment_id': self._next_segment_id,
+                'vocabulary': self._vocabulary_dir,
+                'entities': self._entities_dir,
+                'segments': [{'id': s.segment_id, 'num_terms': s.num_terms} for s in self._segments],
+                'documents': self.fingerprints,
+            }
+            with atomic_file(os.path.join(directory, "manifest.json"), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+            # Drop segments and vocabularies the manifest no longer refers to
+            live = {f"seg_{s.segment_id}" for s in self._segments} | {self._vocabulary_dir, self._entities_dir}
+            for name in os.listdir(directory):
+                if name.startswith(("seg_", "vocab_", "entities_")) and name not in live:
+                    shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+    def _spill(self, directory: str):
+        """Write the segments to a directory and reopen the ones that were in memory memory-mapped."""
+        with self._lock:
+            os.makedirs(directory, exist_ok=True)
+            segments = []
+            for segment in self._segments:
+                segment_dir = os.path.join(directory, f"seg_{segment.segment_id}")
+                segment.save(segment_dir)
+                if segment.path != segment_dir:
+                    segment = Segment.load(segment_dir, segment.segment_id, segment.num_terms)
+                segments.append(segment)
+            self._segments = tuple(segments)
+
+    @classmethod
+    def load(cls, directory: str, **kwargs) -> Optional["SegmentedIndex"]:
+        """
+        Open an index saved with `save`.
+
+        Returns:
+            Optional[SegmentedIndex]: The index, or None if there is none or its format is outdated
+        """
+        manifest_path = os.path.join(directory, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format_version') != INDEX_FORMAT_VERSION:
+            print(f"🔄 Index format {manifest.get('format_version')} is outdated, rebuilding")
+            return None
+
+        index = cls(**kwargs)
+        index.index_id = manifest['index_id']
+        index.version = manifest['corpus_version']
+        index._next_segment_id = manifest['next_segment_id']
+        index._vocabulary_dir = manifest['vocabulary']
+        index.vocabulary = TermTable.load(os.path.join(directory, manifest['vocabulary']))
+        index._entities_dir = manifest['entities']
+        index.entities = TermTable.load(os.path.join(directory, manifest['entities']))
+        index._df = np.load(os.path.join(directory, "df.npy"))
+        index.fingerprints = manifest['documents']
+
+        segments = []
+        for entry in manifest['segments']:
+            segment = Segment.load(os.path.join(directory, f"seg_{entry['id']}"), entry['id'], entry['num_terms'])
+            for row in np.flatnonzero(~segment.deleted).tolist():
+                index._locations[segment.doc_keys[row]] = (segment.segment_id, row)
+            segments.append(segment)
+        index._segments = tuple(segments)
+        return index
@@ -0,0 +1,125 @@
+"""
+Sharded search across local worker processes.
+
+A single process scores a query on one core. ShardedSearcher starts N
+worker processes that each open the saved index (memory-mapped, so the
+pages are shared rather than copied) and own one shard: a fixed 1/N slice
+of the rows of every segment. A batch of queries is sent to every worker at
+once, each worker returns the top k of its shard, and the parent merges them
+into the global top k.
+
+All workers read the same df.npy, so every shard scores with the global
+document frequencies and the merged ranking is identical to the
+single-process one.
+"""
+
+import multiprocessing
+import threading
+from typing import Dict, List, Tuple
+
+# (score, segment position, row, document key)
+ShardHit = Tuple[float, int, int, str]
+
+
+def _serve_shard(connection, index_dir: str, shard: int, num_shards: int):
+    """Worker loop: answer top-k requests for one shard until told to stop."""
+    from segment_index import SegmentedIndex
+
+    index = None
+    while True:
+        request = connection.recv()
+        if request is None:
+            return
+        version, queries, k, early_termination = request
+        try:
+            if index is None or index.version != version:
+                index = SegmentedIndex.load(index_dir, background_merge=False)
+                if index is None or index.version != version:
+                    raise RuntimeError(f"index on disk is not at version {version}")
+            connection.send(('ok', index.top_k_hits(queries, k, early_termination, shard=(shard, num_shards))))
+        except Exception as e:
+            index = None
+            connection.send(('error', f"shard {shard}: {e}"))
+
+
+class ShardedSearcher:
+    """
+    Pool of worker processes that each search one shard of a saved index.
+
+    Exposes `top_k` with the same results as SegmentedIndex.top_k, for the
+    index version saved in `index_dir`.
+    """
+
+    def __init__(self, index_dir: str, num_shards: int):
+        """
+        Args:
+            index_dir (str): Directory the index is saved in
+            num_shards (int): Number of worker processes
+        """
+        self.index_dir = index_dir
+        self.num_shards = num_shards
+        self._lock = threading.Lock()
+        self._connections = []
+        self._workers = []
+
+        # spawn, not fork: the parent may be running threads (Streamlit, merges)
+        context = multiprocessing.get_context('spawn')
+        for shard in range(num_shards):
+            parent_end, child_end = context.Pipe()
+            worker = context.Process(
+                target=_serve_shard, args=(child_end, index_dir, shard, num_shards),
+                name=f"index-shard-{shard}", daemon=True,
+            )
+            worker.start()
+            child_end.close()
+            self._connections.append(parent_end)
+            self._workers.append(worker)
+        print(f"🧮 Started {num_shards} index shard workers")
+
+    def top_k(self, queries: List[str], k: int, version: int,
+              early_termination: bool = True) -> List[Dict[str, float]]:
+        """
+        Find the k most similar documents for each query across all shards.
+
+        Args:
+            queries (List[str]): Queries to search
+            k (int): Number of documents per query
+            version (int): Index version the results must come from; workers reload to it
+            early_termination (bool): Whether workers prune with MaxScore bounds
+
+        Returns:
+            List[Dict[str, float]]: Per query, up to k document keys with their score, best first
+
+        Raises:
+            RuntimeError: If a worker failed, e.g. because the index on disk is at another version
+        """
+        with self._lock:
+            # Fan out to every shard first so they work in parallel, then gather
+            for connection in self._connections:
+                connection.send((version, queries, k, early_termination))
+            replies = [connection.recv() for connection in self._connections]
+
+        errors = [reply for status, reply in replies if status != 'ok']
+        if errors:
+            raise RuntimeError("; ".join(errors))
+
+        results = []
+        for query_row in range(len(queries)):
+            hits: List[ShardHit] = [hit for _, shard_hits in replies for hit in shard_hits[query_row]]
+            # Same order as a single process: score, then position in the index
+            hits.sort(key=lambda hit: (-hit[0], hit[1], hit[2]))
+            results.append({key: score for score, _, _, key in hits[:k]})
+        return results
+
+    def close(self):
+        """Stop the worker processes."""
+        with self._lock:
+            for connection, worker in zip(self._connections, self._workers):
+                try:
+                    connection.send(None)
+                except OSError:
+                    pass
+                worker.join(timeout=5)
+                if worker.is_alive():
+                    worker.terminate()
+            self._connections, self._workers = [], []
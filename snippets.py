@@ -0,0 +1,129 @@
+"""
+Best-passage snippets.
+
+The index records the term id and character offsets of every token of
+every document (see TokenStreams in segment_index), so the passages of a
+document that match a query are found without rescanning its text: the
+tokens of the query terms are picked out of the document's token stream,
+every window of WINDOW_TOKENS tokens that starts at one of them is scored by
+the query weights of the terms it contains, and the best windows that don't
+overlap are cut out of the text as passages.
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+
+# Size of a passage in tokens (stop words not counted)
+WINDOW_TOKENS = 40
+
+# Repeats of a term in a window count for this fraction of its weight
+REPEAT_WEIGHT = 0.1
+
+
+class Passage:
+    """
+    A piece of a document that matched a query.
+
+    Attributes:
+        start (int): Offset of the passage in the document
+        end (int): End offset of the passage in the document
+        text (str): The passage, with '…' where it was cut out of the surrounding text
+        score (float): How densely the passage matches the query
+        highlights (List[Tuple[int, int]]): Spans of the query terms, relative to `text`
+    """
+
+    __slots__ = ('start', 'end', 'text', 'score', 'highlights')
+
+    def __init__(self, start: int, end: int, text: str, score: float, highlights: List[Tuple[int, int]]):
+        self.start = start
+        self.end = end
+        self.text = text
+        self.score = score
+        self.highlights = highlights
+
+    def highlighted(self, before: str = "**", after: str = "**") -> str:
+        """Return the text with every query term wrapped in `before` and `after` (Markdown bold by default)."""
+        parts = []
+        position = 0
+        for start, end in self.highlights:
+            parts.extend([self.text[position:start], before, self.text[start:end], after])
+            position = end
+        parts.append(self.text[position:])
+        return "".join(parts)
+
+    def __repr__(self) -> str:
+        return f"Passage({self.start}:{self.end}, score={self.score:.3f})"
+
+
+def _cut(content: str, first: int, last: int, max_chars: int) -> Tuple[int, int]:
+    """Widen the span [first, last) to about max_chars, or trim it to max_chars, on word boundaries."""
+    if last - first >= max_chars:
+        start, end, inner = first, first + max_chars, first
+    else:
+        padding = (max_chars - (last - first)) // 2
+        start, end, inner = max(0, first - padding), min(len(content), last + padding), last
+    if start < first:
+        space = content.find(" ", start, first)
+        start = space + 1 if space != -1 else start
+    if end < len(content):
+        space = content.rfind(" ", inner, end)
+        end = space if space > start else end
+    return start, end
+
+
+def best_passages(content: str, terms: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+                  query_ids: np.ndarray, query_weights: np.ndarray,
+                  max_passages: int = 3, max_chars: int = 400) -> List[Passage]:
+    """
+    Find the passages of a document where the query terms are densest.
+
+    Args:
+        content (str): Text of the document
+        terms (np.ndarray): Term id of every token of the document, in order
+        starts (np.ndarray): Start offset of every token
+        ends (np.ndarray): End offset of every token
+        query_ids (np.ndarray): Term ids of the query
+        query_weights (np.ndarray): Weight of each query term, e.g. its TF-IDF weight
+        max_passages (int): Largest number of passages returned
+        max_chars (int): Approximate length of a passage
+
+    Returns:
+        List[Passage]: Non-overlapping passages, best first
+    """
+    if not len(query_ids) or not len(terms):
+        return []
+    matched = np.flatnonzero(np.isin(terms, query_ids))
+    if not len(matched):
+        return []
+
+    # Window i holds the matched tokens matched[i] .. window_end[i] - 1
+    window_end = np.searchsorted(matched, matched + WINDOW_TOKENS)
+    matched_terms = np.asarray(terms[matched])
+    scores = np.zeros(len(matched))
+    for term_id, weight in zip(query_ids.tolist(), query_weights.tolist()):
+        counts = np.concatenate([[0], np.cumsum(matched_terms == term_id)])
+        occurrences = counts[window_end] - counts[:-1]
+        present = occurrences > 0
+        scores += weight * (present + REPEAT_WEIGHT * (occurrences - present))
+
+    passages = []
+    taken: List[Tuple[int, int]] = []
+    for i in np.argsort(-scores, kind='stable').tolist():
+        first_token, last_token = int(matched[i]), int(matched[window_end[i] - 1])
+        if any(first_token <= end and last_token >= start for start, end in taken):
+            continue
+        taken.append((first_token, last_token))
+
+        start, end = _cut(content, int(starts[first_token]), int(ends[last_token]), max_chars)
+        prefix = "…" if start > 0 else ""
+        highlights = [
+            (int(starts[token]) - start + len(prefix), int(ends[token]) - start + len(prefix))
+            for token in matched[i:window_end[i]].tolist()
+            if starts[token] >= start and ends[token] <= end
+        ]
+        text = prefix + content[start:end] + ("…" if end < len(content) else "")
+        passages.append(Passage(start, end, text, float(scores[i]), highlights))
+        if len(passages) == max_passages:
+            break
+    return passages
@@ -4,35 +4,30 @@ import sys
 from datetime import datetime
 from document_loader import load_documents_from_folder
 from gemini_wrapper import GeminiAPIWrapper
-from retriever import SimpleRetriever
+from live_retriever import LiveRetriever
+from micro_batcher import MicroBatcher
 
 
-@st.cache_data
 def load_documents():
-    """Load documents with caching."""
-    return load_documents_from_folder("data/")
-
-
-def refresh_documents():
-    """Force refresh of documents by clearing cache."""
-    # Clear all caches to ensure fresh reload
-    load_documents.clear()
-    st.cache_data.clear()
-    st.cache_resource.clear()
-    
-    # Force reload documents from folder
+    """Load the documents of the data/ folder."""
     return load_documents_from_folder("data/")
 
 
 @st.cache_resource
-def initialize_components(documents):
-    """Initialize chatbot components with caching."""
+def initialize_components():
+    """Initialize chatbot components once, shared by every session."""
     try:
-        retriever = SimpleRetriever(documents)
+        # Refreshes rebuild the index in the background and swap it in when ready (see live_retriever)
+        live = LiveRetriever(load_documents)
+        retriever = live
+        # Optionally batch queries arriving together from concurrent sessions
+        batch_ms = os.getenv('RETRIEVAL_BATCH_MS')
+        if batch_ms:
+            retriever = MicroBatcher(live, window_ms=float(batch_ms))
         gemini = GeminiAPIWrapper()
-        return retriever, gemini, None
+        return live, retriever, gemini, None
     except Exception as e:
-        return None, None, str(e)
+        return None, None, None, str(e)
 
 
 def format_chat_message(role, content, timestamp=None):
@@ -238,18 +233,15 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     
-    # Load documents initially and store in session state
-    if 'documents' not in st.session_state or st.session_state.get('reload_documents', False):
-        with st.spinner("Loading documents..."):
-            st.session_state.documents = load_documents()
-            st.session_state.reload_documents = False
-            # Clear the initialized flag to force reinitialization of components
-            if st.session_state.get('reload_documents', False):
-                st.session_state.pop('initialized', None)
-                st.session_state.pop('retriever', None)
-                st.session_state.pop('gemini', None)
+    # Components, and the index, are shared by all sessions; documents come from the current index snapshot
+    with st.spinner("Initializing AI components..."):
+        live, retriever, gemini, error = initialize_components()
+    if error:
+        st.error(f"❌ Error initializing AI: {error}")
+        st.info("Please check your .env file and ensure GEMINI_API_KEY is set correctly.")
+        return
     
-    documents = st.session_state.documents
+    documents = live.documents
     
     # Sidebar for document management
     with st.sidebar:
@@ -265,27 +257,16 @@ def main():
             clear_clicked = st.button("🗑️ Clear Chat", help="Clear chat history", use_container_width=True)
             
         if refresh_clicked:
-            with st.spinner("🔄 Refreshing documents..."):
-                # Clear all cached data and force reload
-                st.session_state.documents = refresh_documents()
-                documents = st.session_state.documents
-                
-                # Force reinitialization of AI components with new documents
-                st.session_state.pop('initialized', None)
-                st.session_state.pop('retriever', None) 
-                st.session_state.pop('gemini', None)
-                
-                # Set reload flag and timestamp
-                st.session_state.reload_documents = True
-                st.session_state.last_refresh = datetime.now().strftime("%H:%M:%S")
-                
-            st.success(f"✅ Documents refreshed! Found {len(documents)} documents.")
-            
-            # Show what was found
-            if documents:
-                st.info(f"📄 Loaded: {', '.join([doc['file_name'] for doc in documents])}")
-            
-            st.rerun()
+            # The new index is built in the background; questions keep using the current one until it is ready
+            if live.refresh():
+                st.info("🔄 Reloading documents in the background. Answers use the current documents until it is done.")
+            else:
+                st.info("🔄 A refresh is already running.")
+        
+        if live.refreshing:
+            st.caption("🔄 Refreshing documents...")
+        elif live.error:
+            st.warning(f"⚠️ Last refresh failed, showing the previous documents: {live.error}")
         
         if clear_clicked:
             st.session_state.chat_history = []
@@ -300,8 +281,8 @@ def main():
             st.success(f"✅ Loaded {len(documents)} documents")
             
             # Show last refresh time
-            if 'last_refresh' in st.session_state:
-                st.caption(f"Last refreshed: {st.session_state.last_refresh}")
+            if live.refreshed_at:
+                st.caption(f"Last refreshed: {datetime.fromtimestamp(live.refreshed_at).strftime('%H:%M:%S')}")
             
             # Show document list with enhanced display
             st.markdown("**📄 Document Library:**")
@@ -336,23 +317,18 @@ def main():
         st.markdown("**⚙️ Settings**")
         max_docs = st.slider("Max relevant documents", 1, 5, 3, help="Number of documents to use for context")
         show_sources = st.checkbox("Show document sources", True, help="Display which documents were used for each answer")
+        fuzzy = st.checkbox("Tolerate typos and OCR errors", False,
+                            help="Also match near variants of the question's words, e.g. 'rnanagement' for 'management'")
+        file_types = sorted({doc.get('file_type', '').lstrip('.').lower() for doc in documents} - {''})
+        selected_types = st.multiselect("Search only these file types", file_types,
+                                        help="Leave empty to search every document")
+        filters = {'file_type': selected_types} if selected_types else None
         st.markdown('</div>', unsafe_allow_html=True)
     
     # Initialize session state
     if 'chat_history' not in st.session_state:
         st.session_state.chat_history = []
     
-    if 'initialized' not in st.session_state:
-        with st.spinner("Initializing AI components..."):
-            retriever, gemini, error = initialize_components(documents)
-            if error:
-                st.error(f"❌ Error initializing AI: {error}")
-                st.info("Please check your .env file and ensure GEMINI_API_KEY is set correctly.")
-                return
-            st.session_state.retriever = retriever
-            st.session_state.gemini = gemini
-            st.session_state.initialized = True
-    
     # Main chat interface with improved layout
     col1, col2 = st.columns([2, 1])
     
@@ -372,6 +348,8 @@ def main():
                             for source in entry["sources"]:
                                 relevance = source.get('similarity_score', 0)
                                 st.write(f"- **{source['file_name']}** (relevance: {relevance:.3f})")
+                                if getattr(source, 'passages', None):
+                                    st.caption(source.passages[0].highlighted())
                     
                     format_chat_message("assistant", entry["answer"], entry["timestamp"])
                     st.divider()
@@ -394,6 +372,7 @@ def main():
                     st.metric("📝 Avg Response", f"{avg_length} chars")
                 else:
                     st.metric("📝 Avg Response", "0 chars")
+                st.metric("🧠 Index Memory", f"{sum(live.retriever.memory_usage().values()) / 1024 / 1024:.1f} MB")
             st.markdown('</div>', unsafe_allow_html=True)
     
     # Chat input
@@ -407,49 +386,22 @@ def main():
         
         with st.spinner("🔍 Searching documents and generating answer..."):
             try:
-                # For competency/capability questions, use more documents to get complete info
-                search_terms = user_question.lower()
-                if any(term in search_terms for term in ['competenc', 'skill', 'service', 'capabilit', 'core', 'all']):
-                    # Use more documents for comprehensive answers
-                    retrieval_count = min(max_docs + 2, 10)
-                else:
-                    retrieval_count = max_docs
-                
-                # Retrieve relevant documents
-                relevant_docs = st.session_state.retriever.retrieve_relevant_chunks(
-                    user_question, top_k=retrieval_count
+                # Retrieve relevant documents; retrieval rules (see rules.py) add documents for broad
+                # questions and pin the documents certain questions need
+                relevant_docs = retriever.retrieve_relevant_chunks(
+                    user_question, top_k=max_docs, fuzzy=fuzzy, filters=filters
                 )
                 
-                # Special handling for SVB queries - ensure SVB document is included
-                if 'svb' in user_question.lower() or 'process flow chart' in user_question.lower():
-                    # Find SVB document in all documents
-                    svb_doc = None
-                    for doc in st.session_state.documents:
-                        if 'SVB' in doc.get('file_name', '').upper() or 'svb' in doc.get('file_name', '').lower():
-                            svb_doc = doc.copy()  # Make a copy
-                            svb_doc['similarity_score'] = 1.0  # Set high relevance
-                            break
-                    
-                    # Add SVB document to relevant docs if found and not already included
-                    if svb_doc:
-                        # Check if already included
-                        already_included = any(doc.get('file_name') == svb_doc.get('file_name') for doc in relevant_docs)
-                        if not already_included:
-                            relevant_docs.insert(0, svb_doc)  # Add at the beginning with highest priority
-                            print(f"🎯 Added SVB document to context: {svb_doc.get('file_name')}")
-                        else:
-                            print(f"🎯 SVB document already in context: {svb_doc.get('file_name')}")
-                    else:
-                        print(f"⚠️ SVB document not found in loaded documents")
-                
                 # Show sources if enabled
                 if show_sources and relevant_docs:
                     with st.expander("📄 Sources found:"):
                         for doc in relevant_docs:
                             st.write(f"- **{doc['file_name']}** (relevance: {doc['similarity_score']:.3f})")
+                            if getattr(doc, 'passages', None):
+                                st.caption(doc.passages[0].highlighted())
                 
                 # Generate answer
-                answer = st.session_state.gemini.chat_with_context(
+                answer = gemini.chat_with_context(
                     user_question, 
                     relevant_docs, 
                     st.session_state.chat_history
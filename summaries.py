@@ -0,0 +1,157 @@
+"""
+Per-group summary vectors, for two-stage retrieval.
+
+The documents of a large library come in groups: the chunks or pages of one
+source document, or the files of one folder. Each group is summarised by
+its centroid, the normalised, idf-weighted sum of the term vectors of its
+documents, so a query can first be routed to the few groups whose
+centroids match it best. Only the documents of those groups are then
+scored (see SimpleRetriever, `routing`), trading a little recall for
+latency on large corpora:
+
+    summaries = SummaryIndex(index, {key: document_group(doc) for key, doc in documents.items()})
+    row_filter = summaries.route_filter(index, ["leave policy"], num_groups=5)
+    index.top_k(["leave policy"], 3, row_filter=row_filter)
+
+The centroids are one sparse product over the stored document rows, so
+they are computed from the index when needed rather than stored with it.
+"""
+
+import os
+from typing import Callable, Dict, List
+
+import numpy as np
+from scipy import sparse
+
+
+def document_group(doc: Dict[str, str]) -> str:
+    """Group of a document: its 'parent' (the document a chunk or page was cut from), or else its folder."""
+    parent = doc.get('parent')
+    if parent:
+        return parent
+    return os.path.dirname((doc.get('file_path') or '').replace('\\', '/'))
+
+
+class SummaryIndex:
+    """
+    Centroid of every document group of an index.
+
+    Attributes:
+        groups (List[str]): Name of every group, by group id
+        version (int): Index version the centroids were computed at
+    """
+
+    def __init__(self, index, groups: Dict[str, str]):
+        """
+        Args:
+            index (SegmentedIndex): Index whose live documents are summarised
+            groups (Dict[str, str]): Group of every document key; documents without one are never routed to
+        """
+        self.version = index.version
+        self._groups = groups
+        self._group_ids: Dict[str, int] = {}
+        self._members: List[List[str]] = []
+        for key in index.doc_keys():
+            if key in groups:
+                group_id = self._group_ids.setdefault(groups[key], len(self._group_ids))
+                if group_id == len(self._members):
+                    self._members.append([])
+                self._members[group_id].append(key)
+        self.groups = list(self._group_ids)
+        self._row_groups: Dict[int, np.ndarray] = {}
+
+        num_terms = len(index.vocabulary)
+        centroids = sparse.csr_matrix((len(self.groups), num_terms), dtype=np.float32)
+        for segment in index.segments:
+            row_groups = self._segment_groups(segment)
+            live = np.flatnonzero(row_groups >= 0)
+            assignment = sparse.csr_matrix(
+                (np.ones(len(live), dtype=np.float32), (row_groups[live], live)),
+                shape=(len(self.groups), segment.num_docs),
+            )
+            summed = (assignment @ segment.forward).tocsr()
+            summed.resize((len(self.groups), num_terms))
+            centroids = centroids + summed
+        # Weighted by idf, so the rare terms that single out a document are not drowned out by the
+        # common terms every document of a large group adds to its centroid
+        centroids = (centroids @ sparse.diags(index.idf()[:num_terms].astype(np.float32))).tocsr()
+        norms = np.sqrt(np.asarray(centroids.multiply(centroids).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        self.centroids = sparse.diags((1.0 / norms).astype(np.float32)).dot(centroids).tocsr()
+        # Terms x groups, so scoring a query only reads the rows of its terms
+        self._term_groups = self.centroids.T.tocsr()
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def _segment_groups(self, segment) -> np.ndarray:
+        """Group id of every row of a segment, -1 for deleted rows and rows without a group; remembered per segment."""
+        row_groups = self._row_groups.get(segment.segment_id)
+        if row_groups is None:
+            # Segments merged since the summaries were computed hold the same documents in new rows
+            row_groups = np.fromiter((self._group_ids.get(self._groups.get(key), -1) for key in segment.doc_keys),
+                                     dtype=np.int64, count=segment.num_docs)
+            row_groups[np.asarray(segment.deleted)] = -1
+            self._row_groups[segment.segment_id] = row_groups
+        return row_groups
+
+    def route(self, index, queries: List[str], num_groups: int) -> np.ndarray:
+        """
+        Pick the groups to search for a batch of queries.
+
+        Args:
+            index (SegmentedIndex): Index the summaries were computed from, for the query vectors
+            queries (List[str]): Query texts
+            num_groups (int): Groups searched per query
+
+        Returns:
+            np.ndarray: Ids of the best matching groups of any of the queries, sorted
+        """
+        return self.route_each(index, [queries], num_groups)[0]
+
+    def route_each(self, index, batches: List[List[str]], num_groups: int) -> List[np.ndarray]:
+        """
+        Pick the groups to search for each of several batches of queries, with one product for all of them.
+
+        Args:
+            index (SegmentedIndex): Index the summaries were computed from, for the query vectors
+            batches (List[List[str]]): Query texts of each batch, such as the strategies of one query plan
+            num_groups (int): Groups searched per query
+
+        Returns:
+            List[np.ndarray]: Per batch, the ids of the best matching groups of any of its queries, sorted
+        """
+        queries = [query for batch in batches for query in batch]
+        vectors = index.query_vectors(queries)
+        vectors.resize((len(queries), self._term_groups.shape[0]))
+        scores = (vectors @ self._term_groups).toarray()
+        selected = []
+        for row in scores:
+            best = np.argsort(-row, kind='stable')[:num_groups]
+            selected.append(best[row[best] > 0])
+        routed, start = [], 0
+        for batch in batches:
+            picked = selected[start:start + len(batch)]
+            start += len(batch)
+            routed.append(np.unique(np.concatenate(picked)) if picked else np.zeros(0, dtype=np.int64))
+        return routed
+
+    def row_filter(self, group_ids: np.ndarray) -> Callable:
+        """
+        Row filter for index searches that allows the documents of the given groups (see SegmentedIndex.top_k).
+
+        Returns:
+            Callable[[Segment], np.ndarray]: Gives the mask of a segment's rows in the groups
+        """
+        # One extra slot, so rows without a group (-1) map to False
+        allowed = np.zeros(len(self.groups) + 1, dtype=bool)
+        allowed[np.asarray(group_ids, dtype=np.int64)] = True
+        return lambda segment: allowed[self._segment_groups(segment)]
+
+    def members(self, group_ids: np.ndarray) -> List[str]:
+        """Keys of the documents of the given groups."""
+        return [key for group_id in np.asarray(group_ids).tolist() for key in self._members[group_id]]
+
+    def route_filter(self, index, queries: List[str], num_groups: int) -> Callable:
+        """Route queries to their best `num_groups` groups and return the row filter of those groups."""
+        return self.row_filter(self.route(index, queries, num_groups))
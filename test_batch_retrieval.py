@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Test script for batched retrieval and query micro-batching
+"""
+
+import tempfile
+import threading
+from retriever import SimpleRetriever
+from micro_batcher import MicroBatcher
+from query_planner import plan_query
+
+SAMPLE_DOCS = [
+    {"file_name": "doc1.txt", "content": "Python is a programming language used for web development."},
+    {"file_name": "doc2.txt", "content": "Machine learning is a subset of artificial intelligence."},
+    {"file_name": "doc3.txt", "content": "Web development involves creating websites and web applications."},
+    {"file_name": "report.txt", "content": "The March 2021 report covers invoices and payments."}
+]
+
+ROUTED_DOCS = [
+    {"file_name": "apple_pie.txt", "file_path": "data/food/apple_pie.txt",
+     "content": "Apple pie recipe with apples, sugar and cinnamon."},
+    {"file_name": "apple_cake.txt", "file_path": "data/food/apple_cake.txt", "content": "An apple cake recipe for autumn."},
+    {"file_name": "engine.txt", "file_path": "data/cars/engine.txt",
+     "content": "Car engine repair guide and recipe for a smooth engine."},
+    {"file_name": "tyres.txt", "file_path": "data/cars/tyres.txt", "content": "Changing car tyres, apple green paint and repair."},
+    {"file_name": "refund.txt", "file_path": "data/shop/refund.txt",
+     "content": "Refund policy: a refund approved within 14 days."},
+]
+
+QUERIES = [
+    "What is Python used for?",
+    "machine learning",
+    "What happened in March 2021?",
+    "Tell me about websites",
+    "something unrelated entirely",
+]
+
+
+def _retriever(cache_dir):
+    return SimpleRetriever([dict(doc) for doc in SAMPLE_DOCS], cache_dir=cache_dir)
+
+
+def _summary(results):
+    return [(doc['file_name'], round(doc['similarity_score'], 6), doc['match_type']) for doc in results]
+
+
+def test_retrieve_many_matches_single_queries():
+    """A batch returns exactly what the queries return one at a time"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = _retriever(cache_dir)
+
+        batched = retriever.retrieve_many(QUERIES, top_k=3)
+        single = [retriever.retrieve_relevant_chunks(query, top_k=3) for query in QUERIES]
+
+        assert [_summary(r) for r in batched] == [_summary(r) for r in single]
+        assert batched[2][0]['file_name'] == "report.txt"
+
+
+def test_routed_batch_matches_single_queries():
+    """With routing, a query in a batch only searches its own groups, not those routed for other queries"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = SimpleRetriever([dict(doc) for doc in ROUTED_DOCS], cache_dir=cache_dir, routing=1)
+        queries = ["apple recipe", "car engine repair"]
+
+        batched = retriever.retrieve_many(queries)
+        retriever.query_cache.clear()
+        single = [retriever.retrieve_relevant_chunks(query) for query in queries]
+
+        assert [_summary(r) for r in batched] == [_summary(r) for r in single]
+        assert [doc['file_name'] for doc in batched[0]] == ["apple_cake.txt", "apple_pie.txt"]
+
+
+def test_blank_query_in_batch():
+    """A blank query finds nothing and leaves the exact matches of the rest of the batch alone"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = SimpleRetriever([dict(doc) for doc in ROUTED_DOCS], cache_dir=cache_dir)
+
+        batched = retriever.retrieve_many(["refund approved", "   "])
+        assert batched[1] == []
+        assert _summary(batched[0]) == [("refund.txt", 1.0, 'exact')]
+        assert _summary(retriever.retrieve_relevant_chunks("refund approved")) == _summary(batched[0])
+
+
+def test_widened_query_leaves_batch_alone():
+    """A rule asking for more results on one query does not widen the candidates of the others"""
+    docs = [{"file_name": f"spread{i}.txt", "content": f"apple {' '.join(f'w{i}x{j}' for j in range(30))} recipe"}
+            for i in range(4)]
+    docs.append({"file_name": "close.txt", "content": "apple recipe " + " ".join(f"filler{j}" for j in range(45))})
+    docs.append({"file_name": "services.txt", "content": "all services we offer"})
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = SimpleRetriever(docs, cache_dir=cache_dir)
+
+        # "all services" matches the broad-questions rule, which asks for two more results
+        batched = retriever.retrieve_many(["recipe apple", "all services"], top_k=1)
+        retriever.query_cache.clear()
+        assert _summary(batched[0]) == _summary(retriever.retrieve_relevant_chunks("recipe apple", top_k=1))
+
+
+def test_mixed_batch_matches_single_queries():
+    """Routing, rules and a blank query in one batch: every query returns what it returns alone"""
+    docs = [dict(doc) for doc in ROUTED_DOCS + SAMPLE_DOCS]
+    queries = ["apple recipe", "car engine repair", "refund approved", "   ", "all services for refund",
+               "What happened in March 2021?", "web development", "svb process"]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = SimpleRetriever(docs, cache_dir=cache_dir, routing=1)
+
+        batched = retriever.retrieve_many(queries)
+        retriever.query_cache.clear()
+        single = [retriever.retrieve_relevant_chunks(query) for query in queries]
+
+        assert [_summary(r) for r in batched] == [_summary(r) for r in single]
+        assert batched[3] == [] and any(batched)
+
+
+def test_micro_batcher_groups_concurrent_queries():
+    """Queries from concurrent threads are answered correctly in shared batches"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = _retriever(cache_dir)
+        batcher = MicroBatcher(retriever, window_ms=50)
+        expected = {query: _summary(retriever.retrieve_relevant_chunks(query)) for query in QUERIES}
+        answers = {}
+
+        def ask(query):
+            answers[query] = _summary(batcher.retrieve_relevant_chunks(query))
+
+        threads = [threading.Thread(target=ask, args=(query,)) for query in QUERIES]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        batcher.close()
+
+        assert answers == expected
+        assert batcher.queries_run == len(QUERIES)
+        assert batcher.batches_run < len(QUERIES)
+
+
+def test_query_plan_strategies():
+    """A plan lists the original query, its key terms, then significant words"""
+    plan = plan_query("What is the  Machine Learning report for March 2021?")
+
+    assert plan.normalized == "what is the machine learning report for march 2021?"
+    assert plan.dates == ["march 2021"]
+    assert [s.text for s in plan.strategies] == [
+        "What is the  Machine Learning report for March 2021?",
+        "machine learning report for march 2021",
+        "machine", "learning", "report", "march",
+    ]
+
+
+def test_fallback_strategy_found_in_single_pass():
+    """A question whose full text misses still finds documents through a significant word"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = _retriever(cache_dir)
+
+        results = retriever.retrieve_relevant_chunks("Whatever happened to the invoices?")
+
+        assert [doc['file_name'] for doc in results] == ["report.txt"]
+
+
+def test_hits_refer_to_documents():
+    """Results are compact hits that share the loaded document instead of copying it"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = _retriever(cache_dir)
+
+        hit = retriever.retrieve_relevant_chunks("march 2021")[0]
+
+        assert hit.document is retriever.documents[3]
+        assert hit['file_name'] == "report.txt" and hit.get('content') == SAMPLE_DOCS[3]['content']
+        assert hit['match_type'] == 'exact' and hit['similarity_score'] == hit.score
+        assert hit.matched_text == "March 2021"
+        assert dict(hit)['similarity_score'] == hit.score
+        assert not hasattr(hit, '__dict__')
+
+
+if __name__ == "__main__":
+    print("🚀 Batch Retrieval Test")
+    print("=" * 50)
+    for test in [test_retrieve_many_matches_single_queries, test_routed_batch_matches_single_queries,
+                 test_blank_query_in_batch, test_widened_query_leaves_batch_alone, test_mixed_batch_matches_single_queries,
+                 test_micro_batcher_groups_concurrent_queries,
+                 test_query_plan_strategies, test_fallback_strategy_found_in_single_pass,
+                 test_hits_refer_to_documents]:
+        test()
+        print(f"✅ {test.__name__}")
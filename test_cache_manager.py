@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Test script for cache budget, eviction, atomic writes and locking
+"""
+
+import os
+import tempfile
+import threading
+import time
+from cache_manager import CacheManager, atomic_file
+
+
+def _write(path, size, age_seconds=0):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    stamp = time.time() - age_seconds
+    os.utime(path, (stamp, stamp))
+
+
+def test_evicts_least_recently_used_first():
+    """Entries are evicted oldest-use first until the cache fits its budget"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = CacheManager(cache_dir, max_bytes=2500)
+        _write(os.path.join(cache_dir, "old.json"), 1000, age_seconds=300)
+        _write(os.path.join(cache_dir, "used.json"), 1000, age_seconds=200)
+        _write(os.path.join(cache_dir, "new.json"), 1000, age_seconds=100)
+        cache.touch(os.path.join(cache_dir, "used.json"))
+
+        removed = cache.evict()
+
+        assert [os.path.basename(path) for path in removed] == ["old.json"]
+        assert sorted(os.listdir(cache_dir)) == ["new.json", "used.json"]
+
+
+def test_protected_and_aged_entries():
+    """Protected entries survive; entries past the age limit go even under budget"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = CacheManager(cache_dir, max_bytes=10 ** 9, max_age_days=1)
+        os.makedirs(os.path.join(cache_dir, "index"))
+        _write(os.path.join(cache_dir, "index", "manifest.json"), 10)
+        os.utime(os.path.join(cache_dir, "index"), (0, 0))
+        _write(os.path.join(cache_dir, "stale.json"), 10, age_seconds=3 * 86400)
+
+        cache.evict(protect=[os.path.join(cache_dir, "index")])
+
+        assert os.listdir(cache_dir) == ["index"]
+
+
+def test_atomic_file_leaves_no_partial_file():
+    """A failed write keeps the previous file and leaves no temporary file"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        path = os.path.join(cache_dir, "data.json")
+        with atomic_file(path, 'w', encoding='utf-8') as f:
+            f.write("old")
+        try:
+            with atomic_file(path, 'w', encoding='utf-8') as f:
+                f.write("new, half written")
+                raise RuntimeError("crash")
+        except RuntimeError:
+            pass
+
+        assert os.listdir(cache_dir) == ["data.json"]
+        with open(path, encoding='utf-8') as f:
+            assert f.read() == "old"
+
+
+def test_lock_is_exclusive():
+    """Only one holder of a lock runs at a time"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = CacheManager(cache_dir)
+        active, overlaps = [], []
+
+        def build():
+            with cache.lock("index"):
+                active.append(1)
+                if len(active) > 1:
+                    overlaps.append(1)
+                time.sleep(0.05)
+                active.pop()
+
+        threads = [threading.Thread(target=build) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert not overlaps
+        assert not os.path.exists(os.path.join(cache_dir, "index.lock"))
+
+
+def test_lock_outlives_stale_after_while_held():
+    """A held lock is kept fresh by its heartbeat, waiters wait for it, and a dead holder's lock is taken over"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = CacheManager(cache_dir)
+        order = []
+
+        def wait():
+            with cache.lock("index", stale_after=0.4):
+                order.append("waiter")
+
+        with cache.lock("index", stale_after=0.4):
+            waiter = threading.Thread(target=wait)
+            waiter.start()
+            time.sleep(1.2)  # Three times stale_after
+            order.append("holder")
+        waiter.join()
+        assert order == ["holder", "waiter"]
+
+        _write(os.path.join(cache_dir, "index.lock"), 8, age_seconds=10)  # Left behind by a crashed process
+        with cache.lock("index", timeout=1, stale_after=5):
+            pass
+        assert not os.path.exists(os.path.join(cache_dir, "index.lock"))
+
+
+if __name__ == "__main__":
+    print("🚀 Cache Manager Test")
+    print("=" * 50)
+    for test in [test_evicts_least_recently_used_first, test_protected_and_aged_entries,
+                 test_atomic_file_leaves_no_partial_file, test_lock_is_exclusive,
+                 test_lock_outlives_stale_after_while_held]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Test script for the clustered (IVF) coarse quantizer
+"""
+
+import os
+import shutil
+import tempfile
+from clusters import Quantizer
+from retriever import SimpleRetriever
+from segment_index import SegmentedIndex
+
+TOPICS = {
+    "leave": "annual leave vacation holiday request approval manager",
+    "payroll": "salary payroll payslip tax deduction bank transfer",
+    "security": "password login account phishing security badge access",
+}
+
+
+def topical_documents():
+    documents = []
+    for topic, words in TOPICS.items():
+        words = words.split()
+        for i in range(6):
+            text = " ".join(words[i:] + words[:i][:2]) + f" note{topic}{i}"
+            documents.append({"file_name": f"{topic}{i}.txt", "file_path": f"data/{topic}{i}.txt",
+                              "file_type": "txt", "content": text})
+    return documents
+
+
+def test_kmeans_separates_topics_and_round_trips():
+    """Documents of one topic share a cluster, and a saved quantizer assigns the same clusters"""
+    index = SegmentedIndex()
+    index.add_documents([(doc["file_name"], doc["content"], doc["file_name"]) for doc in topical_documents()])
+    quantizer = Quantizer.train(index, num_clusters=3)
+    groups = quantizer.groups(index)
+
+    for topic in TOPICS:
+        assert len({groups[f"{topic}{i}.txt"] for i in range(6)}) == 1
+    assert len(set(groups.values())) == 3
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "quantizer.npz")
+        quantizer.save(path)
+        loaded = Quantizer.load(path)
+        assert loaded.groups(index) == groups
+        assert loaded.fits(index) and not loaded.fits(SegmentedIndex())
+
+
+def test_retriever_routes_over_clusters():
+    """Routing to the nearest cluster finds the topic's documents; probing every cluster matches unrouted search"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        unrouted = SimpleRetriever(topical_documents(), cache_dir=cache_dir)
+        routed = SimpleRetriever(topical_documents(), cache_dir=cache_dir, routing=1, clusters=3)
+        assert os.path.exists(os.path.join(cache_dir, "ivf_quantizer.npz"))
+        assert len(routed.summaries) == 3
+
+        hits = routed.retrieve_relevant_chunks("payslip tax deduction", top_k=6)
+        assert hits and all(hit['file_name'].startswith("payroll") for hit in hits)
+
+        routed.routing = 3
+        for query in ["phishing login", "holiday approval", "bank transfer notepayroll2"]:
+            assert ([hit['file_name'] for hit in routed.retrieve_relevant_chunks(query)] ==
+                    [hit['file_name'] for hit in unrouted.retrieve_relevant_chunks(query)])
+        routed.close()
+        unrouted.close()
+
+
+def test_only_new_documents_are_assigned():
+    """After the index changes, documents assigned before keep their cluster without being scored again"""
+    index = SegmentedIndex(background_merge=False)
+    index.add_documents([(doc["file_name"], doc["content"], doc["file_name"]) for doc in topical_documents()])
+    quantizer = Quantizer.train(index, num_clusters=3)
+    before = quantizer.groups(index)
+
+    assigned = []
+    assign = quantizer.assign
+    quantizer.assign = lambda matrix: assigned.append(matrix.shape[0]) or assign(matrix)
+    index.add_documents([("payroll6.txt", "salary payroll payslip tax deduction", "1")])
+    index.delete_documents(["leave0.txt"])
+    index.merge()
+    after = quantizer.groups(index)
+
+    assert assigned == [1]
+    assert after["payroll6.txt"] == before["payroll0.txt"] and "leave0.txt" not in after
+    assert {key: group for key, group in after.items() if key != "payroll6.txt"} == \
+        {key: group for key, group in before.items() if key != "leave0.txt"}
+
+
+def test_quantizer_is_retrained_for_a_rebuilt_index():
+    """A saved quantizer is not reused once the index is rebuilt from scratch with different term ids"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        SimpleRetriever(topical_documents(), cache_dir=cache_dir, routing=1, clusters=3).close()
+        shutil.rmtree(os.path.join(cache_dir, "index"))
+
+        # Indexed in reverse order, the rebuilt index numbers its terms differently
+        rebuilt = SimpleRetriever(topical_documents()[::-1], cache_dir=cache_dir, routing=1, clusters=3)
+        assert rebuilt.quantizer.fits(rebuilt.index)
+        groups = rebuilt.quantizer.groups(rebuilt.index)
+        assert len(set(groups.values())) == 3
+        hits = rebuilt.retrieve_relevant_chunks("payslip tax deduction", top_k=6)
+        assert hits and all(hit['file_name'].startswith("payroll") for hit in hits)
+        rebuilt.close()
+
+
+if __name__ == "__main__":
+    print("🚀 Clusters Test")
+    print("=" * 50)
+    for test in [test_kmeans_separates_topics_and_round_trips, test_retriever_routes_over_clusters,
+                 test_only_new_documents_are_assigned, test_quantizer_is_retrained_for_a_rebuilt_index]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Test script for near-duplicate document detection at loading
+"""
+
+import os
+import tempfile
+from dedupe import DuplicateDetector
+from document_loader import load_documents_from_folder
+from metadata import MetadataIndex
+
+REPORT = " ".join(f"section {i} of the quarterly report covers revenue item {i * 7}" for i in range(40))
+OTHER = " ".join(f"the travel policy rule {i} limits hotel cost number {i * 3}" for i in range(40))
+
+
+def test_detector_finds_near_copies():
+    """Texts differing in a word are copies, different texts are not, and identical bytes are caught by hash"""
+    detector = DuplicateDetector()
+    assert detector.check("report.txt", REPORT) is None
+    assert detector.check("travel.txt", OTHER) is None
+    assert detector.check("report-edited.txt", REPORT.replace("revenue item 70", "revenue item 71")) == "report.txt"
+    assert detector.check("travel (1).txt", OTHER.upper()) == "travel.txt"
+
+    assert detector.check_file("a.pdf", "hash1") is None
+    assert detector.check_file("b.pdf", "hash2") is None
+    assert detector.check_file("a (1).pdf", "hash1") == "a.pdf"
+
+
+def test_loader_collapses_copies_into_aliases():
+    """Copies are loaded once, as aliases of the document kept, and metadata filters find the kept document"""
+    with tempfile.TemporaryDirectory() as folder:
+        for name, text in [("Report (1).txt", REPORT), ("Report.txt", REPORT),
+                           ("Report-final.txt", REPORT + " approved"), ("Travel.txt", OTHER)]:
+            with open(os.path.join(folder, name), "w", encoding="utf-8") as f:
+                f.write(text)
+
+        documents = load_documents_from_folder(folder)
+        assert sorted(doc['file_name'] for doc in documents) == ["Report.txt", "Travel.txt"]
+        report = next(doc for doc in documents if doc['file_name'] == "Report.txt")
+        assert sorted(os.path.basename(alias) for alias in report['aliases']) == ["Report (1).txt", "Report-final.txt"]
+
+        metadata = MetadataIndex({doc['file_path']: doc for doc in documents})
+        assert metadata.select({'file_name': 'report (1).txt'}) == [report['file_path']]
+
+        assert len(load_documents_from_folder(folder, dedupe=False)) == 4
+
+
+if __name__ == "__main__":
+    print("🚀 Dedupe Test")
+    print("=" * 50)
+    for test in [test_detector_finds_near_copies, test_loader_collapses_copies_into_aliases]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Test script for maximal marginal relevance diversification of results
+"""
+
+import tempfile
+import numpy as np
+from scipy import sparse
+from diversity import mmr
+from retriever import SimpleRetriever
+
+HEADER = "Acme Corporation employee handbook leave policy page"
+DOCUMENTS = [
+    {"file_name": "scan-1.txt", "content": f"{HEADER} one. Annual leave is twenty days."},
+    {"file_name": "scan-2.txt", "content": f"{HEADER} two. Annual leave is twenty days."},
+    {"file_name": "scan-3.txt", "content": f"{HEADER} three. Annual leave is twenty days."},
+    {"file_name": "parental.txt", "content": "Parental leave policy: sixteen weeks of paid leave for new parents."},
+]
+
+
+def test_mmr_skips_near_duplicates():
+    """A copy of a picked candidate loses to a less relevant but different one; without diversity the order is by relevance"""
+    vectors = sparse.csr_matrix(np.array([[1.0, 0.0], [1.0, 0.0], [0.6, 0.8]], dtype=np.float32))
+    relevance = [0.9, 0.85, 0.5]
+    assert mmr(relevance, vectors, 2, 0.5) == [0, 2]
+    assert mmr(relevance, vectors, 2, 0.0) == [0, 1]
+    assert mmr(relevance, vectors, 5, 0.5) == [0, 2, 1]
+
+
+def test_retriever_returns_diverse_passages():
+    """With diversity, repeated OCR pages give way to the other relevant document"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        plain = SimpleRetriever([dict(doc) for doc in DOCUMENTS], cache_dir=cache_dir)
+        diverse = SimpleRetriever([dict(doc) for doc in DOCUMENTS], cache_dir=cache_dir, diversity=0.5)
+
+        similar = [hit['file_name'] for hit in plain.retrieve_relevant_chunks("leave policy handbook", top_k=2)]
+        assert all(name.startswith("scan") for name in similar)
+
+        hits = [hit['file_name'] for hit in diverse.retrieve_relevant_chunks("leave policy handbook", top_k=2)]
+        assert hits[0] == similar[0] and hits[1] == "parental.txt"
+
+        vectors = diverse.index.document_vectors(["scan-1.txt", "scan-2.txt", "missing.txt"])
+        assert vectors.shape[0] == 3 and vectors[2].nnz == 0
+        assert (vectors[0] @ vectors[1].T).toarray()[0, 0] > 0.8
+
+
+if __name__ == "__main__":
+    print("🚀 Diversity Test")
+    print("=" * 50)
+    for test in [test_mmr_skips_near_duplicates, test_retriever_returns_diverse_passages]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test script for compact document records
+"""
+
+import os
+import tempfile
+from docx import Document as DocxDocument
+from document_loader import load_documents_from_folder
+from documents import Document
+from retriever import SimpleRetriever
+
+
+def test_document_reads_like_a_dict():
+    """Documents answer the dict lookups the rest of the code uses, and extra fields are kept"""
+    doc = Document.of({"file_name": "leave.txt", "file_path": "data/hr/leave.txt", "content": "Annual leave.",
+                       "tags": "hr, policy"})
+    assert doc['file_name'] == "leave.txt" and doc.get('content') == "Annual leave."
+    assert doc.get('parent') is None and 'parent' not in doc and doc['tags'] == "hr, policy"
+    assert dict(doc) == {"file_name": "leave.txt", "file_path": "data/hr/leave.txt", "content": "Annual leave.",
+                         "tags": "hr, policy"}
+    assert Document.of(doc) is doc
+    assert not hasattr(doc, '__dict__')
+
+
+def test_retriever_shares_keys_with_the_index():
+    """The retriever keeps compact records, and keys loaded from the cached index are the documents' own strings"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        docs = [{"file_name": f"doc{i}.txt", "file_path": f"data/doc{i}.txt", "content": f"document about topic{i}"}
+                for i in range(3)]
+        SimpleRetriever([dict(doc) for doc in docs], cache_dir=cache_dir)
+        retriever = SimpleRetriever([dict(doc) for doc in docs], cache_dir=cache_dir)
+
+        assert all(isinstance(doc, Document) for doc in retriever.documents)
+        keys = {key: key for segment in retriever.index.segments for key in segment.doc_keys}
+        assert all(keys[doc.file_path] is doc.file_path for doc in retriever.documents)
+        assert retriever.retrieve_relevant_chunks("topic2")[0].document is retriever.documents[2]
+
+
+def test_loader_reads_docx_files():
+    """DOCX files load through python-docx into Document records"""
+    with tempfile.TemporaryDirectory() as folder:
+        docx = DocxDocument()
+        docx.add_paragraph("Leave requests go to your line manager.")
+        docx.add_paragraph("Approval takes two working days.")
+        docx.save(os.path.join(folder, "leave.docx"))
+
+        documents = load_documents_from_folder(folder)
+        assert len(documents) == 1 and isinstance(documents[0], Document)
+        assert documents[0]['file_type'] == ".docx"
+        assert "Leave requests go to your line manager." in documents[0]['content']
+        assert "Approval takes two working days." in documents[0]['content']
+
+
+if __name__ == "__main__":
+    print("🚀 Documents Test")
+    print("=" * 50)
+    for test in [test_document_reads_like_a_dict, test_retriever_shares_keys_with_the_index,
+                 test_loader_reads_docx_files]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Test script for the ingest-time entity index
+"""
+
+import tempfile
+import time
+from entities import extract_entities, query_entities
+from retriever import SimpleRetriever
+from segment_index import SegmentedIndex
+
+
+def test_entities_are_normalised():
+    """Different spellings of a date, ID or number give the same entity key"""
+    text = "Invoice INV-2023-001 of 15 March 2024, total 1,25,000. Gold Plan terms in plan_terms.pdf"
+    keys = {key for key, _, _ in extract_entities(text)}
+    assert {"id:inv-2023-001", "date:2024-03", "date:2024-03-15", "number:125000",
+            "plan:gold plan", "file:plan_terms.pdf"} <= keys
+    assert "number:2023" not in keys  # Part of the invoice ID
+
+    for spelling in ["Mar 2024", "03/2024", "2024-03", "March 5th, 2024", "05/03/2024"]:
+        assert "date:2024-03" in {key for key, _, _ in extract_entities(spelling)}, spelling
+    assert ("plan:gold plan", "gold plan") in query_entities("what does the gold plan cover?")
+
+
+def test_ordinary_words_are_not_entities():
+    """Hyphenated and slashed words have no digits, so they are not IDs"""
+    text = "Our well-known, state-of-the-art e-mail service and/or the follow-up call"
+    assert extract_entities(text) == []
+    ids = [key for key, _, _ in extract_entities("Ticket ab-12 and/or 2021-22") if key.startswith("id:")]
+    assert ids == ["id:ab-12"]
+
+
+def test_entity_search_survives_deletes_merge_and_reload():
+    """Entity postings follow documents through deletions, merges and saves"""
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = SegmentedIndex(background_merge=False)
+        index.add_documents([("a", "Paid on 2021-03-04", "1"), ("b", "Order PO12345 shipped", "1")])
+        index.add_documents([("c", "Report for March 2021", "1"), ("d", "Due 4 March 2021", "1")])
+        index.delete_documents(["d"])
+        index.merge()
+        index.save(index_dir)
+
+        loaded = SegmentedIndex.load(index_dir)
+        assert loaded.entity_search("date:2021-03") == {"a": (8, 18), "c": (11, 21)}
+        assert loaded.entity_search("id:po12345") == {"b": (6, 13)}
+        assert loaded.entity_search("date:1999-01") == {}
+
+
+def test_retriever_matches_dates_in_any_format():
+    """A date in the query finds documents that write it differently"""
+    documents = [
+        {"file_name": "minutes.txt", "content": "Board minutes of the meeting held on 12/03/2021."},
+        {"file_name": "menu.txt", "content": "Canteen menu for the week."},
+    ]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = SimpleRetriever(documents, cache_dir=cache_dir)
+        hits = retriever.retrieve_relevant_chunks("what happened in March 2021?")
+        assert [hit['file_name'] for hit in hits] == ["minutes.txt"]
+        assert hits[0].matched_text == "12/03/2021"
+
+
+def test_extraction_is_linear_in_the_entities():
+    """Checking a mention against those already taken does not rescan them, so a long document stays fast"""
+    text = " ".join(f"Invoice INV-{i:05d} dated 03/2024 total {i * 1000:,}." for i in range(5000))
+    start = time.perf_counter()
+    entities = extract_entities(text)
+    assert time.perf_counter() - start < 2
+    assert len(entities) == 3 * 5000 - 1  # An ID, a date and a total per invoice; the first total is 0
+    assert {"id:inv-04999", "date:2024-03", "number:4999000"} <= {key for key, _, _ in entities}
+
+
+if __name__ == "__main__":
+    print("🚀 Entity Index Test")
+    print("=" * 50)
+    for test in [test_entities_are_normalised, test_ordinary_words_are_not_entities,
+                 test_entity_search_survives_deletes_merge_and_reload,
+                 test_retriever_matches_dates_in_any_format, test_extraction_is_linear_in_the_entities]:
+        test()
+        print(f"✅ {test.__name__}")
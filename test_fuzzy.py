@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Test script for typo- and OCR-tolerant matching
+"""
+
+import tempfile
+from fuzzy import canonical, edit_distance
+from retriever import SimpleRetriever
+from segment_index import SegmentedIndex
+
+DOCUMENTS = [
+    {"file_name": "scan.txt", "content": "Quarterly rnanagement report. Approval of the budget by the board."},
+    {"file_name": "typed.txt", "content": "Holiday calendar for the office and the canteen menu."},
+]
+
+
+def test_variants_cover_ocr_errors_typos_and_hyphenation():
+    """Query terms expand to OCR confusions, typos and split words of the vocabulary"""
+    assert canonical("rnodern") == canonical("modern")
+    assert edit_distance("managemnet", "management", 2) == 1
+    assert edit_distance("approval", "holiday", 2) == 3
+
+    index = SegmentedIndex(background_merge=False)
+    index.add_documents([("a", "rnodern manage- ment of the flow chart", "1"), ("b", "aproval 2025", "1")])
+    variants = index.term_variants("modern management approval flowchart 2024")
+    assert variants["modern"] == ["rnodern"]
+    assert variants["management"] == ["manage ment"]
+    assert variants["approval"] == ["aproval"]
+    assert variants["flowchart"] == ["flow chart"]
+    assert "2024" not in variants
+
+    index.add_documents([("c", "managment", "1")])
+    assert index.term_variants("management")["management"] == ["manage ment", "managment"]
+
+
+def test_fuzzy_matching_is_toggled_per_query():
+    """OCR'd documents are only found for a misspelled query with fuzzy matching on"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = SimpleRetriever(DOCUMENTS, cache_dir=cache_dir)
+        assert not retriever.fuzzy
+
+        assert retriever.retrieve_relevant_chunks("management") == []
+        hits = retriever.retrieve_relevant_chunks("management", fuzzy=True)
+        assert [hit['file_name'] for hit in hits] == ["scan.txt"]
+        assert hits[0].matched_text == "rnanagement"
+        assert "**rnanagement**" in hits[0].passages[0].highlighted()
+
+        hits = retriever.retrieve_relevant_chunks("budget aproval", fuzzy=True)
+        assert hits[0]['file_name'] == "scan.txt"
+
+
+if __name__ == "__main__":
+    print("🚀 Fuzzy Matching Test")
+    print("=" * 50)
+    for test in [test_variants_cover_ocr_errors_typos_and_hyphenation, test_fuzzy_matching_is_toggled_per_query]:
+        test()
+        print(f"✅ {test.__name__}")
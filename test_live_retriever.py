@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test script for live index refreshes with snapshot swapping
+"""
+
+import tempfile
+import threading
+from live_retriever import LiveRetriever
+
+OLD_DOCS = [
+    {"file_name": "python.txt", "content": "Python is a programming language used for web development."},
+    {"file_name": "ml.txt", "content": "Machine learning is a subset of artificial intelligence."},
+]
+NEW_DOCS = OLD_DOCS + [{"file_name": "rust.txt", "content": "Rust is a systems programming language."}]
+
+
+def test_queries_are_served_during_a_refresh():
+    """Queries answer from the old snapshot while the new one builds, then from the new one"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        release = threading.Event()
+        loads = [lambda: [dict(doc) for doc in OLD_DOCS]]
+
+        def load_new():
+            release.wait(timeout=10)
+            return [dict(doc) for doc in NEW_DOCS]
+
+        live = LiveRetriever(lambda: loads[-1](), cache_dir=cache_dir)
+        loads.append(load_new)
+
+        assert live.refresh()
+        assert live.refreshing
+        assert not live.refresh()  # Only one refresh at a time
+        assert [hit['file_name'] for hit in live.retrieve_relevant_chunks("Rust systems")] == []
+        assert len(live.documents) == 2
+
+        release.set()
+        live._builder.join()
+        assert [hit['file_name'] for hit in live.retrieve_relevant_chunks("Rust systems")] == ["rust.txt"]
+        assert len(live.documents) == 3 and live.refreshed_at is not None
+        live.close()
+
+
+def test_old_snapshot_closes_after_its_last_query():
+    """A swapped-out retriever is closed only once the queries running against it are done"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        live = LiveRetriever(lambda: [dict(doc) for doc in OLD_DOCS], cache_dir=cache_dir)
+        old = live.retriever
+        closed = []
+        old.close = lambda: closed.append(old)
+
+        in_flight = live._acquire()
+        live.refresh(wait=True)
+        assert live.retriever is not old
+        assert closed == []
+
+        live._release(in_flight)
+        assert closed == [old]
+        live.close()
+
+
+def test_failed_refresh_keeps_serving():
+    """A refresh that fails leaves the current snapshot in place and reports the error"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        calls = []
+
+        def load():
+            calls.append(1)
+            if len(calls) > 1:
+                raise OSError("data folder unavailable")
+            return [dict(doc) for doc in OLD_DOCS]
+
+        live = LiveRetriever(load, cache_dir=cache_dir)
+        live.refresh(wait=True)
+
+        assert live.error == "data folder unavailable"
+        assert [hit['file_name'] for hit in live.retrieve_relevant_chunks("machine learning")] == ["ml.txt"]
+        live.close()
+
+
+if __name__ == "__main__":
+    print("🚀 Live Retriever Test")
+    print("=" * 50)
+    for test in [test_queries_are_served_during_a_refresh, test_old_snapshot_closes_after_its_last_query,
+                 test_failed_refresh_keeps_serving]:
+        test()
+        print(f"✅ {test.__name__}")
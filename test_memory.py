@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Test script for memory usage reporting, compact index arrays and the memory budget
+"""
+
+import tempfile
+import numpy as np
+from retriever import SimpleRetriever
+
+DOCUMENTS = [
+    {"file_name": f"doc{i}.txt", "file_path": f"data/doc{i}.txt",
+     "content": f"Policy {i} covers annual leave, travel bookings and expense claims for team {i}."}
+    for i in range(20)
+]
+
+
+def test_memory_usage_by_part():
+    """Every part of the documents and index is reported, the same for a built and a loaded index"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        built = SimpleRetriever([dict(doc) for doc in DOCUMENTS], cache_dir=cache_dir)
+        built.index.wait_for_merges()
+        usage = built.memory_usage()
+        assert set(usage) == {'text', 'documents', 'vocabulary', 'postings', 'vectors', 'tokens', 'entities', 'keys'}
+        assert all(usage[part] > 0 for part in ('text', 'documents', 'vocabulary', 'postings', 'vectors', 'tokens'))
+
+        loaded = SimpleRetriever([dict(doc) for doc in DOCUMENTS], cache_dir=cache_dir)
+        for part in ('postings', 'vectors', 'tokens'):
+            assert loaded.memory_usage()[part] == usage[part]
+
+
+def test_index_arrays_are_32_bit():
+    """Weights are float32 and indices and offsets int32"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = SimpleRetriever([dict(doc) for doc in DOCUMENTS], cache_dir=cache_dir)
+        for segment in retriever.index.segments:
+            for matrix in (segment.forward, segment.postings):
+                assert matrix.data.dtype == np.float32
+                assert matrix.indices.dtype == np.int32 and matrix.indptr.dtype == np.int32
+            assert segment.position_indptr.dtype == np.int32 and segment.tokens.indptr.dtype == np.int32
+
+
+def test_memory_budget_refuses_to_load():
+    """A retriever over its memory budget raises MemoryError with the breakdown; within it, it loads"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        try:
+            SimpleRetriever([dict(doc) for doc in DOCUMENTS], cache_dir=cache_dir, memory_budget=0.001)
+            assert False, "expected MemoryError"
+        except MemoryError as e:
+            assert "text" in str(e) and "memory budget of 0.001 MB" in str(e)
+
+        retriever = SimpleRetriever([dict(doc) for doc in DOCUMENTS], cache_dir=cache_dir, memory_budget=64)
+        assert retriever.retrieve_relevant_chunks("expense claims")
+
+
+if __name__ == "__main__":
+    print("🚀 Memory Test")
+    print("=" * 50)
+    for test in [test_memory_usage_by_part, test_index_arrays_are_32_bit, test_memory_budget_refuses_to_load]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Test script for metadata filters and retrieval rules
+"""
+
+import tempfile
+from metadata import MetadataIndex
+from retriever import SimpleRetriever
+from rules import RuleSet
+
+DOCUMENTS = [
+    {"file_name": "SVB Process Flow.pdf", "file_path": "data/processes/SVB Process Flow.pdf", "file_type": ".pdf",
+     "content": "Steps: submit, review, approve."},
+    {"file_name": "leave_policy.docx", "file_path": "data/hr/leave_policy.docx", "file_type": ".docx",
+     "content": "Leave policy: employees get twenty days of leave.", "tags": "hr, policy"},
+    {"file_name": "leave_faq.txt", "file_path": "data/hr/faq/leave_faq.txt", "file_type": ".txt",
+     "content": "Questions about leave and holidays."},
+    {"file_name": "services.txt", "file_path": "data/services.txt", "file_type": ".txt",
+     "content": "Our services: consulting, audits and leave management software."},
+]
+
+
+def test_metadata_bitmaps():
+    """Filters OR values within a field and AND across fields; folders include subfolders"""
+    metadata = MetadataIndex({doc["file_path"]: doc for doc in DOCUMENTS})
+
+    assert metadata.select({"file_type": ["pdf", "docx"]}) == [DOCUMENTS[0]["file_path"], DOCUMENTS[1]["file_path"]]
+    assert metadata.select({"folder": "data/hr"}) == [DOCUMENTS[1]["file_path"], DOCUMENTS[2]["file_path"]]
+    assert metadata.select({"folder": "data/hr", "file_type": "txt"}) == [DOCUMENTS[2]["file_path"]]
+    assert metadata.select({"file_name": "*svb*"}) == [DOCUMENTS[0]["file_path"]]
+    assert metadata.select({"tag": "policy"}) == [DOCUMENTS[1]["file_path"]]
+    assert metadata.values("file_type") == ["docx", "pdf", "txt"]
+
+
+def test_filters_apply_before_ranking():
+    """A filtered search only returns documents passing the filter"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = SimpleRetriever(DOCUMENTS, cache_dir=cache_dir, rules=RuleSet([]))
+
+        assert len(retriever.retrieve_relevant_chunks("leave", top_k=5)) == 3
+        hits = retriever.retrieve_relevant_chunks("leave", top_k=5, filters={"folder": "data/hr"})
+        assert {hit['file_name'] for hit in hits} == {"leave_policy.docx", "leave_faq.txt"}
+        assert retriever.retrieve_relevant_chunks("leave", filters={"file_type": "pdf"}) == []
+
+
+def test_rules_pin_boost_and_widen():
+    """The default rules pin the SVB chart and widen broad questions; boosts reorder results"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = SimpleRetriever(DOCUMENTS, cache_dir=cache_dir)
+
+        hits = retriever.retrieve_relevant_chunks("who approves leave in the svb process?", top_k=1)
+        assert hits[0]['file_name'] == "SVB Process Flow.pdf"
+        assert hits[0].match_type == 'pinned'
+
+        assert len(retriever.retrieve_relevant_chunks("leave services", top_k=1)) == 3
+        assert len(retriever.retrieve_relevant_chunks("overall leave score for a small call", top_k=1)) == 1
+
+        rules = RuleSet([{"name": "faq-first", "when": "leave", "boost": {"folder": "data/hr/faq"}, "factor": 10}])
+        retriever.rules = rules
+        hits = retriever.retrieve_relevant_chunks("leave policy", top_k=2)
+        assert hits[0]['file_name'] == "leave_faq.txt"
+
+
+if __name__ == "__main__":
+    print("🚀 Metadata Filters and Rules Test")
+    print("=" * 50)
+    for test in [test_metadata_bitmaps, test_filters_apply_before_ranking, test_rules_pin_boost_and_widen]:
+        test()
+        print(f"✅ {test.__name__}")
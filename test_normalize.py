@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Test script for ingest-time text normalisation
+"""
+
+import os
+import tempfile
+from document_loader import load_documents_from_folder
+from normalize import configured_steps, normalize_text, savings
+
+PAGES = [
+    "ACME Corp  -  Employee Handbook\n\nAnnual leave is twenty days per year, and unused days carry over to\nthe next year.\n\nPage 1 of 3",
+    "ACME Corp  -  Employee Handbook\n\nSick leave needs a doctor's certifi-\ncate after three days.\n\n\n\nPage 2 of 3",
+    "ACME Corp  -  Employee Handbook\n\nTravel   is booked through the portal.\n\nPage 3 of 3",
+]
+
+
+def test_normalization_steps():
+    """Headers and footers, hyphenation, hard wraps and extra whitespace are removed; page markers are kept"""
+    text = "\f".join(PAGES)
+    normalized = normalize_text(text, steps=('headers', 'dehyphenate', 'unwrap', 'whitespace'))
+
+    assert "ACME Corp" not in normalized and "Page 2 of 3" not in normalized
+    assert "certificate after three days" in normalized
+    assert "carry over to the next year" in normalized
+    assert "Travel is booked" in normalized and "\n\n\n" not in normalized
+    assert normalized.count("\f") == 2
+
+    ocr = "\n=== Page 1 ===\n" + "\n=== Page 2 ===\n".join(PAGES[:2])
+    assert "=== Page 2 ===" in normalize_text(ocr, steps=('whitespace',))
+    assert normalize_text(text, steps=()) == text
+
+    chars, tokens = savings(text, normalized)
+    assert chars > 0 and tokens >= 3 * 4  # Four words of header per page at least
+
+
+def test_configuration_and_loader():
+    """TEXT_NORMALIZATION picks the steps, and loaded documents are normalised"""
+    previous = os.environ.get('TEXT_NORMALIZATION')
+    try:
+        os.environ['TEXT_NORMALIZATION'] = "whitespace, dehyphenate"
+        assert configured_steps() == ('dehyphenate', 'whitespace')
+        os.environ['TEXT_NORMALIZATION'] = "none"
+        assert configured_steps() == ()
+        del os.environ['TEXT_NORMALIZATION']
+        assert configured_steps() == ('headers', 'dehyphenate', 'unwrap', 'whitespace')
+
+        with tempfile.TemporaryDirectory() as folder:
+            with open(os.path.join(folder, "handbook.txt"), "w", encoding="utf-8") as f:
+                f.write("\f".join(PAGES))
+            content = load_documents_from_folder(folder)[0]['content']
+            assert "ACME Corp" not in content and "certificate" in content
+    finally:
+        if previous is not None:
+            os.environ['TEXT_NORMALIZATION'] = previous
+
+
+if __name__ == "__main__":
+    print("🚀 Normalize Test")
+    print("=" * 50)
+    for test in [test_normalization_steps, test_configuration_and_loader]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Test script for positional postings, phrase queries and proximity scoring
+"""
+
+import tempfile
+import numpy as np
+from proximity import ordered_window, phrase_window, proximity_score, unordered_window
+from retriever import SimpleRetriever
+from segment_index import SegmentedIndex
+
+
+def test_windows():
+    """Windows are the shortest spans holding every term"""
+    positions = [np.array([0, 7, 20]), np.array([3, 9]), np.array([10])]
+    assert ordered_window(positions) == (7, 10)
+    assert unordered_window([np.array([5]), np.array([1, 4])]) == (4, 5)
+    assert ordered_window([np.array([5]), np.array([1, 4])]) is None
+    assert phrase_window([np.array([2, 8]), np.array([9])]) == (8, 9)
+    assert phrase_window([np.array([2]), np.array([4])]) is None
+    assert phrase_window([np.array([2]), np.array([4])], slop=1) == (2, 4)
+    assert proximity_score([np.array([3]), np.array([4])]) == 1.0
+    assert proximity_score([np.array([4]), np.array([3])]) == 0.5
+    assert proximity_score([np.array([3]), np.array([])]) == 0.0
+
+
+def test_phrase_search_survives_merge_and_reload():
+    """Phrases are found with their character spans, also after merges and saves"""
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = SegmentedIndex(background_merge=False)
+        index.add_documents([("a", "The New York office is open", "1"), ("b", "York is new", "1")])
+        index.add_documents([("c", "New offices in York", "1"), ("d", "state of the art new york", "1")])
+        index.delete_documents(["d"])
+        index.merge()
+        index.save(index_dir)
+
+        loaded = SegmentedIndex.load(index_dir)
+        assert loaded.phrase_search("new york") == {"a": (4, 12)}
+        assert set(loaded.phrase_search("new york", slop=1)) == {"a", "c"}
+        assert loaded.phrase_search("new chicago") == {}
+
+
+def test_retriever_prefers_terms_close_together():
+    """Proximity breaks ties between documents with the same words, and quoted phrases match exactly"""
+    documents = [
+        {"file_name": "scattered.txt", "content": "Chart of accounts. " + "Filler words here. " * 10 + "Flow of funds."},
+        {"file_name": "together.txt", "content": "Funds of accounts. " + "Filler words here. " * 10 + "Flow chart."},
+    ]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = SimpleRetriever(documents, cache_dir=cache_dir)
+
+        hits = retriever.retrieve_relevant_chunks("flow chart process", top_k=2)
+        assert [hit['file_name'] for hit in hits] == ["together.txt", "scattered.txt"]
+        assert hits[0].score > hits[1].score
+
+        hits = retriever.retrieve_relevant_chunks('show the "flow chart"', top_k=2)
+        assert hits[0]['file_name'] == "together.txt"
+        assert hits[0].match_type in ('exact', 'hybrid')
+        assert hits[0].matched_text == "Flow chart"
+
+
+if __name__ == "__main__":
+    print("🚀 Proximity Test")
+    print("=" * 50)
+    for test in [test_windows, test_phrase_search_survives_merge_and_reload, test_retriever_prefers_terms_close_together]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Test script for the query result cache
+"""
+
+import tempfile
+import time
+from query_cache import QueryCache
+from retriever import SimpleRetriever
+
+SAMPLE_DOCS = [
+    {"file_name": "doc1.txt", "content": "Python is a programming language used for web development."},
+    {"file_name": "doc2.txt", "content": "Machine learning is a subset of artificial intelligence."},
+]
+
+
+def test_lru_and_ttl():
+    """Least recently used entries are evicted first and entries expire"""
+    cache = QueryCache(max_entries=2, ttl_seconds=0.2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    time.sleep(0.25)
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_retriever_serves_repeated_queries_from_cache():
+    """Repeated questions hit the cache until the index changes"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = SimpleRetriever([dict(doc) for doc in SAMPLE_DOCS], cache_dir=cache_dir,
+                                    query_cache=QueryCache(max_entries=16, ttl_seconds=600))
+
+        first = retriever.retrieve_relevant_chunks("What is Python?")
+        first.clear()  # Changing a returned list must not change the cached one
+        second = retriever.retrieve_relevant_chunks("  what is PYTHON? ")
+        assert [doc['file_name'] for doc in second] == ["doc1.txt"]
+        assert retriever.query_cache.stats()['hits'] == 1
+
+        retriever.add_documents([{"file_name": "doc3.txt", "content": "Python snakes are not a language."}])
+        third = retriever.retrieve_relevant_chunks("What is Python?")
+        assert {doc['file_name'] for doc in third} == {"doc1.txt", "doc3.txt"}
+        assert retriever.query_cache.stats()['misses'] == 2
+
+
+if __name__ == "__main__":
+    print("🚀 Query Cache Test")
+    print("=" * 50)
+    for test in [test_lru_and_ttl, test_retriever_serves_repeated_queries_from_cache]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Test script for the segment-based incremental index
+"""
+
+import tempfile
+import numpy as np
+from segment_index import SegmentedIndex, TermTable
+from retriever import SimpleRetriever
+
+SAMPLE_DOCS = [
+    {"file_name": "doc1.txt", "content": "Python is a programming language used for web development."},
+    {"file_name": "doc2.txt", "content": "Machine learning is a subset of artificial intelligence."},
+    {"file_name": "doc3.txt", "content": "Web development involves creating websites and web applications."}
+]
+
+
+def test_incremental_add_and_delete():
+    """Adding and deleting documents only touches the affected segments"""
+    index = SegmentedIndex(background_merge=False)
+    index.add_documents([("a", "python web development", "1"), ("b", "machine learning", "1")])
+    index.add_documents([("c", "python snakes", "1")])
+
+    assert len(index.segments) == 2
+    assert set(index.score("python")) == {"a", "c"}
+
+    index.delete_documents(["a"])
+    assert set(index.score("python")) == {"c"}
+    assert index.num_docs == 2
+
+
+def test_changed_document_replaces_old_row():
+    """Re-adding a key tombstones the previous version of the document"""
+    index = SegmentedIndex(background_merge=False)
+    index.sync({"a": ("python web development", "v1"), "b": ("machine learning", "v1")})
+    added, changed, removed = index.sync({"a": ("ruby on rails", "v2"), "b": ("machine learning", "v1")})
+
+    assert (added, changed, removed) == ([], ["a"], [])
+    assert "a" not in index.score("python")
+    assert "a" in index.score("ruby")
+
+
+def test_merge_keeps_results():
+    """Merging segments drops tombstones without changing scores"""
+    index = SegmentedIndex(merge_factor=100, background_merge=False)
+    for i in range(6):
+        index.add_documents([(f"doc{i}", f"shared term unique{i}", "1")])
+    index.delete_documents(["doc2"])
+    before = index.score("shared unique4")
+
+    index.merge()
+
+    assert len(index.segments) == 1
+    assert index.segments[0].num_docs == 5
+    after = index.score("shared unique4")
+    assert before.keys() == after.keys()
+    for key in before:
+        assert abs(before[key] - after[key]) < 1e-9
+
+
+def test_background_merge():
+    """Too many segments trigger a merge on a background thread"""
+    index = SegmentedIndex(merge_factor=3)
+    for i in range(5):
+        index.add_documents([(f"doc{i}", f"term{i} common", "1")])
+    index.wait_for_merges()
+
+    assert len(index.segments) <= 3
+    assert index.num_docs == 5
+    assert set(index.score("common")) == {f"doc{i}" for i in range(5)}
+
+
+def test_retriever_reuses_cached_segments():
+    """A second retriever only indexes the documents that changed"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        SimpleRetriever([dict(doc) for doc in SAMPLE_DOCS], cache_dir=cache_dir)
+
+        docs = [dict(doc) for doc in SAMPLE_DOCS] + [{"file_name": "doc4.txt", "content": "Rust is a systems language."}]
+        retriever = SimpleRetriever(docs, cache_dir=cache_dir)
+
+        assert len(retriever.index.segments) == 2
+        results = retriever.retrieve_relevant_chunks("What is Rust?")
+        assert results and results[0]['file_name'] == "doc4.txt"
+
+
+def test_save_and_load_memory_mapped():
+    """A saved index reopens with memory-mapped arrays and identical scores"""
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = SegmentedIndex(background_merge=False)
+        index.add_documents([("a", "python web development", "1"), ("b", "machine learning", "1")])
+        index.save(index_dir)
+        index.add_documents([("c", "python snakes", "1")])
+        index.delete_documents(["b"])
+        index.save(index_dir)
+
+        loaded = SegmentedIndex.load(index_dir)
+
+        assert loaded.version == index.version
+        assert set(loaded.doc_keys()) == {"a", "c"}
+        assert loaded.score("python web") == index.score("python web")
+        base = loaded.segments[0].postings.data
+        while not isinstance(base, np.memmap) and base.base is not None:
+            base = base.base
+        assert isinstance(base, np.memmap)
+
+
+def test_manifest_diff_names_changed_documents():
+    """Validation compares fingerprints only and reports exactly what changed"""
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = SegmentedIndex(background_merge=False)
+        index.sync({"a.pdf": ("alpha", "v1"), "b.pdf": ("beta", "v1"), "c.pdf": ("gamma", "v1")})
+        index.save(index_dir)
+
+        loaded = SegmentedIndex.load(index_dir)
+        added, changed, removed = loaded.diff({"a.pdf": "v1", "b.pdf": "v2", "d.pdf": "v1"})
+
+        assert (added, changed, removed) == (["d.pdf"], ["b.pdf"], ["c.pdf"])
+        assert loaded.diff(index.fingerprints) == ([], [], [])
+
+
+def test_term_table_lookups():
+    """Terms resolve to the same ids before and after a save"""
+    with tempfile.TemporaryDirectory() as table_dir:
+        table = TermTable()
+        ids = {term: table.add(term) for term in ["alpha", "beta", "gamma", "déjà"]}
+        table.save(table_dir)
+
+        loaded = TermTable.load(table_dir)
+        assert {term: loaded[term] for term in ids} == ids
+        assert loaded.get("missing") is None
+        assert loaded.add("delta") == 4
+        assert loaded.term(3) == "déjà"
+
+
+def test_stream_build_spills_and_resumes():
+    """A streamed build writes bounded segments to disk and skips what an earlier run indexed"""
+    documents = [(f"doc{i}", f"streamed text number{i} " * 20, "1") for i in range(60)]
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = SegmentedIndex(merge_factor=4, background_merge=False, max_segment_bytes=12_000)
+        assert index.add_stream(iter(documents[:50]), directory=index_dir, batch_bytes=2_000) == 50
+
+        assert all(segment.path is not None for segment in index.segments)
+        assert all(segment.nbytes <= 12_000 for segment in index.segments)
+        assert len(index.segments) > 4  # Merges stop at the size cap
+
+        # A second run over the whole stream only indexes the rest
+        resumed = SegmentedIndex.load(index_dir, merge_factor=4, background_merge=False, max_segment_bytes=12_000)
+        assert resumed.add_stream(iter(documents), directory=index_dir, batch_bytes=2_000) == 10
+        assert resumed.num_docs == 60
+        assert set(SegmentedIndex.load(index_dir).score("number7 streamed")) >= {"doc7"}
+
+
+if __name__ == "__main__":
+    print("🚀 Segment Index Test")
+    print("=" * 50)
+    for test in [test_incremental_add_and_delete, test_changed_document_replaces_old_row,
+                 test_merge_keeps_results, test_background_merge, test_retriever_reuses_cached_segments,
+                 test_save_and_load_memory_mapped, test_manifest_diff_names_changed_documents,
+                 test_term_table_lookups, test_stream_build_spills_and_resumes]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Test script for sharded search across worker processes
+"""
+
+import random
+import tempfile
+from retriever import SimpleRetriever
+
+WORDS = [f"word{i}" for i in range(40)]
+
+
+def _documents(count: int, seed: int = 3):
+    rng = random.Random(seed)
+    return [{"file_name": f"doc{i}.txt", "content": " ".join(rng.choices(WORDS, k=rng.randint(3, 20)))}
+            for i in range(count)]
+
+
+def test_sharded_results_match_single_process():
+    """Shards score with global statistics, so the merged top-k equals the in-process one"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = SimpleRetriever(_documents(300), cache_dir=cache_dir, num_shards=3)
+        try:
+            queries = ["word1 word2", "word7", "word30 word31 word5", "nothing here"]
+            assert retriever.shards.top_k(queries, 5, retriever.index.version) == retriever.index.top_k(queries, 5)
+
+            # After a change the workers reload the index at the new version
+            retriever.add_documents([{"file_name": "new.txt", "content": "word7 word7 word7"}])
+            sharded = retriever.shards.top_k(["word7"], 3, retriever.index.version)[0]
+            assert list(sharded) == list(retriever.index.top_k(["word7"], 3)[0])
+            assert "new.txt" in sharded
+        finally:
+            retriever.close()
+
+
+if __name__ == "__main__":
+    print("🚀 Sharded Search Test")
+    print("=" * 50)
+    for test in [test_sharded_results_match_single_process]:
+        test()
+        print(f"✅ {test.__name__}")
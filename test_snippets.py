@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Test script for best-passage snippets
+"""
+
+import tempfile
+from retriever import SimpleRetriever
+from segment_index import SegmentedIndex
+
+LONG_DOC = ("Cover page of the handbook. " + "General filler sentence about nothing. " * 60
+            + "The SVB process flow chart lists every approval step. "
+            + "More unrelated filler material here. " * 60)
+
+
+def test_passages_come_from_the_matching_part():
+    """A hit's passages are where the query terms are, not the start of the document"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = SimpleRetriever([{"file_name": "handbook.txt", "content": LONG_DOC},
+                                     {"file_name": "other.txt", "content": "Nothing about approvals."}],
+                                    cache_dir=cache_dir)
+
+        hit = retriever.retrieve_relevant_chunks("SVB process flow chart")[0]
+
+        assert hit['file_name'] == "handbook.txt"
+        best = hit.passages[0]
+        assert "SVB process flow chart" in best.text
+        assert len(best.text) < 500
+        assert "**SVB** **process** **flow** **chart**" in best.highlighted()
+        assert "SVB process flow chart" in retriever.search_documents("SVB process flow chart")
+
+
+def test_token_streams_survive_merge_and_reload():
+    """Token positions are kept through merges and memory-mapped saves"""
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = SegmentedIndex(background_merge=False)
+        index.add_documents([("a", "alpha beta", "1"), ("b", "gamma delta", "1")])
+        index.add_documents([("c", "Epsilon and alpha", "1")])
+        index.delete_documents(["a"])
+        index.merge()
+        index.save(index_dir)
+
+        loaded = SegmentedIndex.load(index_dir)
+        terms, starts, ends = loaded.document_tokens("c")
+        assert [loaded.vocabulary.term(term) for term in terms.tolist()] == ["epsilon", "alpha"]
+        assert (starts.tolist(), ends.tolist()) == ([0, 12], [7, 17])
+
+
+if __name__ == "__main__":
+    print("🚀 Snippets Test")
+    print("=" * 50)
+    for test in [test_passages_come_from_the_matching_part, test_token_streams_survive_merge_and_reload]:
+        test()
+        print(f"✅ {test.__name__}")
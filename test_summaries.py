@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Test script for two-stage retrieval through document group summaries
+"""
+
+import tempfile
+from retriever import SimpleRetriever
+from summaries import SummaryIndex, document_group
+
+DOCUMENTS = [
+    {"file_name": "leave-1.txt", "parent": "handbook/leave", "content": "Employees get twenty days of annual leave."},
+    {"file_name": "leave-2.txt", "parent": "handbook/leave", "content": "Sick leave needs a doctor's note."},
+    {"file_name": "travel-1.txt", "parent": "handbook/travel", "content": "Travel bookings go through the portal."},
+    {"file_name": "travel-2.txt", "parent": "handbook/travel", "content": "Hotel costs are refunded up to a limit."},
+    {"file_name": "menu.txt", "file_path": "data/canteen/menu.txt", "content": "The canteen serves lunch daily."},
+]
+
+
+def test_groups_and_routing():
+    """Documents are grouped by parent or folder, and queries route to the matching group"""
+    assert document_group(DOCUMENTS[0]) == "handbook/leave"
+    assert document_group(DOCUMENTS[4]) == "data/canteen"
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = SimpleRetriever([dict(doc) for doc in DOCUMENTS], cache_dir=cache_dir)
+        summaries = SummaryIndex(retriever.index, {key: document_group(doc)
+                                                  for key, doc in retriever._documents_by_key.items()})
+        assert len(summaries) == 3
+
+        groups = summaries.route(retriever.index, ["hotel refunds and travel"], 1)
+        assert [summaries.groups[group] for group in groups] == ["handbook/travel"]
+        assert sorted(summaries.members(groups)) == ["travel-1.txt", "travel-2.txt"]
+        assert len(summaries.route(retriever.index, ["nothing matches this"], 2)) == 0
+
+
+def test_routed_retrieval_only_scores_routed_groups():
+    """With routing, results come from the routed groups; routing to every group changes nothing"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        retriever = SimpleRetriever([dict(doc) for doc in DOCUMENTS], cache_dir=cache_dir, routing=1)
+        hits = retriever.retrieve_relevant_chunks("how many days of leave do employees get?", top_k=5)
+        assert hits and {hit['file_name'] for hit in hits} <= {"leave-1.txt", "leave-2.txt"}
+        assert hits[0]['file_name'] == "leave-1.txt"
+
+        everything = SimpleRetriever([dict(doc) for doc in DOCUMENTS], cache_dir=cache_dir, routing=3)
+        unrouted = SimpleRetriever([dict(doc) for doc in DOCUMENTS], cache_dir=cache_dir, routing=0)
+        for query in ["leave days", "hotel limit", "lunch"]:
+            assert ([hit['file_name'] for hit in everything.retrieve_relevant_chunks(query)]
+                    == [hit['file_name'] for hit in unrouted.retrieve_relevant_chunks(query)])
+
+
+if __name__ == "__main__":
+    print("🚀 Two-Stage Retrieval Test")
+    print("=" * 50)
+    for test in [test_groups_and_routing, test_routed_retrieval_only_scores_routed_groups]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test script for top-k selection
+"""
+
+import random
+import numpy as np
+from segment_index import SegmentedIndex
+
+WORDS = [f"word{i}" for i in range(60)]
+
+
+def assert_same_ranking(top, scores, k):
+    """top holds k best documents of scores; equal-within-rounding scores may swap places"""
+    expected = sorted(scores.values(), reverse=True)[:k]
+    assert len(top) == len(expected)
+    for key, score, best in zip(top, top.values(), expected):
+        assert abs(score - scores[key]) < 1e-6
+        assert abs(score - best) < 1e-6
+
+
+def build_index(seed: int = 7) -> SegmentedIndex:
+    rng = random.Random(seed)
+    index = SegmentedIndex(merge_factor=100, background_merge=False)
+    for batch in range(4):
+        index.add_documents([
+            (f"doc{batch}-{i}", " ".join(rng.choices(WORDS[:rng.randint(5, 60)], k=rng.randint(3, 25))), "1")
+            for i in range(150)
+        ])
+    index.delete_documents([f"doc1-{i}" for i in range(0, 150, 3)])
+    return index
+
+
+def test_top_k_matches_full_ranking():
+    """top_k returns the head of the full ranking"""
+    index = build_index()
+    queries = ["word1 word7", "word3", "word59 word2 word40", "unknown"]
+    full = index.score_many(queries)
+
+    for scores, top in zip(full, index.top_k(queries, 10, early_termination=False, block_size=64)):
+        assert_same_ranking(top, scores, 10)
+
+
+def test_max_score_is_rank_safe():
+    """Early termination returns the same top k as scoring everything"""
+    index = build_index(seed=11)
+    queries = [" ".join(random.Random(i).choices(WORDS, k=random.Random(i).randint(1, 6))) for i in range(40)]
+
+    full = index.score_many(queries)
+
+    for k in (1, 3, 10, 50):
+        for scores, top in zip(full, index.top_k(queries, k, early_termination=True, block_size=50)):
+            assert_same_ranking(top, scores, k)
+
+
+def test_masked_rows_match_filtered_ranking():
+    """A row mask, sparse or dense, gives the head of the ranking of the allowed rows"""
+    index = build_index(seed=5)
+    queries = ["word1 word7", "word3 word4 word5", "word2"]
+    full = index.score_many(queries)
+
+    for every in (2, 40):  # Dense masks walk the postings, sparse ones score the allowed rows directly
+        allowed = {key for key in index.doc_keys() if int(key.split("-")[1]) % every == 0}
+        row_filter = lambda segment: np.array([key in allowed for key in segment.doc_keys])
+        for scores, top in zip(full, index.top_k(queries, 5, row_filter=row_filter)):
+            assert set(top) <= allowed
+            assert_same_ranking(top, {key: score for key, score in scores.items() if key in allowed}, 5)
+
+
+if __name__ == "__main__":
+    print("🚀 Top-k Test")
+    print("=" * 50)
+    for test in [test_top_k_matches_full_ranking, test_max_score_is_rank_safe, test_masked_rows_match_filtered_ranking]:
+        test()
+        print(f"✅ {test.__name__}")